@@ -0,0 +1,57 @@
+"""Micro-benchmark do modelo de gravidade: iterrows (antigo) x vetorizado.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.modelo_risco
+
+Compara a vazão (linhas/s) da fórmula por linha que existia em
+calcular_pontos_risco_reais com risco_acidentes sobre a tabela inteira.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from sir.cache import carregar_datatran_cache
+from sir.risco import risco_acidentes
+
+
+def risco_iterrows(df):
+    """Fórmula original, linha a linha, como era feita em calcular_pontos_risco_reais"""
+    riscos = []
+    for _, acidente in df.iterrows():
+        risco = 0.3  # Base
+        if 'mortos' in acidente and pd.notna(acidente['mortos']) and acidente['mortos'] > 0:
+            risco += 0.4
+        if 'feridos_graves' in acidente and pd.notna(acidente['feridos_graves']) and acidente['feridos_graves'] > 0:
+            risco += 0.2
+        if 'condicao_metereologica' in acidente and pd.notna(acidente['condicao_metereologica']):
+            if 'chuva' in str(acidente['condicao_metereologica']).lower():
+                risco += 0.1
+        riscos.append(min(risco, 1.0))
+    return np.array(riscos)
+
+
+def vazao(funcao, df, repeticoes=3):
+    """Melhor vazão (linhas/s) entre algumas execuções"""
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao(df)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return len(df) / melhor, resultado
+
+
+def main():
+    df, _ = carregar_datatran_cache('datatran2025.zip')
+    print(f"Acidentes: {len(df):,}")
+
+    vazao_antiga, antigo = vazao(risco_iterrows, df, repeticoes=1)
+    vazao_nova, novo = vazao(risco_acidentes, df, repeticoes=20)
+
+    assert np.allclose(antigo, novo, atol=1e-6), "modelos divergem"
+    print(f"iterrows:    {vazao_antiga:>14,.0f} linhas/s")
+    print(f"vetorizado:  {vazao_nova:>14,.0f} linhas/s ({vazao_nova / vazao_antiga:,.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark do motor de risco da rota personalizada (polilinha x acidentes).
+
+Uso (na raiz do projeto):
+    python -m benchmarks.rota_personalizada
+
+Monta uma polilinha São Paulo–Rio de 5.000 vértices pela Dutra e uma tabela de
+~100 mil acidentes (o datatran2025.zip replicado com ruído) e mede o tempo de
+pontos_risco_rota com e sem o índice espacial.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from sir.cache import carregar_datatran_cache
+from sir.espacial import IndiceEspacial, densificar, haversine_km
+from sir.risco import pontos_risco_rota
+
+# Pontos de passagem aproximados da Via Dutra (BR-116) entre SP e RJ
+DUTRA = [
+    (-23.5505, -46.6333), (-23.4536, -46.5228), (-23.3055, -45.9663), (-23.1896, -45.8841),
+    (-23.0264, -45.5558), (-22.8089, -45.1931), (-22.5320, -44.7736), (-22.4689, -44.4469),
+    (-22.5231, -44.1042), (-22.7039, -43.6828), (-22.9068, -43.1729)
+]
+
+
+def polilinha_dutra(vertices=5000, semente=42):
+    """Polilinha SP-RJ com o número pedido de vértices e leve zigue-zague de estrada"""
+    rota = densificar(DUTRA, 0.05)
+    rota = rota[np.linspace(0, len(rota) - 1, vertices).astype(int)]
+    ruido = np.random.default_rng(semente).normal(0, 0.0005, rota.shape)
+    ruido[[0, -1]] = 0
+    return rota + ruido
+
+
+def tabela_ampliada(df, copias=3, semente=42):
+    """Replica a tabela com ruído (~1 km) nas coordenadas para simular ~100k acidentes"""
+    rng = np.random.default_rng(semente)
+    partes = [df]
+    for _ in range(copias - 1):
+        copia = df.copy()
+        copia['latitude'] = copia['latitude'] + rng.normal(0, 0.01, len(copia))
+        copia['longitude'] = copia['longitude'] + rng.normal(0, 0.01, len(copia))
+        partes.append(copia)
+    return pd.concat(partes, ignore_index=True)
+
+
+def medir(funcao, repeticoes=5):
+    """Melhor tempo (s) entre algumas execuções"""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos), resultado
+
+
+def main():
+    df, _ = carregar_datatran_cache('datatran2025.zip')
+    df = tabela_ampliada(df)
+    rota = polilinha_dutra()
+    comprimento = haversine_km(rota[:-1, 0], rota[:-1, 1], rota[1:, 0], rota[1:, 1]).sum()
+    print(f"Acidentes: {len(df):,} • Rota: {len(rota):,} vértices, {comprimento:.0f} km")
+
+    tempo_indice, indice = medir(lambda: IndiceEspacial(df), repeticoes=1)
+    print(f"Construção do índice espacial: {tempo_indice * 1000:.0f} ms (uma vez por dataset)")
+
+    tempo, pontos = medir(lambda: pontos_risco_rota(df, rota, indice))
+    print(f"pontos_risco_rota com índice: {tempo * 1000:.0f} ms • {len(pontos)} trechos de risco")
+
+    # Sem o índice espacial: todos os acidentes passam pelo filtro de distância
+    tempo_sem_indice, _ = medir(lambda: pontos_risco_rota(df, rota), repeticoes=1)
+    print(f"pontos_risco_rota sem índice: {tempo_sem_indice * 1000:.0f} ms")
+
+    for ponto in pontos[:5]:
+        print(f"  {ponto['nome']:<22} risco {ponto['risco']:.2f} • {ponto['detalhes']['acidentes']} acidentes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""SIR - Sistema Inteligente de Rotas: núcleo de dados e análise de risco"""
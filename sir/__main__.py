@@ -0,0 +1,5 @@
+import sys
+
+from sir.cli import main
+
+sys.exit(main())
@@ -0,0 +1,191 @@
+"""Tabela materializada de risco por trecho de BR (km) e por município"""
+import numpy as np
+import pandas as pd
+
+from sir.risco import coluna_risco, mascara_chuva, mais_frequente, risco_agrupado
+
+# Tamanho (km) de cada trecho de BR agregado
+TAMANHO_SEGMENTO_KM = 10
+
+COLUNAS_DOMINANTES = ('tipo_acidente', 'causa_acidente', 'municipio')
+
+
+def base_acidentes(df):
+    """Colunas que alimentam as agregações, já como arrays (uma linha por acidente)"""
+    def coluna(nome, padrao=0):
+        return df[nome].to_numpy() if nome in df else np.full(len(df), padrao)
+
+    km = df['km'].to_numpy(dtype=np.float64, na_value=np.nan) if 'km' in df else np.full(len(df), np.nan)
+    return pd.DataFrame({
+        'br': df['br'].to_numpy(dtype=np.float64, na_value=np.nan) if 'br' in df else np.full(len(df), np.nan),
+        'km': km,
+        'km_inicio': np.floor(km / TAMANHO_SEGMENTO_KM) * TAMANHO_SEGMENTO_KM,
+        'risco': coluna_risco(df),
+        'chuva': mascara_chuva(df),
+        'mortos': coluna('mortos'),
+        'feridos': coluna('feridos'),
+        'feridos_graves': coluna('feridos_graves'),
+        'lat': df['latitude'].to_numpy(dtype=np.float64, na_value=np.nan),
+        'lon': df['longitude'].to_numpy(dtype=np.float64, na_value=np.nan),
+        'uf': coluna('uf', 'N/A'),
+        **{nome: coluna(nome, 'N/A') for nome in COLUNAS_DOMINANTES},
+    })
+
+
+def agregar_acidentes(base, chaves, dominantes):
+    """Agrupa a base por chaves com contagens, proporção de chuva e risco ponderado"""
+    grupos = base.groupby(chaves, observed=True, sort=True)
+    tabela = grupos.agg(
+        acidentes=('risco', 'size'), mortos=('mortos', 'sum'),
+        feridos=('feridos', 'sum'), feridos_graves=('feridos_graves', 'sum'),
+        proporcao_chuva=('chuva', 'mean'), risco_medio=('risco', 'mean'),
+        lat=('lat', 'mean'), lon=('lon', 'mean'),
+    )
+    tabela['risco'] = risco_agrupado(tabela['risco_medio'], tabela['acidentes'])
+
+    # ngroup numera os grupos na mesma ordem (ordenada) da tabela agregada;
+    # a moda é tirada sobre os códigos das categorias, não sobre strings
+    numero_grupo = grupos.ngroup().to_numpy()
+    for nome in dominantes:
+        categorias = pd.Categorical(base[nome])
+        codigo = mais_frequente(numero_grupo, categorias.codes).reindex(range(len(tabela))).to_numpy()
+        nomes = np.append(categorias.categories.astype(str).to_numpy(), 'N/A')
+        tabela[nome] = nomes[np.where(codigo >= 0, codigo, -1)]
+    return tabela
+
+
+class AgregadosRisco:
+    """Risco pré-agregado por (br, uf, km_inicio) e por (uf, municipio).
+
+    A quilometragem das BRs recomeça em cada estado, por isso o trecho leva
+    a UF na chave. Construído uma vez por versão do dataset; as consultas são
+    buscas no índice das tabelas, sem varrer os acidentes, e sempre na mesma ordem.
+    Com acidentes novos (com_acrescimo) só os grupos tocados são recalculados.
+    """
+
+    def __init__(self, df):
+        base = base_acidentes(df)
+        self.br = base['br'].to_numpy()
+        self.uf = base['uf'].to_numpy()
+        self.km_inicio = base['km_inicio'].to_numpy()
+        self.municipios = base['municipio'].to_numpy()
+
+        self.por_segmento = _agregar_segmentos(base)
+        self.por_municipio = _agregar_municipios(base)
+
+        # Trechos de cada BR já ordenados por risco: consulta vira busca em dicionário
+        self._segmentos_por_br = {
+            int(br): _ordenar(grupo) for br, grupo in self.por_segmento.groupby(level='br', sort=False)
+        }
+
+    def com_acrescimo(self, df, inicio):
+        """Agregados de df, que é a tabela destes agregados com linhas novas a partir de inicio.
+
+        Só os trechos e municípios que receberam acidentes são reagregados,
+        com todas as suas linhas; os demais grupos são reaproveitados.
+        """
+        novas = base_acidentes(df.iloc[inicio:])
+        novo = object.__new__(AgregadosRisco)
+        novo.br = np.concatenate((self.br, novas['br'].to_numpy()))
+        novo.uf = np.concatenate((self.uf, novas['uf'].to_numpy()))
+        novo.km_inicio = np.concatenate((self.km_inicio, novas['km_inicio'].to_numpy()))
+        novo.municipios = np.concatenate((self.municipios, novas['municipio'].to_numpy()))
+
+        # Trechos tocados: reagrega as linhas (antigas e novas) de cada um
+        com_trecho = novas.dropna(subset=['br', 'km_inicio'])
+        tocados = pd.MultiIndex.from_arrays([
+            com_trecho['br'].astype('int64'), com_trecho['uf'].astype(object), com_trecho['km_inicio']
+        ]).unique()
+        validos = np.isfinite(novo.br) & np.isfinite(novo.km_inicio)
+        chaves = pd.MultiIndex.from_arrays([
+            np.where(validos, novo.br, -1).astype(np.int64), novo.uf.astype(object), novo.km_inicio
+        ])
+        linhas = np.flatnonzero(validos & chaves.isin(tocados))
+        recalculados = _agregar_segmentos(base_acidentes(df.iloc[linhas]))
+        novo.por_segmento = pd.concat(
+            (self.por_segmento[~self.por_segmento.index.isin(tocados)], recalculados)
+        ).sort_index()
+
+        # Municípios tocados
+        tocados_municipio = pd.MultiIndex.from_arrays([novas['uf'].astype(object), novas['municipio'].astype(object)]).unique()
+        chaves = pd.MultiIndex.from_arrays([novo.uf.astype(object), novo.municipios.astype(object)])
+        linhas = np.flatnonzero(chaves.isin(tocados_municipio))
+        recalculados = _agregar_municipios(base_acidentes(df.iloc[linhas]))
+        novo.por_municipio = pd.concat(
+            (self.por_municipio[~self.por_municipio.index.isin(tocados_municipio)], recalculados)
+        ).sort_index()
+
+        novo._segmentos_por_br = dict(self._segmentos_por_br)
+        brs = novo.por_segmento.index.get_level_values('br')
+        reordenar = novo.por_segmento[brs.isin(tocados.get_level_values(0))]
+        novo._segmentos_por_br.update(
+            {int(br): _ordenar(grupo) for br, grupo in reordenar.groupby(level='br', sort=False)}
+        )
+        return novo
+
+    def segmentos_br(self, br):
+        """Trechos de uma BR, do mais para o menos arriscado"""
+        return self._segmentos_por_br.get(int(br), self.por_segmento.iloc[:0])
+
+    def segmentos_das_linhas(self, linhas):
+        """Trechos (br, uf, km_inicio) que contêm os acidentes dessas posições da tabela"""
+        br, km_inicio = self.br[linhas], self.km_inicio[linhas]
+        validos = np.isfinite(br) & np.isfinite(km_inicio)
+        chaves = pd.MultiIndex.from_arrays([
+            br[validos].astype(np.int64), np.asarray(self.uf[linhas][validos], dtype=object), km_inicio[validos]
+        ]).unique()
+        return _ordenar(self.por_segmento[self.por_segmento.index.isin(chaves)])
+
+    def segmento(self, br, uf, km):
+        """Estatísticas do trecho que contém (br, uf, km); None se não houver acidentes"""
+        chave = (int(br), str(uf), np.floor(float(km) / TAMANHO_SEGMENTO_KM) * TAMANHO_SEGMENTO_KM)
+        if chave not in self.por_segmento.index:
+            return None
+        return self.por_segmento.loc[chave].to_dict()
+
+    def municipio(self, uf, municipio):
+        """Estatísticas de um município; None se não houver acidentes"""
+        chave = (str(uf), str(municipio))
+        if chave not in self.por_municipio.index:
+            return None
+        return self.por_municipio.loc[chave].to_dict()
+
+
+def _agregar_segmentos(base):
+    com_trecho = base.dropna(subset=['br', 'km_inicio']).astype({'br': 'int64'})
+    return agregar_acidentes(com_trecho, ['br', 'uf', 'km_inicio'], COLUNAS_DOMINANTES)
+
+
+def _agregar_municipios(base):
+    return agregar_acidentes(base, ['uf', 'municipio'], ('tipo_acidente', 'causa_acidente'))
+
+
+def _ordenar(segmentos):
+    """Ordem determinística: risco, depois nº de acidentes, depois posição na BR"""
+    return segmentos.sort_values(['risco', 'acidentes'], ascending=False, kind='stable')
+
+
+def pontos_segmentos(segmentos, limite=None):
+    """Converte trechos agregados em pontos de risco (formato de calcular_pontos_risco_reais)"""
+    segmentos = segmentos.dropna(subset=['lat', 'lon']).head(limite)
+    pontos = []
+    for (br, uf, km_inicio), linha in zip(segmentos.index, segmentos.itertuples(index=False)):
+        pontos.append({
+            "nome": f"BR-{br}/{uf} KM {km_inicio:.0f}-{km_inicio + TAMANHO_SEGMENTO_KM:.0f}",
+            "coords": (float(linha.lat), float(linha.lon)),
+            "risco": float(linha.risco),
+            "detalhes": {
+                "br": int(br),
+                "km": float(km_inicio),
+                "uf": str(uf),
+                "municipio": str(linha.municipio)[:50],
+                "tipo_acidente": str(linha.tipo_acidente)[:50],
+                "causa_acidente": str(linha.causa_acidente)[:50],
+                "acidentes": int(linha.acidentes),
+                "mortos": int(linha.mortos),
+                "feridos": int(linha.feridos),
+                "feridos_graves": int(linha.feridos_graves),
+                "proporcao_chuva": float(linha.proporcao_chuva)
+            }
+        })
+    return pontos
@@ -0,0 +1,400 @@
+"""API HTTP/JSON de risco, com o DataTran e seus índices carregados uma vez em memória.
+
+Uso (na raiz do projeto):
+    python -m sir serve --porta 8080
+    python -m sir serve --observar 300   # publica sozinho o DataTran do mês novo
+
+Endpoints:
+    GET  /score-route?from=...&to=...[&clima=0][&partida=2025-06-13T22:00|agora]
+                                                  (ou POST com JSON {"from": ..., "to": ...})
+    GET  /segment-risk?br=116&uf=SP&km=200-250[&hora=22][&dia=sexta][&clima=chuva]
+    GET  /hotspots?bbox=lat_min,lon_min,lat_max,lon_max[&limit=100]
+    GET  /explain?point=lat,lon
+    GET  /metrics   latência p50/p99 e contagens por endpoint
+    GET  /health
+
+O servidor é asyncio puro (sem dependências novas): as conexões ficam no
+laço de eventos e cada requisição roda num pool de threads, então chamadas
+lentas de rede (geocodificação, roteamento, clima) não bloqueiam as demais.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from sir.agregados import pontos_segmentos
+from sir.atualizacao import VersaoDataset
+from sir.espacial import haversine_km
+from sir.explicacao import analisar_risco
+from sir.hotspots import pontos_hotspots
+from sir.ingestao import ler_armazem, versao_armazem
+from sir.pontuacao import (ARQUIVO_DATATRAN, RAIO_CORREDOR_LINHA_RETA_KM, Pontuador, ler_coordenadas,
+                           ler_partida, pontos_risco_corredor)
+from sir.risco import RAIO_CORREDOR_KM
+
+# Requisições processadas ao mesmo tempo (as demais esperam na fila do pool)
+TRABALHADORES_API = 8
+
+# Latências guardadas por endpoint para os percentis
+AMOSTRAS_LATENCIA = 10_000
+
+# Raio (km) em volta do ponto consultado em /explain
+RAIO_EXPLICACAO_KM = 1.0
+
+LIMITE_HOTSPOTS_PADRAO = 100
+LIMITE_HOTSPOTS_MAXIMO = 1000
+HOTSPOTS_POR_ROTA = 20
+
+# Maior corpo aceito (bytes); acima disso a requisição recebe 413 e a conexão é fechada
+TAMANHO_MAXIMO_CORPO = 1 << 20
+
+# Máximo de linhas de cabeçalho; acima disso (ou com uma linha além do limite do leitor, 64 KiB), 431
+MAXIMO_CABECALHOS = 100
+
+
+class ModeloRisco:
+    """Tabela DataTran, índice espacial, agregados, hotspots e cubo de uma versão do dataset (VersaoDataset)"""
+
+    def __init__(self, dados, servico_clima=None):
+        self.dados = dados
+        self.df = dados.df
+        self.versao = dados.versao
+        self.agregados = dados.agregados
+        self.hotspots = dados.hotspots
+        self.pontuador = Pontuador(dados.df, dados.indice, servico_clima, dados.cubo)
+
+    @classmethod
+    def carregar(cls, origem=ARQUIVO_DATATRAN):
+        """Modelo do zip do DataTran (ou do cache) ou da pasta do armazém"""
+        if origem is None or not os.path.exists(origem):
+            raise FileNotFoundError(f"DataTran não encontrado: {origem}")
+        if os.path.isdir(origem):
+            return cls(VersaoDataset.completa(ler_armazem(origem)))
+        dados = VersaoDataset.carregar(origem)
+        if dados is None:
+            raise FileNotFoundError(f"DataTran ilegível: {origem}")
+        return cls(dados)
+
+    def atualizado(self, origem):
+        """Modelo da versão atual da origem; este mesmo se ela não mudou.
+
+        Zip que só acrescenta acidentes é incorporado incrementalmente; o
+        armazém (pasta) é relido inteiro quando o manifesto muda.
+        """
+        if os.path.isdir(origem):
+            if versao_armazem(origem) == self.versao:
+                return self
+            return ModeloRisco(VersaoDataset.completa(ler_armazem(origem)), self.pontuador.servico_clima)
+        dados = self.dados.atualizada(origem)
+        if dados is None or dados is self.dados:
+            return self
+        return ModeloRisco(dados, self.pontuador.servico_clima)
+
+    def pontuar_rota(self, origem, destino, clima=True, partida=None):
+        """Resumo de risco da rota (condicionado, com partida) e os hotspots no seu corredor"""
+        rota = self.pontuador.rota(origem, destino)
+        resultado = self.pontuador.pontuar_rota(rota, clima, partida=partida)
+        coordenadas = rota['coordenadas_rota']
+        raio_km = RAIO_CORREDOR_KM if len(coordenadas) > 2 else RAIO_CORREDOR_LINHA_RETA_KM
+        resultado['hotspots'] = pontos_risco_corredor(
+            self.df, coordenadas, indice=self.pontuador.indice, raio_km=raio_km, agregados=self.agregados,
+            hotspots=self.hotspots, limite_hotspots=HOTSPOTS_POR_ROTA
+        )[:HOTSPOTS_POR_ROTA]
+        return resultado
+
+    def risco_trecho(self, br, uf=None, km_inicio=None, km_fim=None, hora=None, dia=None, clima=None):
+        """Risco de um trecho de BR numa condição (hora, dia da semana, clima), do cubo pré-calculado"""
+        return self.pontuador.cubo.consultar(br, uf, km_inicio, km_fim, hora, dia, clima)
+
+    def hotspots_na_caixa(self, lat_min, lon_min, lat_max, lon_max, limite=LIMITE_HOTSPOTS_PADRAO):
+        """Hotspots com centroide na caixa, do mais arriscado ao menos"""
+        tabela = self.hotspots.na_caixa(lat_min, lon_min, lat_max, lon_max)
+        return {'total': len(tabela), 'hotspots': pontos_hotspots(tabela, limite=limite)}
+
+    def explicar(self, lat, lon):
+        """Explicação do risco no ponto: hotspot mais próximo ou, sem hotspot, o trecho mais arriscado ao redor"""
+        ponto = None
+        proximos = self.hotspots.indice.vizinhos(lat, lon, RAIO_EXPLICACAO_KM)
+        if len(proximos):
+            tabela = self.hotspots.tabela.iloc[proximos]
+            distancia = haversine_km(lat, lon, tabela['lat'].to_numpy(), tabela['lon'].to_numpy())
+            ponto = pontos_hotspots(tabela.iloc[[int(np.argmin(distancia))]])[0]
+        else:
+            linhas = self.pontuador.indice.vizinhos(lat, lon, RAIO_EXPLICACAO_KM)
+            if len(linhas):
+                pontos = pontos_segmentos(self.agregados.segmentos_das_linhas(linhas), limite=1)
+                ponto = pontos[0] if pontos else None
+        if ponto is None:
+            raise LookupError(f"Nenhum acidente registrado a até {RAIO_EXPLICACAO_KM} km do ponto")
+        return {'ponto': ponto, 'explicacao': analisar_risco(ponto, self.agregados)}
+
+
+class MetricasLatencia:
+    """Latências recentes e contagens por endpoint, com p50/p99"""
+
+    def __init__(self, amostras=AMOSTRAS_LATENCIA):
+        self.latencias = {}
+        self.contagens = {}
+        self._amostras = amostras
+        self._trava = threading.Lock()
+
+    def registrar(self, endpoint, latencia_s, status):
+        with self._trava:
+            self.latencias.setdefault(endpoint, deque(maxlen=self._amostras)).append(latencia_s)
+            contagens = self.contagens.setdefault(endpoint, Counter())
+            contagens['requisicoes'] += 1
+            if status >= 400:
+                contagens['erros'] += 1
+
+    def resumo(self):
+        with self._trava:
+            resumo = {}
+            for endpoint, latencias in self.latencias.items():
+                latencias = np.array(latencias) * 1000
+                resumo[endpoint] = {
+                    'requisicoes': self.contagens[endpoint]['requisicoes'],
+                    'erros': self.contagens[endpoint]['erros'],
+                    'p50_ms': float(np.percentile(latencias, 50)),
+                    'p99_ms': float(np.percentile(latencias, 99)),
+                    'max_ms': float(latencias.max()),
+                }
+            return resumo
+
+
+def _parametro(params, nome, obrigatorio=True):
+    valores = params.get(nome)
+    if not valores or not str(valores[0]).strip():
+        if obrigatorio:
+            raise ValueError(f"Parâmetro obrigatório ausente: {nome}")
+        return None
+    return valores[0]
+
+
+def _json_padrao(valor):
+    """Tipos numpy e afins no JSON de resposta"""
+    if hasattr(valor, 'item'):
+        return valor.item()
+    if hasattr(valor, 'tolist'):
+        return valor.tolist()
+    return str(valor)
+
+
+class ServidorAPI:
+    """Servidor HTTP/1.1 (keep-alive) sobre asyncio que despacha para o ModeloRisco"""
+
+    def __init__(self, modelo, host='127.0.0.1', porta=8080, trabalhadores=TRABALHADORES_API):
+        self.modelo = modelo
+        self.host = host
+        self.porta = porta
+        self.metricas = MetricasLatencia()
+        self._pool = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix='sir-api')
+        self._rotas = {
+            '/score-route': self._score_route,
+            '/segment-risk': self._segment_risk,
+            '/hotspots': self._hotspots,
+            '/explain': self._explain,
+            '/metrics': lambda params: self.metricas.resumo(),
+            '/health': self._health,
+        }
+
+    def publicar(self, modelo):
+        """Troca o modelo de uma vez: requisições em andamento terminam com o anterior"""
+        self.modelo = modelo
+
+    def observar(self, origem, intervalo_s, aviso=None):
+        """Thread que confere a origem a cada intervalo_s e publica a versão nova do modelo.
+
+        aviso(modelo, erro) é chamado a cada publicação (erro None) e a cada
+        falha de leitura (modelo None), que mantém o modelo atual.
+        """
+        def laco():
+            while True:
+                time.sleep(intervalo_s)
+                modelo = self.modelo
+                try:
+                    novo = modelo.atualizado(origem)
+                except (OSError, ValueError) as e:
+                    if aviso is not None:
+                        aviso(None, e)
+                    continue
+                if novo is not modelo:
+                    self.publicar(novo)
+                    if aviso is not None:
+                        aviso(novo, None)
+
+        thread = threading.Thread(target=laco, name='sir-observador', daemon=True)
+        thread.start()
+        return thread
+
+    def _health(self, params):
+        modelo = self.modelo
+        return {'status': 'ok', 'versao': modelo.versao, 'acidentes': len(modelo.df)}
+
+    def _score_route(self, params):
+        clima = _parametro(params, 'clima', obrigatorio=False) not in ('0', 'false', 'nao')
+        partida = _parametro(params, 'partida', obrigatorio=False)
+        return self.modelo.pontuar_rota(
+            _parametro(params, 'from'), _parametro(params, 'to'), clima,
+            ler_partida(partida) if partida else None
+        )
+
+    def _segment_risk(self, params):
+        br, km = _parametro(params, 'br'), _parametro(params, 'km', obrigatorio=False)
+        try:
+            br = int(br)
+            km_inicio, km_fim = (float(valor) for valor in km.split('-')) if km else (None, None)
+        except ValueError:
+            raise ValueError("br deve ser um número e km deve ser inicio-fim") from None
+        return self.modelo.risco_trecho(
+            br, _parametro(params, 'uf', obrigatorio=False), km_inicio, km_fim,
+            _parametro(params, 'hora', obrigatorio=False), _parametro(params, 'dia', obrigatorio=False),
+            _parametro(params, 'clima', obrigatorio=False)
+        )
+
+    def _hotspots(self, params):
+        try:
+            lat_min, lon_min, lat_max, lon_max = (float(valor) for valor in _parametro(params, 'bbox').split(','))
+        except ValueError:
+            raise ValueError("bbox deve ser lat_min,lon_min,lat_max,lon_max") from None
+        if lat_min > lat_max or lon_min > lon_max:
+            raise ValueError("bbox com mínimo maior que máximo")
+        limite = int(_parametro(params, 'limit', obrigatorio=False) or LIMITE_HOTSPOTS_PADRAO)
+        return self.modelo.hotspots_na_caixa(lat_min, lon_min, lat_max, lon_max,
+                                             min(max(limite, 1), LIMITE_HOTSPOTS_MAXIMO))
+
+    def _explain(self, params):
+        ponto = ler_coordenadas(_parametro(params, 'point'))
+        if ponto is None:
+            raise ValueError("point deve ser lat,lon")
+        return self.modelo.explicar(*ponto)
+
+    def processar(self, metodo, alvo, corpo):
+        """(status, resposta) de uma requisição; roda numa thread do pool"""
+        partes = urlsplit(alvo)
+        params = parse_qs(partes.query)
+        if metodo == 'POST' and corpo:
+            try:
+                params.update({nome: [valor] for nome, valor in json.loads(corpo).items()})
+            except (ValueError, AttributeError):
+                return HTTPStatus.BAD_REQUEST, {'erro': 'Corpo JSON inválido'}
+
+        manipulador = self._rotas.get(partes.path)
+        if manipulador is None:
+            return HTTPStatus.NOT_FOUND, {'erro': f"Endpoint desconhecido: {partes.path}"}
+        if metodo not in ('GET', 'POST'):
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'erro': f"Método não suportado: {metodo}"}
+        try:
+            return HTTPStatus.OK, manipulador(params)
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {'erro': str(e)}
+        except LookupError as e:
+            return HTTPStatus.NOT_FOUND, {'erro': str(e)}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'erro': f"Erro inesperado: {str(e)[:100]}"}
+
+    async def _responder(self, escritor, status, resposta, manter_conexao):
+        dados = json.dumps(resposta, ensure_ascii=False, default=_json_padrao).encode('utf-8')
+        cabecalho = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(dados)}\r\n"
+            f"Connection: {'keep-alive' if manter_conexao else 'close'}\r\n\r\n"
+        )
+        escritor.write(cabecalho.encode('latin-1') + dados)
+        await escritor.drain()
+
+    @staticmethod
+    async def _ler_cabecalhos(leitor):
+        """Cabeçalhos (nomes em minúsculas) até a linha em branco; None se passarem dos limites"""
+        cabecalhos = {}
+        for _ in range(MAXIMO_CABECALHOS + 1):
+            try:
+                linha = await leitor.readline()
+            except (ValueError, asyncio.LimitOverrunError):
+                return None
+            if linha in (b'\r\n', b'\n', b''):
+                return cabecalhos
+            nome, _, valor = linha.decode('latin-1').partition(':')
+            cabecalhos[nome.strip().lower()] = valor.strip()
+        return None
+
+    async def _atender(self, leitor, escritor):
+        """Uma conexão: lê requisições em sequência até o cliente fechar"""
+        laco = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    linha = await leitor.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    await self._responder(escritor, HTTPStatus.BAD_REQUEST,
+                                          {'erro': 'Linha de requisição longa demais'}, False)
+                    break
+                if not linha:
+                    break
+                try:
+                    metodo, alvo, versao = linha.decode('latin-1').split()
+                except ValueError:
+                    await self._responder(escritor, HTTPStatus.BAD_REQUEST, {'erro': 'Requisição malformada'}, False)
+                    break
+
+                cabecalhos = await self._ler_cabecalhos(leitor)
+                if cabecalhos is None:
+                    await self._responder(escritor, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+                                          {'erro': 'Cabeçalhos grandes demais'}, False)
+                    break
+                try:
+                    tamanho = int(cabecalhos.get('content-length') or 0)
+                    if tamanho < 0:
+                        raise ValueError(tamanho)
+                except ValueError:
+                    await self._responder(escritor, HTTPStatus.BAD_REQUEST, {'erro': 'Content-Length inválido'}, False)
+                    break
+                if tamanho > TAMANHO_MAXIMO_CORPO:
+                    await self._responder(escritor, HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                          {'erro': f"Corpo maior que {TAMANHO_MAXIMO_CORPO} bytes"}, False)
+                    break
+                corpo = await leitor.readexactly(tamanho)
+
+                inicio = time.perf_counter()
+                status, resposta = await laco.run_in_executor(self._pool, self.processar, metodo, alvo, corpo)
+                caminho = urlsplit(alvo).path
+                self.metricas.registrar(caminho if caminho in self._rotas else 'outros',
+                                        time.perf_counter() - inicio, status)
+
+                manter_conexao = versao == 'HTTP/1.1' and cabecalhos.get('connection', '').lower() != 'close'
+                await self._responder(escritor, status, resposta, manter_conexao)
+                if not manter_conexao:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            escritor.close()
+
+    async def iniciar(self):
+        """Abre a porta; devolve o asyncio.Server (porta 0 escolhe uma livre)"""
+        servidor = await asyncio.start_server(self._atender, self.host, self.porta)
+        self.porta = servidor.sockets[0].getsockname()[1]
+        return servidor
+
+    async def _servir(self, aviso=None):
+        servidor = await self.iniciar()
+        if aviso is not None:
+            aviso(self)
+        async with servidor:
+            await servidor.serve_forever()
+
+    def servir(self, aviso=None):
+        """Atende até Ctrl+C; aviso(servidor) é chamado quando a porta estiver aberta"""
+        try:
+            asyncio.run(self._servir(aviso))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._pool.shutdown(wait=False, cancel_futures=True)
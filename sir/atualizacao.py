@@ -0,0 +1,169 @@
+"""Atualização incremental do DataTran: acidentes novos entram sem reprocessar o dataset.
+
+O DataTran do ano é republicado a cada mês com os acidentes anteriores e
+mais os do mês novo. Quando o arquivo novo só acrescenta acidentes (todos
+os `id`s antigos continuam lá, com os mesmos valores), as linhas novas são
+anexadas à tabela e o índice espacial, os agregados, os hotspots e o cubo são
+atualizados a partir delas. Se algum acidente sumiu ou mudou (correção da
+PRF), tudo é refeito a partir do arquivo novo.
+
+Cada VersaoDataset é imutável; o Publicador troca a versão atual de uma vez.
+Quem está no meio de uma consulta termina com a versão que pegou, e a
+próxima consulta já enxerga a nova, sem recarga a frio.
+"""
+import threading
+import time
+
+import pandas as pd
+
+from sir.agregados import AgregadosRisco
+from sir.cache import carregar_datatran_cache, gravar_cache, ler_cache, versao_datatran
+from sir.cubo import CuboRisco
+from sir.datatran import carregar_zip_datatran
+from sir.espacial import IndiceEspacial
+from sir.hotspots import Hotspots
+from sir.risco import risco_acidentes
+
+
+def concatenar_acidentes(df, novas):
+    """df com as linhas de novas no fim; categorias novas são acrescentadas sem recodificar as antigas"""
+    novas = novas.reindex(columns=df.columns)
+    antigas = {}
+    for nome in df.columns:
+        if isinstance(df[nome].dtype, pd.CategoricalDtype) and isinstance(novas[nome].dtype, pd.CategoricalDtype):
+            categorias = df[nome].cat.categories.append(
+                novas[nome].cat.categories.difference(df[nome].cat.categories, sort=False)
+            )
+            antigas[nome] = df[nome].cat.set_categories(categorias)
+            novas[nome] = novas[nome].cat.set_categories(categorias)
+    return pd.concat((df.assign(**antigas), novas), ignore_index=True)
+
+
+def acidentes_corrigidos(df, df_novo):
+    """True se algum acidente de df aparece com outros valores em df_novo (comparados pelo id).
+
+    A coluna risco é derivada e fica de fora; id repetido em qualquer uma
+    das tabelas também conta, já que as linhas não podem ser pareadas.
+    """
+    if not df['id'].is_unique or not df_novo['id'].is_unique:
+        return True
+    posicoes = pd.Index(df_novo['id']).get_indexer(df['id'])
+    if (posicoes < 0).any():
+        return True
+    for nome in df.columns.intersection(df_novo.columns).drop(['id', 'risco'], errors='ignore'):
+        antigo = df[nome].astype(object).to_numpy()
+        novo = df_novo[nome].iloc[posicoes].astype(object).to_numpy()
+        iguais = (antigo == novo) | (pd.isna(antigo) & pd.isna(novo))
+        if not iguais.all():
+            return True
+    return False
+
+
+class VersaoDataset:
+    """Uma versão do DataTran e tudo o que é derivado dela (índice, agregados, hotspots, cubo)"""
+
+    def __init__(self, df, indice, agregados, hotspots, cubo, info=None):
+        self.df = df
+        self.versao = df.attrs.get('versao')
+        self.indice = indice
+        self.agregados = agregados
+        self.hotspots = hotspots
+        self.cubo = cubo
+        self.info = info or {}
+
+    @classmethod
+    def completa(cls, df, info=None):
+        """Versão com as estruturas derivadas construídas do zero"""
+        return cls(df, IndiceEspacial(df), AgregadosRisco(df), Hotspots(df), CuboRisco(df), info)
+
+    @classmethod
+    def carregar(cls, origem, versao=None):
+        """Versão do zip (ou do cache em disco); None se o arquivo não puder ser lido"""
+        df, info = carregar_datatran_cache(origem, versao)
+        return None if df is None else cls.completa(df, info)
+
+    def atualizada(self, origem, versao=None):
+        """Versão do arquivo novo: incremental se ele só acrescenta acidentes a esta.
+
+        Retorna esta mesma versão se o arquivo não mudou, e None se ele não
+        puder ser lido.
+        """
+        inicio = time.perf_counter()
+        versao = versao or versao_datatran(origem)
+        if versao == self.versao:
+            return self
+
+        df_novo, info, cache = ler_cache(versao), {'encoding': None, 'separador': None}, 'hit'
+        if df_novo is None:
+            df_novo, info = carregar_zip_datatran(origem)
+            if df_novo is None:
+                return None
+            cache = 'miss'
+
+        if 'id' not in df_novo or 'id' not in self.df or acidentes_corrigidos(self.df, df_novo):
+            # Acidentes removidos ou corrigidos, ou arquivo sem id: carga completa
+            if 'risco' not in df_novo:
+                df_novo['risco'] = risco_acidentes(df_novo)
+                gravar_cache(versao, df_novo)
+            df_novo.attrs['versao'] = versao
+            info.update(self._info(df_novo, versao, cache, inicio, None))
+            return VersaoDataset.completa(df_novo, info)
+
+        # Só os acidentes inéditos: o modelo de gravidade roda neles e as estruturas crescem com eles
+        novas = df_novo[~df_novo['id'].isin(self.df['id'])]
+        if 'risco' not in novas:
+            novas = novas.assign(risco=risco_acidentes(novas))
+        df = concatenar_acidentes(self.df, novas)
+        df.attrs['versao'] = versao
+        if cache == 'miss':
+            gravar_cache(versao, df)  # Carga a frio desta versão vê a mesma tabela, na mesma ordem
+
+        linhas = len(self.df)
+        info.update(self._info(df, versao, cache, inicio, len(novas)))
+        return VersaoDataset(
+            df, self.indice.com_acrescimo(df, linhas), self.agregados.com_acrescimo(df, linhas),
+            self.hotspots.com_acrescimo(df, linhas), self.cubo.com_acrescimo(df, linhas), info
+        )
+
+    @staticmethod
+    def _info(df, versao, cache, inicio, acrescimo):
+        return {
+            'linhas': len(df),
+            'memoria_mb': df.memory_usage(deep=True).sum() / 1024 ** 2,
+            'cache': cache,
+            'versao': versao,
+            'acrescimo': acrescimo,
+            'tempo_s': time.perf_counter() - inicio,
+        }
+
+
+class Publicador:
+    """Versão atual do dataset, trocada de uma vez quando o arquivo de origem muda.
+
+    Leitores pegam `atual` uma vez por consulta e usam só aquela versão;
+    atualizações concorrentes são feitas uma vez só (as demais esperam e
+    recebem a versão já publicada).
+    """
+
+    def __init__(self, dados=None):
+        self.atual = dados
+        self._trava = threading.Lock()
+
+    def publicar(self, dados):
+        self.atual = dados
+
+    def sincronizar(self, origem, versao=None):
+        """Versão atual, atualizada antes se o arquivo de origem mudou; None sem dataset"""
+        versao = versao or versao_datatran(origem)
+        atual = self.atual
+        if atual is not None and atual.versao == versao:
+            return atual
+
+        with self._trava:
+            atual = self.atual
+            if atual is not None and atual.versao == versao:
+                return atual
+            dados = VersaoDataset.carregar(origem, versao) if atual is None else atual.atualizada(origem, versao)
+            if dados is not None:
+                self.publicar(dados)
+            return self.atual
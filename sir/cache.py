@@ -0,0 +1,148 @@
+"""Cache em disco (Arrow/Feather) da tabela DataTran já tipada"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import pyarrow.feather as feather
+
+from sir.datatran import carregar_zip_datatran
+from sir.risco import risco_acidentes
+
+# Pasta do cache; pode ser trocada por variável de ambiente (ex.: volume compartilhado)
+DIRETORIO_CACHE = os.environ.get(
+    'SIR_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'sir')
+)
+
+# Incrementar sempre que aplicar_schema ou risco_acidentes mudarem, para invalidar caches antigos
+VERSAO_SCHEMA = 3
+
+TAMANHO_BLOCO = 1024 * 1024
+
+
+def gravar_atomico(caminho, escrever):
+    """Grava em arquivo temporário e renomeia: leitores nunca veem arquivo pela metade"""
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix='.tmp')
+    os.close(fd)
+    try:
+        escrever(temporario)
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+def _hash_conteudo(arquivo):
+    """blake2b do conteúdo de um arquivo aberto, lido em blocos"""
+    digest = hashlib.blake2b(digest_size=16)
+    for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO), b''):
+        digest.update(bloco)
+    return digest.hexdigest()
+
+
+def versao_datatran(origem):
+    """Versão do dataset: hash do conteúdo do zip (caminho ou arquivo enviado).
+
+    Para caminhos locais o hash fica anotado junto com mtime e tamanho,
+    então o zip só é relido quando o arquivo realmente muda.
+    """
+    if not isinstance(origem, (str, os.PathLike)):
+        # Upload (UploadedFile/BytesIO): não há mtime, só o conteúdo
+        origem.seek(0)
+        versao = _hash_conteudo(origem)
+        origem.seek(0)
+        return versao
+
+    caminho = os.path.abspath(origem)
+    stat = os.stat(caminho)
+    caminho_indice = os.path.join(DIRETORIO_CACHE, 'indice.json')
+
+    try:
+        with open(caminho_indice, encoding='utf-8') as f:
+            indice = json.load(f)
+    except (OSError, ValueError):
+        indice = {}
+
+    anotado = indice.get(caminho)
+    if anotado and anotado['mtime_ns'] == stat.st_mtime_ns and anotado['tamanho'] == stat.st_size:
+        return anotado['hash']
+
+    with open(caminho, 'rb') as f:
+        versao = _hash_conteudo(f)
+
+    indice[caminho] = {'mtime_ns': stat.st_mtime_ns, 'tamanho': stat.st_size, 'hash': versao}
+
+    def escrever(destino):
+        with open(destino, 'w', encoding='utf-8') as f:
+            json.dump(indice, f)
+
+    try:
+        gravar_atomico(caminho_indice, escrever)
+    except OSError:
+        pass  # Sem permissão de escrita: só perdemos o atalho do mtime
+    return versao
+
+
+def caminho_cache(versao):
+    """Arquivo Arrow correspondente a uma versão do dataset"""
+    return os.path.join(DIRETORIO_CACHE, f"datatran-v{VERSAO_SCHEMA}-{versao}.arrow")
+
+
+def ler_cache(versao):
+    """Lê a tabela do cache via memory-map; None se não existir ou estiver corrompido"""
+    caminho = caminho_cache(versao)
+    if not os.path.exists(caminho):
+        return None
+    try:
+        tabela = feather.read_table(caminho, memory_map=True)
+        return tabela.to_pandas(split_blocks=True, self_destruct=True)
+    except Exception:
+        return None
+
+
+def gravar_cache(versao, df):
+    """Grava a tabela em Arrow sem compressão (pronta para memory-map)"""
+    try:
+        gravar_atomico(
+            caminho_cache(versao),
+            lambda destino: feather.write_feather(df, destino, compression='uncompressed')
+        )
+    except OSError:
+        pass  # Cache é otimização: falha de escrita não impede o uso dos dados
+
+
+def carregar_datatran_cache(origem, versao=None):
+    """Carrega o DataTran do cache em disco ou, na falta dele, do zip.
+
+    Retorna (df, info); info['cache'] indica 'hit' ou 'miss'.
+    """
+    inicio = time.perf_counter()
+    versao = versao or versao_datatran(origem)
+
+    df = ler_cache(versao)
+    if df is not None:
+        df.attrs['versao'] = versao
+        info = {
+            'arquivo': os.path.basename(caminho_cache(versao)),
+            'encoding': None,
+            'separador': None,
+            'linhas': len(df),
+            'tempo_s': time.perf_counter() - inicio,
+            'memoria_mb': df.memory_usage(deep=True).sum() / 1024 ** 2,
+            'cache': 'hit',
+            'versao': versao
+        }
+        return df, info
+
+    df, info = carregar_zip_datatran(origem)
+    if df is None:
+        return None, None
+
+    # Modelo de gravidade calculado uma vez e guardado junto com a tabela
+    df['risco'] = risco_acidentes(df)
+    gravar_cache(versao, df)
+    df.attrs['versao'] = versao  # Propaga a versão para caches derivados (índices etc.)
+    info.update({'cache': 'miss', 'versao': versao, 'tempo_s': time.perf_counter() - inicio})
+    return df, info
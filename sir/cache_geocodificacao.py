@@ -0,0 +1,85 @@
+"""Cache persistente (SQLite) de geocodificação, chaveado pelo endereço normalizado"""
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+
+from sir.cache import DIRETORIO_CACHE
+
+# Endereços mudam pouco: acertos valem meses; "não encontrado" expira antes,
+# porque a base do OpenStreetMap é atualizada continuamente
+TTL_SUCESSO_S = 180 * 24 * 3600
+TTL_NEGATIVO_S = 7 * 24 * 3600
+
+# Abreviações comuns em endereços brasileiros (já sem acento e em minúsculas)
+ABREVIACOES = {
+    'r': 'rua', 'av': 'avenida', 'al': 'alameda', 'tv': 'travessa', 'trav': 'travessa',
+    'pca': 'praca', 'pc': 'praca', 'rod': 'rodovia', 'estr': 'estrada', 'lgo': 'largo',
+    'jd': 'jardim', 'pq': 'parque', 'vl': 'vila', 'dr': 'doutor', 'prof': 'professor',
+    'sta': 'santa', 'sto': 'santo', 'n': '', 'no': '', 'num': '',
+}
+
+# Termos que não distinguem endereços (o país é sempre acrescentado na consulta)
+IGNORADOS = {'brasil', 'brazil'}
+
+
+def normalizar_endereco(endereco):
+    """Chave canônica: sem acentos, minúsculas, sem pontuação e com abreviações expandidas"""
+    texto = unicodedata.normalize('NFKD', str(endereco))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    palavras = re.sub(r'[^a-z0-9]+', ' ', texto).split()
+    palavras = (ABREVIACOES.get(palavra, palavra) for palavra in palavras if palavra not in IGNORADOS)
+    return ' '.join(palavra for palavra in palavras if palavra)
+
+
+class CacheGeocodificacao:
+    """Tabela chave normalizada -> resultado da geocodificação, com expiração.
+
+    Cada operação abre a própria conexão, então a mesma instância pode ser
+    usada pelas threads do pool de rede; o modo WAL evita bloquear leitores.
+    """
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or os.path.join(DIRETORIO_CACHE, 'geocodificacao.sqlite')
+        os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+        with self._conectar() as conexao:
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute(
+                'CREATE TABLE IF NOT EXISTS geocodificacao ('
+                ' chave TEXT PRIMARY KEY, resultado TEXT NOT NULL, expira REAL NOT NULL)'
+            )
+
+    def _conectar(self):
+        return sqlite3.connect(self.caminho, timeout=5)
+
+    def obter(self, endereco):
+        """Resultado guardado e ainda válido para o endereço; None se não houver"""
+        with self._conectar() as conexao:
+            linha = conexao.execute(
+                'SELECT resultado FROM geocodificacao WHERE chave = ? AND expira > ?',
+                (normalizar_endereco(endereco), time.time())
+            ).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    def guardar(self, endereco, resultado):
+        """Guarda acertos e "não encontrado"; erros transitórios (rede, prazo) não entram"""
+        if resultado['status'] == 'sucesso':
+            ttl = TTL_SUCESSO_S
+        elif resultado.get('nao_encontrado'):
+            ttl = TTL_NEGATIVO_S
+        else:
+            return
+        try:
+            with self._conectar() as conexao:
+                conexao.execute(
+                    'INSERT OR REPLACE INTO geocodificacao (chave, resultado, expira) VALUES (?, ?, ?)',
+                    (normalizar_endereco(endereco), json.dumps(resultado), time.time() + ttl)
+                )
+        except sqlite3.Error:
+            pass  # Cache é otimização: falha de escrita não impede a geocodificação
+
+    def limpar_expirados(self):
+        with self._conectar() as conexao:
+            return conexao.execute('DELETE FROM geocodificacao WHERE expira <= ?', (time.time(),)).rowcount
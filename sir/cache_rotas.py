@@ -0,0 +1,137 @@
+"""Cache persistente (SQLite) de geometrias de rota, guardadas como float32 compacto"""
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from sir.cache import DIRETORIO_CACHE
+
+# Casas decimais das coordenadas na chave (~11 m): pedidos do mesmo depósito coincidem
+CASAS_CHAVE = 4
+
+# Estradas mudam devagar, mas mudam: rotas guardadas expiram após 30 dias
+TTL_ROTA_S = 30 * 24 * 3600
+
+# Alternativas de um par ficam em chaves '<chave>|0', '<chave>|1', ... (a principal é a 0)
+SEPARADOR_ALTERNATIVA = '|'
+
+
+def chave_rota(origem_coords, destino_coords):
+    """Origem e destino arredondados: 'lat,lon;lat,lon'"""
+    return ';'.join(
+        f"{float(lat):.{CASAS_CHAVE}f},{float(lon):.{CASAS_CHAVE}f}" for lat, lon in (origem_coords, destino_coords)
+    )
+
+
+def _rota_guardada(geometria, distancia, tempo, fonte):
+    return {
+        'coordenadas': np.frombuffer(geometria, dtype=np.float32).reshape(-1, 2),
+        'distancia_real': distancia,
+        'tempo_real': tempo,
+        'status': 'sucesso',
+        'fonte': fonte
+    }
+
+
+def compactar_geometria(coordenadas):
+    """Lista de (lat, lon) -> array float32 (n, 2): 8 bytes por ponto (~0,5 m de precisão)"""
+    return np.ascontiguousarray(np.asarray(coordenadas, dtype=np.float32).reshape(-1, 2))
+
+
+class CacheRotas:
+    """Tabela chave (origem/destino arredondados) -> geometria e metadados da rota.
+
+    A geometria vai em BLOB (bytes do array float32) e volta como array
+    somente-leitura, sem passar por listas de tuplas. Acertos e falhas são
+    contados por processo.
+    """
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or os.path.join(DIRETORIO_CACHE, 'rotas.sqlite')
+        self.contagens = Counter()
+        self._trava = threading.Lock()
+        os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+        with self._conectar() as conexao:
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute(
+                'CREATE TABLE IF NOT EXISTS rotas ('
+                ' chave TEXT PRIMARY KEY, geometria BLOB NOT NULL, distancia_real REAL,'
+                ' tempo_real REAL, fonte TEXT, expira REAL NOT NULL)'
+            )
+
+    def _conectar(self):
+        return sqlite3.connect(self.caminho, timeout=5)
+
+    def _contar(self, evento):
+        with self._trava:
+            self.contagens[evento] += 1
+
+    def obter(self, origem_coords, destino_coords):
+        """Rota guardada (mesmo formato de rota_estradas) ou None"""
+        with self._conectar() as conexao:
+            linha = conexao.execute(
+                'SELECT geometria, distancia_real, tempo_real, fonte FROM rotas WHERE chave = ? AND expira > ?',
+                (chave_rota(origem_coords, destino_coords), time.time())
+            ).fetchone()
+        if linha is None:
+            self._contar('falhas')
+            return None
+
+        self._contar('acertos')
+        return _rota_guardada(*linha)
+
+    def obter_alternativas(self, origem_coords, destino_coords):
+        """Rotas alternativas guardadas (a principal primeiro) ou None"""
+        with self._conectar() as conexao:
+            linhas = conexao.execute(
+                'SELECT geometria, distancia_real, tempo_real, fonte FROM rotas'
+                ' WHERE chave LIKE ? AND expira > ? ORDER BY chave',
+                (chave_rota(origem_coords, destino_coords) + SEPARADOR_ALTERNATIVA + '%', time.time())
+            ).fetchall()
+        if not linhas:
+            self._contar('falhas')
+            return None
+
+        self._contar('acertos')
+        return [_rota_guardada(*linha) for linha in linhas]
+
+    def guardar(self, origem_coords, destino_coords, rota):
+        """Guarda só rotas por estradas bem-sucedidas (nunca o fallback em linha reta)"""
+        if rota['status'] != 'sucesso':
+            return
+        self._gravar([(chave_rota(origem_coords, destino_coords), rota)])
+
+    def guardar_alternativas(self, origem_coords, destino_coords, rotas):
+        """Guarda as alternativas de um par (substituindo as anteriores), se todas forem por estradas"""
+        if not rotas or any(rota['status'] != 'sucesso' for rota in rotas):
+            return
+        prefixo = chave_rota(origem_coords, destino_coords) + SEPARADOR_ALTERNATIVA
+        self._gravar([(f"{prefixo}{posicao}", rota) for posicao, rota in enumerate(rotas)], prefixo)
+
+    def _gravar(self, chaves_rotas, substituir=None):
+        try:
+            with self._conectar() as conexao:
+                if substituir is not None:
+                    conexao.execute('DELETE FROM rotas WHERE chave LIKE ?', (substituir + '%',))
+                conexao.executemany(
+                    'INSERT OR REPLACE INTO rotas VALUES (?, ?, ?, ?, ?, ?)',
+                    [
+                        (
+                            chave, compactar_geometria(rota['coordenadas']).tobytes(),
+                            rota['distancia_real'], rota['tempo_real'], rota['fonte'], time.time() + TTL_ROTA_S
+                        )
+                        for chave, rota in chaves_rotas
+                    ]
+                )
+        except sqlite3.Error:
+            pass  # Cache é otimização: falha de escrita não impede o roteamento
+
+    def resumo(self):
+        """Acertos, falhas e taxa de acerto deste processo"""
+        with self._trava:
+            acertos, falhas = self.contagens['acertos'], self.contagens['falhas']
+        total = acertos + falhas
+        return {'acertos': acertos, 'falhas': falhas, 'taxa_acerto': acertos / total if total else None}
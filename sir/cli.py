@@ -0,0 +1,227 @@
+"""Linha de comando do SIR.
+
+Uso (na raiz do projeto):
+    python -m sir score --from "São Paulo, SP" --to "Rio de Janeiro, RJ"
+    python -m sir score --from=-23.55,-46.63 --to=-22.91,-43.17 --json
+    python -m sir score --from "Curitiba, PR" --to "São Paulo, SP" --partida 2025-06-13T22:00
+    python -m sir batch despachos.csv resultado.parquet --processos 4
+    python -m sir serve --porta 8080 --observar 300
+    python -m sir ingest datatran2007.zip datatran2008.zip --destino dados/datatran
+    python -m sir graph sudeste.osm --destino malha.npz
+
+Os módulos pesados (pandas, scipy, requests) só são importados pelo comando
+que os usa: --help e erros de argumento respondem na hora.
+"""
+import argparse
+import json
+import sys
+import time
+import zipfile
+
+
+def imprimir_resumo(resultado, saida=sys.stdout):
+    """Resumo legível de uma rota pontuada"""
+    linhas = [
+        f"🛣️  {resultado['origem']} → {resultado['destino']}",
+        f"   {resultado['distancia_km']} km, {resultado['tempo_estimado']} ({resultado['fonte_roteamento']})",
+    ]
+    if resultado['risco_medio'] is None:
+        linhas.append("   Nenhum ponto de risco identificado no corredor da rota")
+    else:
+        linhas.append(
+            f"   Risco médio {resultado['risco_medio']:.2f} • {resultado['pontos_risco']} pontos • "
+            f"{resultado['pontos_criticos']} críticos"
+        )
+        for ponto in resultado['principais_pontos']:
+            linhas.append(f"     - {ponto['nome']}: risco {ponto['risco']:.2f}, {ponto['acidentes']} acidentes")
+    if 'risco_climatico' in resultado:
+        pior = resultado['pior_trecho']
+        linhas.append(
+            f"   Risco climático {resultado['risco_climatico']:.2f} • pior trecho km "
+            f"{pior['km_inicio']:.0f}–{pior['km_fim']:.0f} ({pior['condicao']})"
+        )
+    if resultado.get('risco_condicionado') is not None:
+        linhas.append(
+            f"   Risco condicionado (partida {resultado['partida']}) {resultado['risco_condicionado']:.2f} • "
+            f"sem condição {resultado['risco_sem_condicao']:.2f} (fator {resultado['fator_condicao']:.2f})"
+        )
+        for trecho in resultado['trechos_condicionados']:
+            clima = f", {trecho['clima']}" if trecho['clima'] else ''
+            linhas.append(
+                f"     - {trecho['nome']}: risco {trecho['risco']:.2f} ao passar {trecho['dia_semana']} "
+                f"{trecho['passagem'][11:]}{clima}"
+            )
+    print('\n'.join(linhas), file=saida)
+
+
+def comando_score(args):
+    from sir.pontuacao import Pontuador, ler_partida
+
+    pontuador = Pontuador.do_arquivo(args.datatran)
+    if pontuador.df is None:
+        print(f"⚠️ {args.datatran} não encontrado: pontuação sem acidentes", file=sys.stderr)
+
+    try:
+        partida = ler_partida(args.partida) if args.partida else None
+        resultado = pontuador.pontuar(args.origem, args.destino, clima=not args.sem_clima, partida=partida)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        json.dump(resultado, sys.stdout, ensure_ascii=False, indent=2, default=float)
+        print()
+    else:
+        imprimir_resumo(resultado)
+    return 0
+
+
+def comando_batch(args):
+    from sir.lote import ler_pares, pontuar_lote
+
+    pares = ler_pares(args.entrada)
+    ultimo = [0.0]
+
+    def progresso(feitos, total, decorrido, geocodificados, enderecos):
+        if feitos == total or decorrido - ultimo[0] >= 1.0:
+            ultimo[0] = decorrido
+            print(f"\r⏳ {geocodificados}/{enderecos} endereços • {feitos}/{total} rotas • "
+                  f"{feitos / decorrido:.1f} rotas/s", end='', file=sys.stderr)
+
+    estatisticas = pontuar_lote(
+        pares, args.saida, args.datatran, args.processos, args.concorrencia,
+        clima=not args.sem_clima, progresso=progresso
+    )
+    print(
+        f"\n✅ {estatisticas['sucesso']} pontuadas, {estatisticas['erro']} com erro em "
+        f"{estatisticas['tempo_s']:.1f}s ({estatisticas['rotas_por_s']:.1f} rotas/s) → {args.saida}",
+        file=sys.stderr
+    )
+    return 0 if estatisticas['sucesso'] or not pares else 1
+
+
+def comando_serve(args):
+    from sir.api import ModeloRisco, ServidorAPI
+
+    inicio = time.perf_counter()
+    try:
+        modelo = ModeloRisco.carregar(args.datatran)
+    except FileNotFoundError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    servidor = ServidorAPI(modelo, args.host, args.porta, args.trabalhadores)
+    if args.observar:
+        def aviso(novo, erro):
+            if erro is not None:
+                print(f"⚠️ {args.datatran}: {erro}", file=sys.stderr, flush=True)
+            else:
+                print(f"🔄 Versão {novo.versao[:12]} publicada: {len(novo.df):,} acidentes, "
+                      f"{len(novo.hotspots)} hotspots", file=sys.stderr, flush=True)
+
+        servidor.observar(args.datatran, args.observar, aviso)
+    servidor.servir(lambda servidor: print(
+        f"✅ {len(modelo.df):,} acidentes e {len(modelo.hotspots)} hotspots em memória "
+        f"({time.perf_counter() - inicio:.1f}s) • http://{servidor.host}:{servidor.porta}",
+        file=sys.stderr, flush=True
+    ))
+    return 0
+
+
+def comando_ingest(args):
+    from sir.ingestao import ingerir
+
+    def progresso(chave, linhas):
+        print(f"📥 {chave}: {linhas:,} acidentes", file=sys.stderr, flush=True)
+
+    try:
+        estatisticas = ingerir(args.zips, args.destino, args.linhas_por_bloco, args.forcar, progresso)
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    print(
+        f"✅ {estatisticas['membros']} arquivo(s) ingerido(s), {estatisticas['pulados']} sem mudança, "
+        f"{estatisticas['linhas']:,} acidentes em {estatisticas['tempo_s']:.1f}s → {args.destino}",
+        file=sys.stderr
+    )
+    return 0
+
+
+def comando_graph(args):
+    from sir.grafo import CLASSES_PADRAO, GrafoViario
+
+    inicio = time.perf_counter()
+    try:
+        grafo = GrafoViario.do_osm(args.extrato, args.classes.split(',') if args.classes else CLASSES_PADRAO)
+    except (OSError, SyntaxError, ValueError) as e:  # ParseError do XML é um SyntaxError
+        print(f"❌ {args.extrato}: {e}", file=sys.stderr)
+        return 1
+    grafo.salvar(args.destino)
+    print(
+        f"✅ {len(grafo):,} nós e {len(grafo.destino):,} arcos em {time.perf_counter() - inicio:.1f}s "
+        f"→ {args.destino} (use SIR_GRAFO={args.destino})",
+        file=sys.stderr
+    )
+    return 0
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog='sir', description='Sistema Inteligente de Rotas: risco de rotas sem a interface'
+    )
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    score = subcomandos.add_parser('score', help='pontua o risco da rota entre origem e destino')
+    score.add_argument('--from', dest='origem', required=True,
+                       help='endereço ou "lat,lon" de origem (coordenadas negativas: --from=-23.55,-46.63)')
+    score.add_argument('--to', dest='destino', required=True, help='endereço ou "lat,lon" de destino')
+    score.add_argument('--datatran', default='datatran2025.zip',
+                       help='zip do DataTran ou pasta do armazém (padrão: %(default)s)')
+    score.add_argument('--sem-clima', action='store_true', help='não consulta o clima ao longo da rota')
+    score.add_argument('--partida', help='horário de partida (AAAA-MM-DDTHH:MM ou "agora"): '
+                                         'risco condicionado ao horário e ao clima de cada trecho')
+    score.add_argument('--json', action='store_true', help='saída em JSON')
+    score.set_defaults(executar=comando_score)
+
+    batch = subcomandos.add_parser('batch', help='pontua os pares origem/destino de um CSV ou Parquet')
+    batch.add_argument('entrada', help='CSV ou Parquet com as colunas origem e destino (endereço ou "lat,lon")')
+    batch.add_argument('saida', help='arquivo de resultado; .parquet grava Parquet, qualquer outro CSV')
+    batch.add_argument('--datatran', default='datatran2025.zip',
+                       help='zip do DataTran ou pasta do armazém (padrão: %(default)s)')
+    batch.add_argument('--processos', type=int, default=None,
+                       help='processos para o corredor de acidentes (padrão: número de CPUs)')
+    batch.add_argument('--concorrencia', type=int, default=8,
+                       help='pares roteados ao mesmo tempo (padrão: %(default)s)')
+    batch.add_argument('--sem-clima', action='store_true', help='não consulta o clima ao longo das rotas')
+    batch.set_defaults(executar=comando_batch)
+
+    serve = subcomandos.add_parser('serve', help='API HTTP/JSON de risco com o DataTran em memória')
+    serve.add_argument('--host', default='127.0.0.1', help='endereço de escuta (padrão: %(default)s)')
+    serve.add_argument('--porta', type=int, default=8080, help='porta (padrão: %(default)s)')
+    serve.add_argument('--datatran', default='datatran2025.zip',
+                       help='zip do DataTran ou pasta do armazém (padrão: %(default)s)')
+    serve.add_argument('--trabalhadores', type=int, default=8,
+                       help='requisições processadas ao mesmo tempo (padrão: %(default)s)')
+    serve.add_argument('--observar', type=float, metavar='SEGUNDOS',
+                       help='confere o DataTran a cada SEGUNDOS e publica a versão nova sem reiniciar')
+    serve.set_defaults(executar=comando_serve)
+
+    ingest = subcomandos.add_parser('ingest', help='ingere zips do DataTran (vários anos) num armazém Parquet')
+    ingest.add_argument('zips', nargs='+', help='zips do DataTran; todos os CSV de cada zip são ingeridos')
+    ingest.add_argument('--destino', required=True, help='pasta do armazém, particionado por ano e UF')
+    ingest.add_argument('--linhas-por-bloco', type=int, default=10_000,
+                        help='linhas lidas por vez; limita a memória (padrão: %(default)s)')
+    ingest.add_argument('--forcar', action='store_true', help='reingere arquivos que não mudaram')
+    ingest.set_defaults(executar=comando_ingest)
+
+    graph = subcomandos.add_parser('graph', help='prepara a malha viária de um extrato OSM para rotas offline')
+    graph.add_argument('extrato', help='extrato do OpenStreetMap em XML (.osm, .osm.gz ou .osm.bz2)')
+    graph.add_argument('--destino', required=True, help='arquivo .npz da malha (apontado por SIR_GRAFO)')
+    graph.add_argument('--classes', help='classes de highway roteáveis, separadas por vírgula '
+                                         '(padrão: motorway a tertiary e seus acessos)')
+    graph.set_defaults(executar=comando_graph)
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    return args.executar(args)
@@ -0,0 +1,193 @@
+"""Cliente HTTP compartilhado pelos serviços externos: pool, retentativas, disjuntor e métricas"""
+import os
+import random
+import threading
+import time
+from collections import Counter, deque
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from sir.concorrencia import MAX_TRABALHADORES
+
+# URL base, timeout (s) e nº de tentativas de cada serviço. A URL pode ser trocada
+# por variável de ambiente SIR_URL_<SERVIÇO> (ex.: servidor stub em testes).
+SERVICOS = {
+    'nominatim': {'url': 'https://nominatim.openstreetmap.org', 'timeout': 10, 'tentativas': 2},
+    'osrm': {'url': 'http://router.project-osrm.org', 'timeout': 15, 'tentativas': 2},
+    'graphhopper': {'url': 'https://graphhopper.com', 'timeout': 15, 'tentativas': 2},
+    'weatherapi': {'url': 'http://api.weatherapi.com', 'timeout': 10, 'tentativas': 2},
+}
+
+# Respostas que valem nova tentativa (sobrecarga/instabilidade do provedor)
+STATUS_RETENTAVEIS = {429, 500, 502, 503, 504}
+
+# Espera entre tentativas: exponencial com jitter completo, limitada
+ESPERA_BASE_S = 0.25
+ESPERA_MAXIMA_S = 2.0
+
+# Disjuntor: após N falhas seguidas o serviço é pulado durante o resfriamento
+FALHAS_PARA_ABRIR = 3
+RESFRIAMENTO_S = 60.0
+
+# permite() devolve SONDA quando a chamada é o teste do disjuntor meio-aberto
+SONDA = 'sonda'
+
+# Latências guardadas por serviço para as métricas (janela móvel)
+AMOSTRAS_LATENCIA = 500
+
+
+class ServicoIndisponivel(requests.exceptions.RequestException):
+    """Disjuntor aberto: o serviço falhou seguidamente e está em resfriamento"""
+
+
+class Disjuntor:
+    """Circuit breaker simples: fechado -> aberto (resfriamento) -> meio-aberto (1 teste)"""
+
+    def __init__(self, falhas_para_abrir=FALHAS_PARA_ABRIR, resfriamento_s=RESFRIAMENTO_S):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.resfriamento_s = resfriamento_s
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self._trava = threading.Lock()
+
+    @property
+    def estado(self):
+        if self.falhas < self.falhas_para_abrir:
+            return 'fechado'
+        return 'aberto' if time.monotonic() < self.aberto_ate else 'meio-aberto'
+
+    def permite(self):
+        """Deixa passar se fechado (True); depois do resfriamento, libera uma chamada de teste (SONDA)"""
+        with self._trava:
+            if self.falhas < self.falhas_para_abrir:
+                return True
+            agora = time.monotonic()
+            if agora < self.aberto_ate:
+                return False
+            # Meio-aberto: uma chamada testa o serviço enquanto as outras esperam outro ciclo
+            self.aberto_ate = agora + self.resfriamento_s
+            return SONDA
+
+    def devolver_sonda(self):
+        """A chamada de teste desistiu sem consultar o serviço: o próximo pedido pode testar"""
+        with self._trava:
+            if self.falhas >= self.falhas_para_abrir:
+                self.aberto_ate = time.monotonic()
+
+    def sucesso(self):
+        with self._trava:
+            self.falhas = 0
+            self.aberto_ate = 0.0
+
+    def falha(self):
+        with self._trava:
+            self.falhas += 1
+            if self.falhas >= self.falhas_para_abrir:
+                self.aberto_ate = time.monotonic() + self.resfriamento_s
+
+
+class ClienteHTTP:
+    """Sessão requests com pool keep-alive por host, compartilhada entre threads.
+
+    Cada chamada é identificada pelo nome do serviço (chave de SERVICOS), que
+    define URL base, timeout, tentativas e o disjuntor usado.
+    """
+
+    def __init__(self, servicos=SERVICOS, tamanho_pool=MAX_TRABALHADORES):
+        self.servicos = servicos
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=len(servicos), pool_maxsize=tamanho_pool, max_retries=0)
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+
+        self.disjuntores = {nome: Disjuntor() for nome in servicos}
+        self.latencias = {nome: deque(maxlen=AMOSTRAS_LATENCIA) for nome in servicos}
+        self.contagens = {nome: Counter() for nome in servicos}
+        self._trava = threading.Lock()
+
+    def url(self, servico, caminho):
+        base = os.environ.get(f'SIR_URL_{servico.upper()}', self.servicos[servico]['url'])
+        return base.rstrip('/') + caminho
+
+    def _registrar(self, servico, evento, latencia_s=None):
+        with self._trava:
+            self.contagens[servico][evento] += 1
+            if latencia_s is not None:
+                self.latencias[servico].append(latencia_s)
+
+    def get(self, servico, caminho, params=None, headers=None, timeout=None):
+        """GET com retentativas (jitter) e disjuntor; levanta exceções de requests.
+
+        Respostas 4xx voltam para quem chamou (o serviço está vivo); 5xx/429 e
+        erros de conexão contam como falha depois de esgotar as tentativas.
+        Prazo já esgotado antes da primeira tentativa levanta Timeout sem
+        mexer no disjuntor: nada foi perguntado ao serviço.
+        """
+        config = self.servicos[servico]
+        disjuntor = self.disjuntores[servico]
+        permissao = disjuntor.permite()
+        if not permissao:
+            self._registrar(servico, 'rejeitadas')
+            raise ServicoIndisponivel(f'{servico} indisponível (disjuntor aberto)')
+
+        timeout = config['timeout'] if timeout is None else min(timeout, config['timeout'])
+        fim = time.monotonic() + timeout
+        resposta, erro, tentativas = None, None, 0
+        for tentativa in range(config['tentativas']):
+            restante = fim - time.monotonic()
+            if restante <= 0:
+                break
+            tentativas += 1
+            inicio = time.perf_counter()
+            try:
+                resposta = self.sessao.get(
+                    self.url(servico, caminho), params=params, headers=headers, timeout=restante
+                )
+                erro = None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                resposta, erro = None, e
+            self._registrar(servico, 'chamadas', time.perf_counter() - inicio)
+
+            if resposta is not None and resposta.status_code not in STATUS_RETENTAVEIS:
+                disjuntor.sucesso()
+                return resposta
+
+            self._registrar(servico, 'erros')
+            espera = random.uniform(0, min(ESPERA_MAXIMA_S, ESPERA_BASE_S * 2 ** tentativa))
+            if tentativa + 1 < config['tentativas'] and fim - time.monotonic() > espera:
+                self._registrar(servico, 'retentativas')
+                time.sleep(espera)
+
+        if not tentativas:
+            if permissao == SONDA:
+                disjuntor.devolver_sonda()
+            raise requests.exceptions.Timeout(f'{servico}: prazo esgotado antes da primeira tentativa')
+
+        disjuntor.falha()
+        if resposta is not None:
+            return resposta
+        raise erro or requests.exceptions.Timeout(f'{servico}: prazo esgotado')
+
+    def metricas(self):
+        """Resumo por serviço: chamadas, erros, retentativas, rejeições, latências e disjuntor"""
+        with self._trava:
+            resumo = {}
+            for nome in self.servicos:
+                latencias = np.array(self.latencias[nome]) * 1000
+                contagens = self.contagens[nome]
+                resumo[nome] = {
+                    'chamadas': contagens['chamadas'],
+                    'erros': contagens['erros'],
+                    'retentativas': contagens['retentativas'],
+                    'rejeitadas': contagens['rejeitadas'],
+                    'p50_ms': float(np.percentile(latencias, 50)) if len(latencias) else None,
+                    'p95_ms': float(np.percentile(latencias, 95)) if len(latencias) else None,
+                    'disjuntor': self.disjuntores[nome].estado,
+                }
+            return resumo
+
+
+# Instância única do processo: todas as chamadas externas reaproveitam as conexões
+CLIENTE = ClienteHTTP()
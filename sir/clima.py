@@ -0,0 +1,241 @@
+"""Clima ao longo da rota (WeatherAPI): consultas em lote, coalescidas e em cache.
+
+As consultas são por célula de geohash, então pontos próximos (e rotas
+diferentes que passam pelo mesmo lugar) dividem a mesma resposta dentro de
+cada janela de tempo.
+"""
+import threading
+import time
+
+import numpy as np
+import requests
+
+from sir.cliente_http import CLIENTE
+from sir.concorrencia import Prazo, submeter
+from sir.espacial import haversine_km
+from sir.simulacao import Simulador
+
+# Células de geohash com 5 caracteres têm ~4,9 x 4,9 km
+PRECISAO_GEOHASH = 5
+
+# Janela de tempo (s) em que uma observação vale para a célula
+BALDE_TEMPO_S = 1800
+
+# Amostragem da rota: um ponto a cada PASSO_CLIMA_KM, no máximo MAX_PONTOS_CLIMA
+PASSO_CLIMA_KM = 50
+MAX_PONTOS_CLIMA = 16
+
+PRAZO_CLIMA_S = 10.0
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(lat, lon, precisao=PRECISAO_GEOHASH):
+    """Codifica (lat, lon) em geohash com precisao caracteres"""
+    faixa_lat, faixa_lon = [-90.0, 90.0], [-180.0, 180.0]
+    codigo, bits, valor, usar_lon = [], 0, 0, True
+    while len(codigo) < precisao:
+        faixa, coordenada = (faixa_lon, lon) if usar_lon else (faixa_lat, lat)
+        meio = (faixa[0] + faixa[1]) / 2
+        valor <<= 1
+        if coordenada >= meio:
+            valor |= 1
+            faixa[0] = meio
+        else:
+            faixa[1] = meio
+        usar_lon = not usar_lon
+        bits += 1
+        if bits == 5:
+            codigo.append(_BASE32[valor])
+            bits, valor = 0, 0
+    return ''.join(codigo)
+
+
+def centro_geohash(codigo):
+    """Centro (lat, lon) da célula de um geohash"""
+    faixa_lat, faixa_lon = [-90.0, 90.0], [-180.0, 180.0]
+    usar_lon = True
+    for caractere in codigo:
+        valor = _BASE32.index(caractere)
+        for deslocamento in range(4, -1, -1):
+            faixa = faixa_lon if usar_lon else faixa_lat
+            meio = (faixa[0] + faixa[1]) / 2
+            if (valor >> deslocamento) & 1:
+                faixa[0] = meio
+            else:
+                faixa[1] = meio
+            usar_lon = not usar_lon
+    return (faixa_lat[0] + faixa_lat[1]) / 2, (faixa_lon[0] + faixa_lon[1]) / 2
+
+
+def risco_climatico(condicao, vento_kph, umidade):
+    """Risco climático (0.1–1.0) a partir da condição, vento e umidade"""
+    risco = 0.1  # Base
+
+    # Aumentar risco por condições adversas
+    condicao_lower = condicao.lower()
+    if any(palavra in condicao_lower for palavra in ['chuva forte', 'tempestade', 'temporal']):
+        risco += 0.7
+    elif any(palavra in condicao_lower for palavra in ['chuva', 'chuvisco', 'garoa']):
+        risco += 0.4
+    elif any(palavra in condicao_lower for palavra in ['nevoeiro', 'neblina', 'cerração']):
+        risco += 0.5
+    elif 'nublado' in condicao_lower:
+        risco += 0.1
+
+    # Ajustar por vento forte
+    if vento_kph > 50:
+        risco += 0.3
+    elif vento_kph > 30:
+        risco += 0.1
+
+    # Ajustar por umidade muito alta
+    if umidade > 85:
+        risco += 0.1
+    return min(risco, 1.0)
+
+
+def amostrar_rota(coordenadas, passo_km=PASSO_CLIMA_KM, max_pontos=MAX_PONTOS_CLIMA):
+    """Pontos a cada passo_km ao longo da polilinha (inclui origem e destino).
+
+    Retorna (pontos (n, 2), km de cada ponto). Rotas longas alargam o passo
+    para não passar de max_pontos.
+    """
+    pontos = np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2)
+    acumulado = np.concatenate(([0.0], np.cumsum(
+        haversine_km(pontos[:-1, 0], pontos[:-1, 1], pontos[1:, 0], pontos[1:, 1])
+    )))
+    total = acumulado[-1]
+    quantidade = int(min(max(np.ceil(total / passo_km), 1), max_pontos - 1)) + 1
+    km = np.linspace(0.0, total, quantidade)
+    amostras = np.column_stack((np.interp(km, acumulado, pontos[:, 0]), np.interp(km, acumulado, pontos[:, 1])))
+    return amostras, km
+
+
+class ServicoClima:
+    """Cache (geohash, janela de tempo) -> clima, com coalescência de consultas em andamento.
+
+    Pedidos simultâneos para a mesma célula esperam a mesma consulta em vez
+    de abrir outra. Com um simulador, nada vai à rede; sem API key ou com a
+    API fora do ar, o simulador padrão preenche os dados, sempre iguais para
+    a mesma célula e janela.
+    """
+
+    def __init__(self, chave_api=None, simulador=None, balde_s=BALDE_TEMPO_S, precisao=PRECISAO_GEOHASH):
+        self.chave_api = chave_api
+        self.simulador = simulador
+        self._fallback = simulador or Simulador()
+        self.balde_s = balde_s
+        self.precisao = precisao
+        self._cache = {}
+        self._em_andamento = {}
+        # Reentrante: add_done_callback roda na hora se a consulta já terminou
+        self._trava = threading.RLock()
+
+    def _chave(self, lat, lon):
+        return geohash(lat, lon, self.precisao), int(time.time() // self.balde_s)
+
+    def _consultar(self, chave):
+        """Uma consulta à WeatherAPI no centro da célula; (clima, pode_guardar)"""
+        celula, balde = chave
+        if self.simulador is not None:
+            return self.simulador.clima(celula, balde), True
+        if not self.chave_api:
+            return self._fallback.clima(celula, balde, "⚠️ API key não configurada - dados simulados"), True
+
+        lat, lon = centro_geohash(celula)
+        params = {'key': self.chave_api, 'q': f"{lat:.4f},{lon:.4f}", 'lang': 'pt', 'aqi': 'no'}
+        try:
+            response = CLIENTE.get('weatherapi', '/v1/current.json', params=params)
+            if response.status_code == 200:
+                current = response.json()['current']
+                condicao = current['condition']['text']
+                return {
+                    "temperatura": current['temp_c'],
+                    "condicao": condicao,
+                    "umidade": current['humidity'],
+                    "vento_kph": current['wind_kph'],
+                    "risco_climatico": risco_climatico(condicao, current['wind_kph'], current['humidity']),
+                    "api_status": "✅ Dados reais da WeatherAPI"
+                }, True
+            if response.status_code == 401:
+                status = "🔑 API key inválida ou expirada - dados simulados"
+            elif response.status_code == 403:
+                status = "🚫 Cota da API esgotada - dados simulados"
+            else:
+                status = f"⚠️ API retornou erro {response.status_code} - dados simulados"
+        except requests.exceptions.Timeout:
+            status = "⏱️ Timeout na API climática - usando dados simulados"
+        except requests.exceptions.RequestException as e:
+            status = f"🌐 Erro na conexão com API: {str(e)[:50]}..."
+        except Exception as e:
+            status = f"❌ Erro inesperado: {str(e)[:50]}..."
+        return self._fallback.clima(celula, balde, status), False
+
+    def _concluir(self, chave, futuro):
+        with self._trava:
+            self._em_andamento.pop(chave, None)
+            if futuro.cancelled() or futuro.exception() is not None:
+                return
+            clima, pode_guardar = futuro.result()
+            if pode_guardar:
+                # Descarta janelas antigas antes de guardar a nova
+                for antiga in [c for c in self._cache if c[1] < chave[1]]:
+                    del self._cache[antiga]
+                self._cache[chave] = clima
+
+    def _futuro(self, chave):
+        """Resultado em cache, consulta em andamento para a célula ou nova consulta"""
+        with self._trava:
+            if chave in self._cache:
+                return self._cache[chave]
+            futuro = self._em_andamento.get(chave)
+            if futuro is None:
+                futuro = submeter(lambda: self._consultar(chave))
+                self._em_andamento[chave] = futuro
+                futuro.add_done_callback(lambda f: self._concluir(chave, f))
+            return futuro
+
+    def obter_lote(self, pontos, prazo_s=PRAZO_CLIMA_S):
+        """Clima de vários pontos (na ordem recebida), todos consultados ao mesmo tempo"""
+        chaves = [self._chave(lat, lon) for lat, lon in pontos]
+        pendentes = [self._futuro(chave) for chave in chaves]
+        prazo = Prazo(prazo_s)
+        resultados = []
+        for (celula, balde), pendente in zip(chaves, pendentes):
+            if isinstance(pendente, dict):
+                resultados.append(pendente)
+                continue
+            try:
+                resultados.append(pendente.result(timeout=prazo.restante())[0])
+            except Exception:
+                resultados.append(self._fallback.clima(
+                    celula, balde, "⏱️ Timeout na API climática - usando dados simulados"
+                ))
+        return resultados
+
+    def obter(self, lat, lon, prazo_s=PRAZO_CLIMA_S):
+        return self.obter_lote([(lat, lon)], prazo_s)[0]
+
+    def clima_rota(self, coordenadas, passo_km=PASSO_CLIMA_KM, prazo_s=PRAZO_CLIMA_S):
+        """Clima amostrado ao longo da rota e risco climático por trecho entre amostras.
+
+        Retorna {'pontos': [...], 'trechos': [...]}; cada trecho leva o pior
+        risco das suas duas pontas.
+        """
+        amostras, km = amostrar_rota(coordenadas, passo_km)
+        climas = self.obter_lote([tuple(ponto) for ponto in amostras], prazo_s)
+        pontos = [
+            {'km': float(k), 'coords': (float(lat), float(lon)), 'clima': clima}
+            for k, (lat, lon), clima in zip(km, amostras, climas)
+        ]
+        trechos = [
+            {
+                'km_inicio': inicio['km'],
+                'km_fim': fim['km'],
+                'risco_climatico': max(inicio['clima']['risco_climatico'], fim['clima']['risco_climatico']),
+                'condicao': max((inicio['clima'], fim['clima']), key=lambda c: c['risco_climatico'])['condicao']
+            }
+            for inicio, fim in zip(pontos[:-1], pontos[1:])
+        ]
+        return {'pontos': pontos, 'trechos': trechos}
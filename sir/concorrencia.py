@@ -0,0 +1,87 @@
+"""Execução concorrente de chamadas de rede (geocodificação, roteamento) com prazo"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Pool compartilhado: as chamadas são de E/S, então threads bastam. Chamadas que
+# estouram o prazo continuam em segundo plano até o timeout do próprio requests.
+MAX_TRABALHADORES = 16
+_POOL = ThreadPoolExecutor(max_workers=MAX_TRABALHADORES, thread_name_prefix='sir-rede')
+
+
+def submeter(chamada):
+    """Agenda uma chamada no pool compartilhado e devolve o Future"""
+    return _POOL.submit(chamada)
+
+
+class Prazo:
+    """Instante limite absoluto compartilhado por várias etapas de uma mesma busca"""
+
+    def __init__(self, segundos):
+        self.fim = time.monotonic() + segundos
+
+    def restante(self, maximo=None):
+        """Segundos até o prazo (nunca negativo), opcionalmente limitado a maximo"""
+        restante = max(self.fim - time.monotonic(), 0.0)
+        return restante if maximo is None else min(restante, maximo)
+
+
+def em_paralelo(chamadas, prazo_s, padrao=None):
+    """Executa as chamadas ao mesmo tempo; quem não terminar no prazo (ou falhar) vira padrao"""
+    futuros = [_POOL.submit(chamada) for chamada in chamadas]
+    wait(futuros, timeout=prazo_s)
+    resultados = []
+    for futuro in futuros:
+        if futuro.done() and futuro.exception() is None:
+            resultados.append(futuro.result())
+        else:
+            futuro.cancel()
+            resultados.append(padrao)
+    return resultados
+
+
+def primeiro_valido(chamadas, aceitar, prazo_s, padrao=None):
+    """Corrida: devolve o primeiro resultado aceito dentro do prazo, senão padrao.
+
+    Se nenhuma chamada for aceita, devolve o último resultado recebido
+    (ex.: um fallback em linha reta) ou padrao se nada chegou a tempo.
+    """
+    prazo = Prazo(prazo_s)
+    pendentes = {_POOL.submit(chamada) for chamada in chamadas}
+    ultimo = padrao
+    while pendentes:
+        prontos, pendentes = wait(pendentes, timeout=prazo.restante(), return_when=FIRST_COMPLETED)
+        if not prontos:
+            break
+        for futuro in prontos:
+            if futuro.exception() is not None:
+                continue
+            resultado = futuro.result()
+            if aceitar(resultado):
+                for outro in pendentes:
+                    outro.cancel()
+                return resultado
+            ultimo = resultado
+    for futuro in pendentes:
+        futuro.cancel()
+    return ultimo
+
+
+class LimitadorTaxa:
+    """Espaça chamadas a um provedor (ex.: Nominatim, 1 req/s) entre todas as threads"""
+
+    def __init__(self, chamadas_por_s):
+        self.intervalo = 1.0 / chamadas_por_s
+        self.proxima = 0.0
+        self._trava = threading.Lock()
+
+    def aguardar(self, prazo_s=None):
+        """Reserva a próxima vaga e dorme até ela; False se a vaga cair depois do prazo"""
+        with self._trava:
+            agora = time.monotonic()
+            vaga = max(self.proxima, agora)
+            if prazo_s is not None and vaga - agora > prazo_s:
+                return False
+            self.proxima = vaga + self.intervalo
+        time.sleep(max(vaga - time.monotonic(), 0.0))
+        return True
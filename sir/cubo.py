@@ -0,0 +1,375 @@
+"""Cubo de risco condicionado: trecho × faixa horária × dia da semana × classe de clima.
+
+Cada célula guarda o número de acidentes e a soma do risco por acidente.
+O risco de um trecho numa condição ("chuva, sexta à noite") combina:
+  - a gravidade média na célula, suavizada em direção à do trecho ajustada
+    pela gravidade da mesma condição na malha inteira;
+  - o fator local: quanto a condição pesa nos acidentes do trecho em relação
+    a quanto pesa na malha (suavizado e limitado a [FATOR_MINIMO, FATOR_MAXIMO]).
+Sem dados de tráfego não há exposição; o fator compara o trecho com a malha.
+"""
+import unicodedata
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from sir.agregados import TAMANHO_SEGMENTO_KM, base_acidentes
+from sir.espacial import haversine_km
+from sir.risco import RAIO_CORREDOR_KM, distancia_polilinha_km, risco_agrupado
+
+# Faixas horárias (nome, hora inicial, hora final exclusiva)
+FAIXAS_HORARIAS = (('madrugada', 0, 6), ('manha', 6, 12), ('tarde', 12, 18), ('noite', 18, 24))
+
+DIAS_SEMANA = ('segunda-feira', 'terça-feira', 'quarta-feira', 'quinta-feira', 'sexta-feira', 'sábado', 'domingo')
+
+# Classes de clima e as palavras (sem acento) que levam a cada uma, na ordem de prioridade;
+# valem para o DataTran ('Garoa/Chuvisco') e para o clima ao vivo ('Chuva forte', 'Ensolarado')
+CLASSES_CLIMA = ('bom', 'nublado', 'chuva', 'neblina', 'outro')
+_PALAVRAS_CLIMA = (
+    ('chuva', ('chuva', 'chuvisco', 'garoa', 'tempestade', 'temporal', 'trovoada', 'aguaceiro')),
+    ('neblina', ('nevoeiro', 'neblina', 'nevoa', 'cerracao')),
+    ('nublado', ('nublado', 'encoberto')),
+    ('bom', ('ceu claro', 'sol', 'ensolarado', 'limpo')),
+)
+
+# Peso (em acidentes) da malha na proporção de acidentes da condição em cada trecho
+PESO_PROPORCAO = 20
+
+# Peso (em acidentes) da gravidade esperada na gravidade de cada célula
+PESO_GRAVIDADE = 5
+
+FATOR_MINIMO = 0.5
+FATOR_MAXIMO = 2.0
+
+
+def _sem_acento(texto):
+    return ''.join(c for c in unicodedata.normalize('NFKD', str(texto).lower()) if not unicodedata.combining(c))
+
+
+def classe_clima(condicao):
+    """Classe de clima ('chuva', 'neblina', ...) de uma condição do DataTran ou da API"""
+    texto = _sem_acento(condicao)
+    for classe, palavras in _PALAVRAS_CLIMA:
+        if any(palavra in texto for palavra in palavras):
+            return classe
+    return 'outro'
+
+
+def faixa_horaria(hora):
+    """Índice da faixa horária de uma hora (0–23)"""
+    if not 0 <= int(hora) <= 23:
+        raise ValueError(f"Hora fora do intervalo 0–23: {hora}")
+    return int(hora) // 6
+
+
+def _indice(valor, nomes, rotulo):
+    """Índice de uma dimensão a partir do número ou do nome; None fica None (todas)"""
+    if valor is None:
+        return None
+    if isinstance(valor, (int, np.integer)) or str(valor).strip().isdigit():
+        if not 0 <= int(valor) < len(nomes):
+            raise ValueError(f"{rotulo} fora do intervalo 0–{len(nomes) - 1}: {valor}")
+        return int(valor)
+    texto = _sem_acento(valor).strip()
+    for posicao, nome in enumerate(nomes):
+        if _sem_acento(nome).startswith(texto):
+            return posicao
+    raise ValueError(f"{rotulo} desconhecido: {valor}")
+
+
+class CuboRisco:
+    """Contagens e gravidade por (trecho, faixa horária, dia da semana, classe de clima).
+
+    Construído uma vez por versão do dataset, como os AgregadosRisco; a
+    consulta de um trecho numa condição é indexação direta nos arrays.
+    """
+
+    def __init__(self, df):
+        base = base_acidentes(df)
+        chaves, com_trecho = _chaves_trechos(base)
+        codigos = self.segmentos = chaves.sort_values().unique()
+
+        # Trecho de cada acidente (mesma ordem do DataTran e do índice espacial); -1 sem trecho
+        self.segmento_linha = np.full(len(df), -1, dtype=np.int64)
+        self.segmento_linha[com_trecho] = codigos.get_indexer(chaves)
+
+        forma = (len(codigos), len(FAIXAS_HORARIAS), len(DIAS_SEMANA), len(CLASSES_CLIMA))
+        self.contagem = np.zeros(forma, dtype=np.int32)
+        self.soma_risco = np.zeros(forma, dtype=np.float64)
+        self.contagem_malha = np.zeros(forma[1:], dtype=np.int32)
+        self.soma_malha = np.zeros(forma[1:], dtype=np.float64)
+        self._acumular(df, base, self.segmento_linha)
+
+        # Centro de cada trecho para posicioná-lo na rota
+        self.lat_linha, self.lon_linha = base['lat'].to_numpy(), base['lon'].to_numpy()
+        self.lat, self.lon = self._centros(np.arange(len(codigos)))
+
+        # Trechos de cada BR, por UF, ordenados por km: faixa de km vira busca binária
+        self._por_br = _trechos_por_br(codigos, np.arange(len(codigos)))
+
+    def com_acrescimo(self, df, inicio):
+        """Cubo de df, que é a tabela deste cubo com linhas novas a partir de inicio.
+
+        As contagens dos acidentes novos são somadas às do cubo (copiado:
+        quem ainda usa este cubo não vê a mudança); trechos inéditos entram
+        no fim dos arrays.
+        """
+        novas = df.iloc[inicio:]
+        base = base_acidentes(novas)
+        chaves, com_trecho = _chaves_trechos(base)
+        ineditos = chaves[self.segmentos.get_indexer(chaves) < 0].unique()
+
+        novo = object.__new__(CuboRisco)
+        novo.segmentos = self.segmentos.append(ineditos)
+        segmento_novas = np.full(len(novas), -1, dtype=np.int64)
+        segmento_novas[com_trecho] = novo.segmentos.get_indexer(chaves)
+        novo.segmento_linha = np.concatenate((self.segmento_linha, segmento_novas))
+
+        acrescimo = np.zeros((len(ineditos),) + self.contagem.shape[1:])
+        novo.contagem = np.concatenate((self.contagem, acrescimo.astype(np.int32)))
+        novo.soma_risco = np.concatenate((self.soma_risco, acrescimo))
+        novo.contagem_malha, novo.soma_malha = self.contagem_malha.copy(), self.soma_malha.copy()
+        novo._acumular(novas, base, segmento_novas)
+
+        novo.lat_linha = np.concatenate((self.lat_linha, base['lat'].to_numpy()))
+        novo.lon_linha = np.concatenate((self.lon_linha, base['lon'].to_numpy()))
+        tocados = np.unique(segmento_novas[segmento_novas >= 0])
+        novo.lat = np.concatenate((self.lat, np.full(len(ineditos), np.nan)))
+        novo.lon = np.concatenate((self.lon, np.full(len(ineditos), np.nan)))
+        novo.lat[tocados], novo.lon[tocados] = novo._centros(tocados)
+
+        novo._por_br = _trechos_por_br(novo.segmentos, np.arange(len(self.segmentos), len(novo.segmentos)),
+                                       self._por_br)
+        return novo
+
+    def _acumular(self, df, base, segmento_linha):
+        """Soma às células (e à malha) os acidentes de df com trecho, hora e dia conhecidos"""
+        hora, dia = hora_e_dia(df)
+        clima = classes_clima(df)
+        validos = (segmento_linha >= 0) & (hora >= 0) & (dia >= 0)
+        celula = (segmento_linha[validos], hora[validos] // 6, dia[validos], clima[validos])
+        risco = base['risco'].to_numpy()[validos]
+        np.add.at(self.contagem, celula, 1)
+        np.add.at(self.soma_risco, celula, risco)
+        np.add.at(self.contagem_malha, celula[1:], 1)
+        np.add.at(self.soma_malha, celula[1:], risco)
+
+    def _centros(self, trechos):
+        """Coordenada média dos acidentes de cada trecho (NaN sem coordenadas)"""
+        linhas = np.flatnonzero(np.isin(self.segmento_linha, trechos))
+        centros = pd.DataFrame({
+            'lat': self.lat_linha[linhas], 'lon': self.lon_linha[linhas], 'segmento': self.segmento_linha[linhas]
+        }).groupby('segmento').mean().reindex(trechos)
+        return centros['lat'].to_numpy(), centros['lon'].to_numpy()
+
+    def __len__(self):
+        return len(self.segmentos)
+
+    def trechos(self, br, uf=None, km_inicio=None, km_fim=None):
+        """Posições no cubo dos trechos da BR (na UF, ou em todas) que cruzam [km_inicio, km_fim]"""
+        por_uf = self._por_br.get(int(br), {})
+        if uf is not None:
+            por_uf = {str(uf).upper(): por_uf[str(uf).upper()]} if str(uf).upper() in por_uf else {}
+        posicoes = []
+        for kms, posicao in por_uf.values():
+            primeiro = 0 if km_inicio is None else np.searchsorted(kms, km_inicio - TAMANHO_SEGMENTO_KM, 'right')
+            ultimo = len(kms) if km_fim is None else np.searchsorted(kms, km_fim, 'left')
+            posicoes.append(posicao[primeiro:max(primeiro, ultimo)])
+        return np.concatenate(posicoes) if posicoes else np.empty(0, dtype=np.int64)
+
+    def _riscos(self, trechos, faixa, dia, clima):
+        """Risco condicionado, risco sem condição e fator local de cada trecho (vetorizado).
+
+        faixa, dia e clima são índices, escalares ou arrays alinhados aos
+        trechos; uma dimensão em None soma todas as suas células.
+        """
+        condicao = (faixa, dia, clima)
+        eixos = tuple(1 + eixo for eixo, valor in enumerate(condicao) if valor is None)
+        indices = tuple(valor for valor in condicao if valor is not None)
+        linhas = (np.arange(len(trechos)),) + indices
+
+        contagem, soma = self.contagem[trechos], self.soma_risco[trechos]
+        total = contagem.sum(axis=(1, 2, 3)).astype(np.float64)
+        soma_total = soma.sum(axis=(1, 2, 3))
+        na_condicao = contagem.sum(axis=eixos)[linhas].astype(np.float64)
+        soma_condicao = soma.sum(axis=eixos)[linhas]
+
+        eixos_malha = tuple(eixo - 1 for eixo in eixos)
+        total_malha = max(float(self.contagem_malha.sum()), 1.0)
+        contagem_malha = self.contagem_malha.sum(axis=eixos_malha)[indices]
+        soma_malha = self.soma_malha.sum(axis=eixos_malha)[indices]
+
+        proporcao_malha = np.asarray(contagem_malha / total_malha, dtype=np.float64)
+        proporcao = (na_condicao + PESO_PROPORCAO * proporcao_malha) / (total + PESO_PROPORCAO)
+        fator = np.divide(proporcao, proporcao_malha, out=np.ones_like(proporcao), where=proporcao_malha > 0)
+        fator = np.clip(fator, FATOR_MINIMO, FATOR_MAXIMO)
+
+        # Gravidade esperada na condição: a do trecho, escalada pela da malha nessa condição
+        gravidade_malha = float(self.soma_malha.sum()) / total_malha
+        gravidade_condicao_malha = np.divide(
+            soma_malha, contagem_malha, out=np.full(proporcao_malha.shape, gravidade_malha),
+            where=np.asarray(contagem_malha) > 0
+        )
+        gravidade_trecho = np.divide(soma_total, total, out=np.zeros_like(total), where=total > 0)
+        esperada = gravidade_trecho * gravidade_condicao_malha / max(gravidade_malha, 1e-9)
+        gravidade = (soma_condicao + PESO_GRAVIDADE * esperada) / (na_condicao + PESO_GRAVIDADE)
+
+        risco_base = risco_agrupado(gravidade_trecho, total)
+        risco = np.minimum(risco_agrupado(gravidade, total) * fator, 1.0)
+        return risco, risco_base, fator, na_condicao, total
+
+    def consultar(self, br, uf=None, km_inicio=None, km_fim=None, hora=None, dia=None, clima=None):
+        """Risco de um trecho de BR numa condição, ex.: BR-116 km 200–250, sexta à noite com chuva.
+
+        hora é a hora do dia (0–23) ou o nome da faixa ('noite'); dia é 0–6
+        (segunda = 0) ou o nome ('sexta'); clima é uma condição ('Chuva forte')
+        ou classe. Dimensões em None valem para qualquer condição.
+        """
+        trechos = self.trechos(br, uf, km_inicio, km_fim)
+        if isinstance(hora, (int, np.integer)) or str(hora).strip().lstrip('+-').isdigit():
+            faixa = faixa_horaria(hora)
+        else:
+            faixa = _indice(hora, [nome for nome, _, _ in FAIXAS_HORARIAS], 'Faixa horária')
+        dia = _indice(dia, DIAS_SEMANA, 'Dia da semana')
+        classe = None if clima is None else CLASSES_CLIMA.index(
+            clima if clima in CLASSES_CLIMA else classe_clima(clima)
+        )
+
+        resultado = {'br': int(br), 'uf': uf, 'km_inicio': km_inicio, 'km_fim': km_fim, 'trechos': len(trechos),
+                     'acidentes': 0, 'acidentes_condicao': 0, 'risco_base': None, 'risco': None, 'fator': None}
+        if len(trechos) == 0:
+            return resultado
+
+        # Vários trechos: média ponderada pelos acidentes de cada um
+        risco, base, fator, na_condicao, total = self._riscos(trechos, faixa, dia, classe)
+        peso = np.maximum(total, 1)
+        resultado.update({
+            'acidentes': int(total.sum()),
+            'acidentes_condicao': int(na_condicao.sum()),
+            'risco_base': float(np.average(base, weights=peso)),
+            'risco': float(np.average(risco, weights=peso)),
+            'fator': float(np.average(fator, weights=peso)),
+        })
+        return resultado
+
+    def risco_rota(self, indice, coordenadas, partida, duracao_min, clima_rota=None, raio_km=RAIO_CORREDOR_KM,
+                   limite_trechos=5):
+        """Risco da rota condicionado ao horário de passagem e ao clima ao vivo em cada trecho.
+
+        A chegada a cada trecho é estimada pela posição na rota e pela
+        velocidade média (distância / duracao_min); o clima vem dos trechos
+        de ServicoClima.clima_rota, ou é ignorado se clima_rota for None.
+        """
+        # Acidentes a até raio_km da rota; cada trecho fica na posição média dos seus acidentes
+        linhas = indice.corredor(coordenadas, raio_km)
+        linhas = linhas[self.segmento_linha[linhas] >= 0]
+        distancia, _, posicao_linha = distancia_polilinha_km(
+            self.lat_linha[linhas], self.lon_linha[linhas], coordenadas, limite_km=raio_km
+        )
+        dentro = distancia <= raio_km
+        trechos, grupo = np.unique(self.segmento_linha[linhas[dentro]], return_inverse=True)
+        if len(trechos) == 0:
+            return {'risco_condicionado': None, 'risco_sem_condicao': None, 'fator_condicao': None,
+                    'trechos_condicionados': []}
+        posicao = np.bincount(grupo, posicao_linha[dentro]) / np.bincount(grupo)
+
+        minutos = posicao / max(_comprimento(coordenadas), 1e-9) * max(float(duracao_min), 0.0)
+        chegadas = pd.DatetimeIndex([partida + timedelta(minutes=float(m)) for m in minutos])
+
+        classes = None
+        if clima_rota is not None:
+            classes = _classes_ao_longo(clima_rota, posicao)
+
+        risco, base, fator, _, _ = self._riscos(trechos, chegadas.hour.to_numpy() // 6,
+                                                chegadas.dayofweek.to_numpy(), classes)
+        ordem = np.argsort(-risco, kind='stable')[:limite_trechos]
+        return {
+            'risco_condicionado': float(risco.mean()),
+            'risco_sem_condicao': float(base.mean()),
+            'fator_condicao': float(risco.mean() / base.mean()) if base.mean() > 0 else None,
+            'trechos_condicionados': [
+                {
+                    'nome': f"BR-{self.segmentos[t][0]}/{self.segmentos[t][1]} KM "
+                            f"{self.segmentos[t][2]:.0f}-{self.segmentos[t][2] + TAMANHO_SEGMENTO_KM:.0f}",
+                    'coords': (float(self.lat[t]), float(self.lon[t])),
+                    'km_rota': round(float(posicao[i]), 1),
+                    'passagem': chegadas[i].isoformat(timespec='minutes'),
+                    'dia_semana': DIAS_SEMANA[chegadas[i].dayofweek],
+                    'clima': None if classes is None else CLASSES_CLIMA[classes[i]],
+                    'risco': round(float(risco[i]), 3),
+                    'risco_sem_condicao': round(float(base[i]), 3),
+                }
+                for i, t in ((i, trechos[i]) for i in ordem)
+            ]
+        }
+
+
+def _chaves_trechos(base):
+    """Chaves (br, uf, km_inicio) dos acidentes com trecho e a máscara desses acidentes"""
+    com_trecho = np.isfinite(base['br'].to_numpy()) & np.isfinite(base['km_inicio'].to_numpy())
+    chaves = pd.MultiIndex.from_arrays([
+        base['br'].to_numpy()[com_trecho].astype(np.int64),
+        np.asarray(base['uf'].to_numpy()[com_trecho], dtype=object),
+        base['km_inicio'].to_numpy()[com_trecho]
+    ], names=['br', 'uf', 'km_inicio'])
+    return chaves, com_trecho
+
+
+def _trechos_por_br(segmentos, posicoes, por_br=None):
+    """Acrescenta a por_br (sem alterá-lo) os trechos das posições, por BR e UF, ordenados por km"""
+    por_br = {} if por_br is None else {br: dict(por_uf) for br, por_uf in por_br.items()}
+    vazio = (np.empty(0), np.empty(0, dtype=np.int64))
+    for (br, uf), grupo in pd.Series(posicoes, index=segmentos[posicoes]).groupby(level=['br', 'uf']):
+        kms, posicao = por_br.get(int(br), {}).get(str(uf), vazio)
+        kms = np.concatenate((kms, grupo.index.get_level_values('km_inicio').to_numpy()))
+        posicao = np.concatenate((posicao, grupo.to_numpy()))
+        ordem = np.argsort(kms, kind='stable')
+        por_br.setdefault(int(br), {})[str(uf)] = (kms[ordem], posicao[ordem])
+    return por_br
+
+
+def hora_e_dia(df):
+    """Hora (0–23) e dia da semana (segunda = 0) de cada acidente; -1 se desconhecido"""
+    if 'data_hora' in df:
+        data_hora = pd.DatetimeIndex(df['data_hora'])
+        hora = np.where(data_hora.isna(), -1, data_hora.hour.fillna(-1)).astype(np.int64)
+        dia = np.where(data_hora.isna(), -1, data_hora.dayofweek.fillna(-1)).astype(np.int64)
+        return hora, dia
+
+    hora = np.full(len(df), -1, dtype=np.int64)
+    if 'horario' in df:
+        horas = pd.to_numeric(df['horario'].astype(str).str[:2], errors='coerce')
+        hora = horas.fillna(-1).to_numpy(dtype=np.int64)
+    dia = np.full(len(df), -1, dtype=np.int64)
+    if 'dia_semana' in df:
+        nomes = {_sem_acento(nome): posicao for posicao, nome in enumerate(DIAS_SEMANA)}
+        dia = df['dia_semana'].astype(str).map(lambda nome: nomes.get(_sem_acento(nome).strip(), -1))
+        dia = dia.to_numpy(dtype=np.int64)
+    return hora, dia
+
+
+def classes_clima(df):
+    """Índice da classe de clima de cada acidente (categorias classificadas uma vez cada)"""
+    if 'condicao_metereologica' not in df:
+        return np.full(len(df), CLASSES_CLIMA.index('outro'), dtype=np.int64)
+    condicoes = pd.Categorical(df['condicao_metereologica'])
+    classes = np.array([CLASSES_CLIMA.index(classe_clima(c)) for c in condicoes.categories] +
+                       [CLASSES_CLIMA.index('outro')], dtype=np.int64)
+    return classes[condicoes.codes]
+
+
+def _comprimento(coordenadas):
+    coordenadas = np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2)
+    if len(coordenadas) < 2:
+        return 0.0
+    return float(haversine_km(coordenadas[:-1, 0], coordenadas[:-1, 1], coordenadas[1:, 0], coordenadas[1:, 1]).sum())
+
+
+def _classes_ao_longo(clima_rota, posicao_km):
+    """Classe de clima na posição (km) de cada trecho, pela amostra de clima mais próxima"""
+    pontos = clima_rota['pontos']
+    km = np.array([ponto['km'] for ponto in pontos])
+    classes = np.array([CLASSES_CLIMA.index(classe_clima(ponto['clima']['condicao'])) for ponto in pontos])
+    mais_proxima = np.abs(posicao_km[:, None] - km[None, :]).argmin(axis=1)
+    return classes[mais_proxima]
@@ -0,0 +1,148 @@
+"""Leitura tipada dos arquivos de acidentes DataTran (PRF)"""
+import codecs
+import time
+import zipfile
+
+import pandas as pd
+
+# 📐 Schema explícito do DataTran
+COLUNAS_CATEGORICAS = [
+    'dia_semana', 'uf', 'municipio', 'causa_acidente', 'tipo_acidente',
+    'classificacao_acidente', 'fase_dia', 'sentido_via', 'condicao_metereologica',
+    'tipo_pista', 'tracado_via', 'uso_solo', 'regional', 'delegacia', 'uop',
+    'data_inversa', 'horario'
+]
+COLUNAS_CONTAGEM = [
+    'pessoas', 'mortos', 'feridos_leves', 'feridos_graves',
+    'ilesos', 'ignorados', 'feridos', 'veiculos'
+]
+COLUNAS_DECIMAIS = {'km': 'float64', 'latitude': 'float64', 'longitude': 'float64'}
+
+# Inteiros ficam de fora: os tipos nullable deixam o parser C ~2x mais lento,
+# então contagens e BR são inferidos e reduzidos em aplicar_schema
+SCHEMA_DATATRAN = {
+    **COLUNAS_DECIMAIS,
+    **{coluna: 'category' for coluna in COLUNAS_CATEGORICAS},
+}
+
+FORMATOS_DATA_HORA = ('%Y-%m-%d %H:%M:%S', '%d/%m/%Y %H:%M:%S', '%d/%m/%y %H:%M:%S')
+
+TAMANHO_AMOSTRA = 256 * 1024  # 256 KB bastam para achar acentos e o cabeçalho
+
+
+def detectar_formato(amostra):
+    """Detecta encoding e separador a partir de uma amostra de bytes do CSV"""
+    if amostra.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    else:
+        encoding = 'latin-1'  # Decodifica qualquer byte: último recurso
+        for candidato in ('utf-8', 'cp1252'):
+            try:
+                # final=False tolera um caractere multibyte cortado no fim da amostra
+                codecs.getincrementaldecoder(candidato)().decode(amostra, final=False)
+                encoding = candidato
+                break
+            except UnicodeDecodeError:
+                continue
+
+    texto = amostra.decode(encoding, errors='ignore')
+    cabecalho = texto.splitlines()[0] if texto else ''
+    separador = ';' if cabecalho.count(';') >= cabecalho.count(',') else ','
+    return encoding, separador
+
+
+def aplicar_schema(df):
+    """Normaliza tipos de um DataFrame DataTran já lido (CSV ou Excel)"""
+    for coluna, tipo in COLUNAS_DECIMAIS.items():
+        if coluna in df and not pd.api.types.is_float_dtype(df[coluna]):
+            texto = df[coluna].astype(str).str.replace(',', '.', regex=False)
+            df[coluna] = pd.to_numeric(texto, errors='coerce').astype(tipo)
+
+    for coluna in COLUNAS_CONTAGEM:
+        if coluna in df:
+            df[coluna] = pd.to_numeric(df[coluna], errors='coerce').fillna(0).astype('int16')
+
+    if 'br' in df and df['br'].dtype != 'Int16':
+        df['br'] = pd.to_numeric(df['br'], errors='coerce').astype('Int16')
+
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in df and df[coluna].dtype != 'category':
+            df[coluna] = df[coluna].astype('category')
+
+    if 'data_inversa' in df and 'horario' in df:
+        df['data_hora'] = converter_data_hora(df['data_inversa'], df['horario'])
+
+    return df
+
+
+def converter_data_hora(data, horario):
+    """data_inversa + horario -> datetime, no primeiro formato em que alguma linha faz sentido"""
+    texto = data.astype(str) + ' ' + horario.astype(str)
+    for formato in FORMATOS_DATA_HORA:
+        data_hora = pd.to_datetime(texto, format=formato, errors='coerce')
+        if data_hora.notna().any():
+            break
+    return data_hora
+
+
+def ler_csv_datatran(arquivo, encoding, separador):
+    """Lê um CSV do DataTran em uma única passada com o schema explícito"""
+    df = pd.read_csv(
+        arquivo,
+        sep=separador,
+        encoding=encoding,
+        encoding_errors='replace',
+        decimal=',' if separador == ';' else '.',
+        dtype=SCHEMA_DATATRAN,
+        low_memory=False
+    )
+    return aplicar_schema(df)
+
+
+def carregar_zip_datatran(origem):
+    """Lê o primeiro CSV/Excel de um zip do DataTran.
+
+    Retorna (df, info) com encoding, separador, tempo de carga e memória,
+    ou (None, None) se o zip não tiver nenhum arquivo reconhecido.
+    """
+    inicio = time.perf_counter()
+
+    with zipfile.ZipFile(origem) as zip_file:
+        for filename in zip_file.namelist():
+            if filename.endswith('.csv'):
+                with zip_file.open(filename) as file:
+                    encoding, separador = detectar_formato(file.read(TAMANHO_AMOSTRA))
+                with zip_file.open(filename) as file:
+                    df = ler_csv_datatran(file, encoding, separador)
+            elif filename.endswith('.xlsx'):
+                with zip_file.open(filename) as file:
+                    df = aplicar_schema(pd.read_excel(file))
+                encoding, separador = None, None
+            else:
+                continue
+
+            info = {
+                'arquivo': filename,
+                'encoding': encoding,
+                'separador': separador,
+                'linhas': len(df),
+                'tempo_s': time.perf_counter() - inicio,
+                'memoria_mb': df.memory_usage(deep=True).sum() / 1024 ** 2
+            }
+            return df, info
+
+    return None, None
+
+
+def resumo_carga(info):
+    """Texto curto com formato detectado, tempo de carga e memória ocupada"""
+    if info.get('cache') == 'hit':
+        formato = "cache Arrow em disco"
+    elif info['encoding']:
+        formato = f"encoding: {info['encoding']}, separador '{info['separador']}'"
+    else:
+        formato = "Excel"
+    resumo = f"{formato} • {info['tempo_s']:.2f}s • {info['memoria_mb']:.1f} MB"
+    if info.get('acrescimo') is not None:
+        resumo += f" • +{info['acrescimo']:,} acidentes (atualização incremental)"
+    return resumo
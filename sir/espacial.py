@@ -0,0 +1,145 @@
+"""Índice espacial (KD-tree) sobre as coordenadas dos acidentes do DataTran"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+RAIO_TERRA_KM = 6371.0088
+
+# Caixa que contém o Brasil: descarta coordenadas trocadas ou zeradas
+LIMITES_BRASIL = {'lat': (-34.0, 5.5), 'lon': (-74.0, -28.5)}
+
+
+def para_xyz(lat, lon):
+    """Converte lat/lon (graus) em pontos na esfera unitária (x, y, z)"""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def km_para_corda(distancia_km):
+    """Distância sobre a superfície -> corda na esfera unitária (métrica da KD-tree)"""
+    return 2.0 * np.sin(np.minimum(distancia_km / RAIO_TERRA_KM, np.pi) / 2.0)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distância haversine (km) vetorizada entre arrays de pontos"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def densificar(coordenadas, passo_km):
+    """Insere vértices na polilinha para que nenhum trecho passe de passo_km"""
+    pontos = np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2)
+    if len(pontos) < 2:
+        return pontos
+
+    comprimentos = haversine_km(pontos[:-1, 0], pontos[:-1, 1], pontos[1:, 0], pontos[1:, 1])
+    divisoes = np.maximum(np.ceil(comprimentos / passo_km).astype(np.int64), 1)
+
+    # Interpolação linear em lat/lon: suficiente para trechos de poucos km
+    inicio = np.repeat(pontos[:-1], divisoes, axis=0)
+    delta = np.repeat(pontos[1:] - pontos[:-1], divisoes, axis=0)
+    fracao = (np.arange(divisoes.sum()) - np.repeat(np.cumsum(divisoes) - divisoes, divisoes)) / np.repeat(divisoes, divisoes)
+    return np.vstack((inicio + delta * fracao[:, None], pontos[-1:]))
+
+
+# Linhas acrescentadas ficam numa árvore delta até passarem desta fração da principal
+FRACAO_DELTA = 0.25
+
+
+def _coordenadas_validas(df, inicio=0):
+    """Posições (a partir de inicio), lat e lon dos acidentes com coordenadas no Brasil"""
+    lat = df['latitude'].to_numpy(dtype=np.float64, na_value=np.nan)[inicio:]
+    lon = df['longitude'].to_numpy(dtype=np.float64, na_value=np.nan)[inicio:]
+    validas = (
+        np.isfinite(lat) & np.isfinite(lon)
+        & (lat >= LIMITES_BRASIL['lat'][0]) & (lat <= LIMITES_BRASIL['lat'][1])
+        & (lon >= LIMITES_BRASIL['lon'][0]) & (lon <= LIMITES_BRASIL['lon'][1])
+    )
+    return np.flatnonzero(validas) + inicio, lat[validas], lon[validas]
+
+
+def _posicoes_por_br(df, inicio=0):
+    if 'br' not in df:
+        return {}
+    grupos = df['br'].iloc[inicio:].to_frame().groupby('br', observed=True, sort=False).indices
+    return {int(br): np.asarray(posicoes, dtype=np.int64) + inicio for br, posicoes in grupos.items()}
+
+
+class IndiceEspacial:
+    """KD-tree sobre os acidentes com coordenadas válidas + índice invertido por BR.
+
+    Todas as consultas devolvem posições (para df.iloc) na tabela original.
+    Linhas acrescentadas depois (com_acrescimo) vão para uma segunda árvore,
+    pequena, consultada junto com a principal.
+    """
+
+    def __init__(self, df):
+        linhas, lat, lon = _coordenadas_validas(df)
+        self.partes = [(linhas, cKDTree(para_xyz(lat, lon)))]
+        self.linhas = linhas
+        self.inicio_delta = None
+        self.por_br = _posicoes_por_br(df)
+
+    def com_acrescimo(self, df, inicio):
+        """Índice de df, que é a tabela deste índice com linhas novas a partir de inicio.
+
+        A árvore principal é compartilhada; só as linhas acrescentadas (desde
+        o último rebuild) ganham árvore nova. Passando de FRACAO_DELTA da
+        principal, tudo é reconstruído. Este índice continua valendo para a tabela antiga.
+        """
+        inicio_delta = inicio if self.inicio_delta is None else self.inicio_delta
+        linhas_delta, lat, lon = _coordenadas_validas(df, inicio_delta)
+        principal = self.partes[0]
+        if len(linhas_delta) > FRACAO_DELTA * max(len(principal[0]), 1):
+            return IndiceEspacial(df)
+
+        novo = object.__new__(IndiceEspacial)
+        novo.partes = [principal] + ([(linhas_delta, cKDTree(para_xyz(lat, lon)))] if len(linhas_delta) else [])
+        novo.linhas = np.concatenate((principal[0], linhas_delta))
+        novo.inicio_delta = inicio_delta
+        novo.por_br = dict(self.por_br)
+        for br, posicoes in _posicoes_por_br(df, inicio).items():
+            novo.por_br[br] = np.concatenate((novo.por_br[br], posicoes)) if br in novo.por_br else posicoes
+        return novo
+
+    def __len__(self):
+        return len(self.linhas)
+
+    def linhas_br(self, br):
+        """Posições dos acidentes de uma BR (sem varrer a tabela)"""
+        return self.por_br.get(int(br), np.empty(0, dtype=np.int64))
+
+    def vizinhos(self, lat, lon, raio_km):
+        """Posições dos acidentes a até raio_km de um ponto"""
+        ponto = para_xyz([lat], [lon])[0]
+        encontrados = [
+            linhas[np.asarray(arvore.query_ball_point(ponto, km_para_corda(raio_km)), dtype=np.int64)]
+            for linhas, arvore in self.partes
+        ]
+        return np.sort(np.concatenate(encontrados))
+
+    def corredor(self, coordenadas, raio_km):
+        """Posições dos acidentes a até raio_km da polilinha (lista de (lat, lon)).
+
+        A rota é densificada com passo raio_km/2 e cada vértice consulta a árvore
+        com raio sqrt(r² + (passo/2)²), que cobre todo o trecho entre vértices.
+        O excesso é de no máximo ~3% do raio; o refinamento exato
+        ponto-segmento fica a cargo de quem consome o corredor.
+        """
+        passo_km = raio_km / 2.0
+        vertices = densificar(coordenadas, passo_km)
+        if len(vertices) == 0 or len(self.linhas) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        raio_busca = km_para_corda(np.hypot(raio_km, passo_km / 2.0))
+        pontos = para_xyz(vertices[:, 0], vertices[:, 1])
+        encontrados = []
+        for linhas, arvore in self.partes:
+            listas = [lista for lista in arvore.query_ball_point(pontos, raio_busca) if lista]
+            if listas:
+                encontrados.append(linhas[np.unique(np.concatenate(listas).astype(np.int64))])
+        if not encontrados:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(encontrados) if len(encontrados) == 1 else np.unique(np.concatenate(encontrados))
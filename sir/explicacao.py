@@ -0,0 +1,204 @@
+"""Explicação do risco de um ponto a partir dos dados reais do DataTran.
+
+analisar_risco devolve os fatores e recomendações como dados (usado pela API);
+gerar_explicacao_risco monta o HTML dos popups do mapa a partir deles.
+"""
+from sir.agregados import TAMANHO_SEGMENTO_KM, AgregadosRisco
+
+
+def analisar_risco(ponto_risco, agregados=None):
+    """Classificação, fatores identificados e recomendações de um ponto de risco"""
+    risco = ponto_risco.get("risco", 0.3)
+    detalhes = ponto_risco.get("detalhes", {})
+
+    # Análise REAL dos dados do DataTran
+    fatores_identificados = []
+    tipo_problema = "trânsito/acidentes"  # Padrão: problemas de trânsito
+    recomendacoes = []
+
+    # 0. HISTÓRICO DO TRECHO E DO MUNICÍPIO (busca na tabela agregada, sem varrer acidentes)
+    if agregados is not None:
+        if all(detalhes.get(chave) is not None for chave in ('br', 'uf', 'km')):
+            trecho = agregados.segmento(detalhes['br'], detalhes['uf'], detalhes['km'])
+            if trecho:
+                fatores_identificados.append(
+                    f"📊 {trecho['acidentes']} acidente(s) no trecho de {TAMANHO_SEGMENTO_KM} km "
+                    f"({trecho['mortos']} morte(s), {trecho['proporcao_chuva']:.0%} com chuva)"
+                )
+                detalhes = {'proporcao_chuva': trecho['proporcao_chuva'], **detalhes}
+
+        if detalhes.get('uf') and detalhes.get('municipio'):
+            historico_municipio = agregados.municipio(detalhes['uf'], detalhes['municipio'])
+            if historico_municipio:
+                fatores_identificados.append(
+                    f"🏙️ {historico_municipio['acidentes']} acidente(s) e "
+                    f"{historico_municipio['mortos']} morte(s) em {detalhes['municipio']}"
+                )
+
+    # 1. ANÁLISE DE MORTALIDADE/GRAVIDADE
+    mortos = detalhes.get('mortos', 0)
+    feridos_graves = detalhes.get('feridos_graves', 0)
+    feridos_leves = detalhes.get('feridos_leves', 0)
+    total_feridos = detalhes.get('feridos', feridos_graves + feridos_leves)
+
+    if mortos > 0:
+        fatores_identificados.append(f"💀 {mortos} morte(s) em acidentes de trânsito")
+        tipo_problema = "acidentes fatais"
+        recomendacoes.append("🚨 ATENÇÃO MÁXIMA: Local com acidentes mortais")
+
+    if feridos_graves > 0:
+        fatores_identificados.append(f"🏥 {feridos_graves} ferido(s) grave(s)")
+        recomendacoes.append("⚠️ Risco alto de acidentes severos")
+
+    if feridos_leves > 0:
+        fatores_identificados.append(f"🩹 {feridos_leves} ferido(s) leve(s)")
+
+    # 2. ANÁLISE DO TIPO DE ACIDENTE
+    tipo_acidente = str(detalhes.get('tipo_acidente', '')).lower()
+    if tipo_acidente and tipo_acidente != 'n/a':
+        fatores_identificados.append(f"💥 Tipo: {detalhes.get('tipo_acidente', 'N/A')}")
+
+        if any(palavra in tipo_acidente for palavra in ['tombamento', 'capotamento']):
+            recomendacoes.append("🔄 CUIDADO: Curvas perigosas ou velocidade excessiva")
+            recomendacoes.append("🐌 Reduzir velocidade significativamente")
+        elif any(palavra in tipo_acidente for palavra in ['colisão', 'choque']):
+            recomendacoes.append("👀 ATENÇÃO: Manter distância segura")
+            recomendacoes.append("🚦 Cuidado em cruzamentos e ultrapassagens")
+        elif 'atropelamento' in tipo_acidente:
+            recomendacoes.append("🚶 PERIGO: Área com pedestres")
+            recomendacoes.append("👀 Atenção redobrada para pessoas na via")
+
+    # 3. ANÁLISE DA CAUSA DO ACIDENTE
+    causa_acidente = str(detalhes.get('causa_acidente', '')).lower()
+    if causa_acidente and causa_acidente != 'n/a':
+        if any(palavra in causa_acidente for palavra in ['velocidade', 'excesso']):
+            fatores_identificados.append("🏎️ Causa: Velocidade excessiva")
+            recomendacoes.append("🐌 REDUZIR VELOCIDADE obrigatoriamente")
+        elif any(palavra in causa_acidente for palavra in ['sono', 'fadiga', 'cansaço']):
+            fatores_identificados.append("😴 Causa: Sono/fadiga do condutor")
+            recomendacoes.append("☕ Fazer pausas frequentes para descanso")
+        elif any(palavra in causa_acidente for palavra in ['chuva', 'pista molhada']):
+            fatores_identificados.append("🌧️ Causa: Condições climáticas adversas")
+            recomendacoes.append("🌧️ Cuidado extra em dias chuvosos")
+        elif any(palavra in causa_acidente for palavra in ['ultrapassagem', 'conversão']):
+            fatores_identificados.append("🔄 Causa: Manobras perigosas")
+            recomendacoes.append("🚫 Evitar ultrapassagens arriscadas")
+
+    # 4. ANÁLISE DE CONDIÇÕES DA VIA
+    condicao_meteorologica = str(detalhes.get('condicao_metereologica', '')).lower()
+    if 'chuva' in condicao_meteorologica or detalhes.get('proporcao_chuva', 0) >= 0.2:
+        fatores_identificados.append("🌧️ Acidentes em condições de chuva")
+        recomendacoes.append("☔ Extremo cuidado em dias chuvosos")
+
+    tipo_pista = str(detalhes.get('tipo_pista', '')).lower()
+    if 'simples' in tipo_pista:
+        fatores_identificados.append("🛣️ Pista simples (mão dupla)")
+        recomendacoes.append("↔️ Atenção: ultrapassagens em pista dupla")
+    elif 'dupla' in tipo_pista:
+        fatores_identificados.append("🛣️ Pista dupla")
+
+    # 5. CLASSIFICAÇÃO DE RISCO BASEADA EM DADOS REAIS
+    if risco >= 0.8:
+        classificacao = "🔴 CRÍTICO"
+        explicacao_geral = "Este local tem ALTÍSSIMA incidência de acidentes de trânsito"
+        if mortos > 0:
+            explicacao_geral += f" com {mortos} morte(s) registrada(s)"
+    elif risco >= 0.6:
+        classificacao = "🟠 ALTO RISCO"
+        explicacao_geral = "Este local apresenta ALTO índice de acidentes"
+        explicacao_geral += f" ({total_feridos} vítimas registradas)" if total_feridos > 0 else ""
+    elif risco >= 0.4:
+        classificacao = "🟡 RISCO MODERADO"
+        explicacao_geral = "Este local tem ocorrências moderadas de acidentes"
+    else:
+        classificacao = "🟢 RISCO BAIXO"
+        explicacao_geral = "Este local tem baixo histórico de acidentes"
+
+    # 6. RECOMENDAÇÕES ESPECÍFICAS PARA TRÂNSITO (não criminalidade)
+    if risco >= 0.7:
+        recomendacoes_gerais = [
+            "🚨 LOCAL PERIGOSO - máxima atenção",
+            "🐌 Velocidade reduzida obrigatória",
+            "👥 Evitar viajar com sono ou cansaço",
+            "📱 GPS ativo para rotas alternativas"
+        ]
+    elif risco >= 0.5:
+        recomendacoes_gerais = [
+            "⚠️ Atenção redobrada necessária",
+            "🚗 Manter veículo em perfeito estado",
+            "👀 Não usar celular ao dirigir",
+            "⛽ Combustível suficiente"
+        ]
+    else:
+        recomendacoes_gerais = [
+            "✅ Trânsito relativamente seguro",
+            "🚗 Precauções normais de direção",
+            "📍 Respeitar sinalização local"
+        ]
+
+    return {
+        'nome': ponto_risco.get("nome", "Ponto de Risco"),
+        'risco': risco,
+        'classificacao': classificacao,
+        'explicacao_geral': explicacao_geral,
+        'tipo_problema': tipo_problema,
+        'municipio': detalhes.get('municipio', 'N/A'),
+        'fatores': fatores_identificados,
+        'recomendacoes': recomendacoes + recomendacoes_gerais
+    }
+
+
+def gerar_explicacao_risco(ponto_risco, df_datatran=None, agregados=None):
+    """Gera explicação detalhada baseada nos dados REAIS do DataTran"""
+    if agregados is None and df_datatran is not None:
+        agregados = AgregadosRisco(df_datatran)
+    analise = analisar_risco(ponto_risco, agregados)
+
+    # 7. MONTAR EXPLICAÇÃO FOCADA EM DADOS REAIS
+    explicacao_completa = f"""
+<div style='max-width: 400px; font-size: 12px; line-height: 1.4;'>
+    <h4 style='margin: 5px 0; color: #333;'>📍 {analise['nome']}</h4>
+    <h5 style='margin: 5px 0;'>{analise['classificacao']} - Índice: {analise['risco']:.2f}</h5>
+
+    <p style='margin: 5px 0; font-weight: bold; color: #d63384;'>{analise['explicacao_geral']}</p>
+
+    <h6 style='margin: 8px 0 3px 0; color: #dc3545;'>📊 DADOS IDENTIFICADOS:</h6>
+    <ul style='margin: 0; padding-left: 15px; font-size: 11px;'>
+"""
+
+    # Adicionar fatores reais identificados
+    if analise['fatores']:
+        for fator in analise['fatores'][:5]:  # Limitar para não ficar muito grande
+            explicacao_completa += f"<li>{fator}</li>"
+    else:
+        explicacao_completa += "<li>📈 Baseado em análise estatística regional</li>"
+
+    # Adicionar informações da localização
+    if analise['municipio'] != 'N/A':
+        explicacao_completa += f"<li>📍 Município: {analise['municipio']}</li>"
+
+    explicacao_completa += """
+    </ul>
+
+    <h6 style='margin: 8px 0 3px 0; color: #fd7e14;'>⚠️ PRECAUÇÕES RECOMENDADAS:</h6>
+    <ul style='margin: 0; padding-left: 15px; font-size: 11px;'>
+"""
+
+    # Combinar recomendações específicas e gerais
+    for rec in analise['recomendacoes'][:6]:  # Máximo 6 recomendações
+        explicacao_completa += f"<li>{rec}</li>"
+
+    explicacao_completa += f"""
+    </ul>
+
+    <div style='margin: 8px 0; padding: 5px; background: #f8f9fa; border-left: 3px solid #0d6efd;'>
+        <strong>💡 SOBRE OS DADOS:</strong><br>
+        <span style='font-size: 10px;'>
+        Análise baseada em registros reais de acidentes do DataTran/PRF.
+        Este local apresenta padrão de <strong>{analise['tipo_problema']}</strong> que requer atenção especial.
+        </span>
+    </div>
+</div>
+"""
+
+    return explicacao_completa
@@ -0,0 +1,359 @@
+"""Roteamento offline sobre uma malha viária local (extrato do OpenStreetMap) em arrays CSR.
+
+Preparação, uma vez por extrato (fora do app):
+    python -m sir graph sudeste.osm --destino malha.npz
+
+O extrato é o XML do OSM (.osm, .osm.gz ou .osm.bz2). Um .pbf do Geofabrik
+pode ser filtrado e convertido antes com o osmium:
+    osmium tags-filter sudeste-latest.osm.pbf w/highway=motorway,trunk,primary,secondary,tertiary -o sudeste.osm
+
+Só cruzamentos e pontas de via viram nós; os pontos entre eles ficam como
+geometria da aresta, marcada como federal quando o ref da via tem uma BR.
+Com SIR_GRAFO=<malha.npz>, rota_estradas e rotas_alternativas roteiam em
+processo, sem rede.
+
+A consulta é um A*: o Dijkstra do scipy (em C) sobre os custos reduzidos
+pelo potencial h(v) = linha reta até o destino na velocidade máxima da malha,
+limitado aos nós que o A* visitaria.
+"""
+import bz2
+import gzip
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+from scipy.spatial import cKDTree
+
+from sir.cache import gravar_atomico
+from sir.espacial import haversine_km, para_xyz
+
+# Velocidade (km/h) por classe de via quando o OSM não traz maxspeed
+VELOCIDADES_PADRAO = {
+    'motorway': 110, 'motorway_link': 60,
+    'trunk': 100, 'trunk_link': 50,
+    'primary': 80, 'primary_link': 40,
+    'secondary': 60, 'secondary_link': 40,
+    'tertiary': 50, 'tertiary_link': 30,
+    'unclassified': 40, 'residential': 30,
+}
+
+# Classes roteáveis por padrão: rodovias e seus acessos, sem as ruas locais
+CLASSES_PADRAO = tuple(classe for classe in VELOCIDADES_PADRAO if classe not in ('unclassified', 'residential'))
+
+# Do endereço até o nó mais próximo da malha: velocidade do trecho de acesso e distância máxima
+VELOCIDADE_ACESSO_KMH = 30
+DISTANCIA_MAXIMA_ACESSO_KM = 25
+
+# Alternativas: os arcos das rotas já achadas ficam mais caros, e rotas quase iguais são descartadas
+PENALIDADE_ALTERNATIVA = 1.4
+SOBREPOSICAO_MAXIMA = 0.8
+
+FONTE = 'Malha local (offline)'
+
+
+def _abrir(caminho):
+    if caminho.endswith('.gz'):
+        return gzip.open(caminho, 'rb')
+    if caminho.endswith('.bz2'):
+        return bz2.open(caminho, 'rb')
+    return open(caminho, 'rb')
+
+
+def _elementos(caminho, tag):
+    """Elementos <tag> do XML do OSM, um por vez; os já lidos são liberados (memória constante)"""
+    with _abrir(caminho) as arquivo:
+        contexto = ET.iterparse(arquivo, events=('start', 'end'))
+        _, raiz = next(contexto)
+        for evento, elemento in contexto:
+            if evento == 'end' and elemento.tag in ('node', 'way', 'relation'):
+                if elemento.tag == tag:
+                    yield elemento
+                raiz.clear()
+
+
+def _velocidade(tags):
+    """maxspeed da via (km/h ou mph), senão a velocidade padrão da classe"""
+    numero = re.match(r'\s*(\d+(?:\.\d+)?)\s*(mph)?', tags.get('maxspeed', ''))
+    if numero and float(numero.group(1)) > 0:
+        return float(numero.group(1)) * (1.609344 if numero.group(2) else 1.0)
+    return VELOCIDADES_PADRAO.get(tags['highway'], 30)
+
+
+def _sentido(tags):
+    """1: só no sentido dos nós da via, -1: só no contrário, 0: mão dupla"""
+    oneway = tags.get('oneway', '')
+    if oneway in ('yes', 'true', '1'):
+        return 1
+    if oneway == '-1':
+        return -1
+    if oneway == 'no':
+        return 0
+    return 1 if tags['highway'] in ('motorway', 'motorway_link') or tags.get('junction') == 'roundabout' else 0
+
+
+def ler_osm(caminho, classes=CLASSES_PADRAO):
+    """Vias roteáveis do extrato: (nós das vias em sequência, nós por via, velocidade, sentido, federal, lat, lon).
+
+    Duas passadas pelo arquivo: primeiro as vias, depois só os nós que elas
+    usam. Os nós vêm como posições em lat/lon; nós fora do extrato ficam NaN.
+    """
+    classes = set(classes)
+    refs, tamanhos, velocidades, sentidos, federais = [], [], [], [], []
+    for via in _elementos(caminho, 'way'):
+        tags = {tag.get('k'): tag.get('v') for tag in via.iter('tag')}
+        if tags.get('highway') not in classes:
+            continue
+        nos = [int(nd.get('ref')) for nd in via.iter('nd')]
+        if len(nos) >= 2:
+            refs.extend(nos)
+            tamanhos.append(len(nos))
+            velocidades.append(_velocidade(tags))
+            sentidos.append(_sentido(tags))
+            federais.append(bool(re.search(r'\bBR[- ]?\d', tags.get('ref', ''))))
+
+    refs = np.asarray(refs, dtype=np.int64)
+    ids = np.unique(refs)
+    posicoes = dict(zip(ids.tolist(), range(len(ids))))
+    lat, lon = np.full(len(ids), np.nan), np.full(len(ids), np.nan)
+    for no in _elementos(caminho, 'node'):
+        posicao = posicoes.get(int(no.get('id')))
+        if posicao is not None:
+            lat[posicao], lon[posicao] = float(no.get('lat')), float(no.get('lon'))
+    return (np.searchsorted(ids, refs), np.asarray(tamanhos, dtype=np.int64),
+            np.asarray(velocidades, dtype=np.float64), np.asarray(sentidos, dtype=np.int8),
+            np.asarray(federais, dtype=bool), lat, lon)
+
+
+def _arestas(nos, tamanhos, validos, corte):
+    """Vias cortadas nos cruzamentos: (pontos de todas as arestas, início de cada aresta, via de cada aresta)"""
+    pontos, inicios, vias = [], [], []
+    validos, corte = validos.tolist(), corte.tolist()
+    inicio = 0
+    for via, tamanho in enumerate(tamanhos.tolist()):
+        trecho = []
+        for no in nos[inicio:inicio + tamanho].tolist():
+            if not validos[no]:
+                trecho = []  # Via cortada na borda do extrato
+                continue
+            trecho.append(no)
+            if corte[no] and len(trecho) > 1:
+                inicios.append(len(pontos))
+                pontos.extend(trecho)
+                vias.append(via)
+                trecho = [no]
+        inicio += tamanho
+    inicios.append(len(pontos))
+    return np.asarray(pontos, dtype=np.int64), np.asarray(inicios, dtype=np.int64), np.asarray(vias, dtype=np.int64)
+
+
+class GrafoViario:
+    """Malha viária dirigida em CSR: nós (lat/lon), arcos com tempo e distância, e a geometria de cada arco.
+
+    Arcos de ida e volta da mesma via compartilham a aresta (geometria e
+    marca de rodovia federal; federal é None em malhas preparadas sem ela).
+    """
+
+    def __init__(self, lat, lon, indptr, destino, tempo_min, distancia_km, aresta, invertida,
+                 geometria_ptr, geometria, federal=None, caminho=None):
+        self.lat = lat
+        self.lon = lon
+        self.indptr = indptr
+        self.destino = destino
+        self.tempo_min = tempo_min
+        self.distancia_km = distancia_km
+        self.aresta = aresta
+        self.invertida = invertida
+        self.geometria_ptr = geometria_ptr
+        self.geometria = geometria
+        self.federal = federal
+        self.caminho = caminho
+
+        self.origem = np.repeat(np.arange(len(lat), dtype=np.int64), np.diff(indptr))
+        self._chave = self.origem * len(lat) + destino  # Arcos ordenados por (origem, destino)
+        self.velocidade_maxima = float(np.max(distancia_km / tempo_min * 60.0)) if len(tempo_min) else 1.0
+        self._arvore = cKDTree(para_xyz(lat, lon))
+
+    @classmethod
+    def de_vias(cls, nos, tamanhos, velocidades, sentidos, federais, lat, lon):
+        """Grafo das vias de ler_osm; fica só a maior parte fortemente conexa (toda rota tem volta)"""
+        validos = np.isfinite(lat) & np.isfinite(lon)
+        fins = np.cumsum(tamanhos)
+        corte = np.bincount(nos, minlength=len(lat)) >= 2
+        corte[nos[fins - tamanhos]] = True
+        corte[nos[fins - 1]] = True
+        pontos, inicios, vias = _arestas(nos, tamanhos, validos, corte)
+
+        segmentos = haversine_km(lat[pontos[:-1]], lon[pontos[:-1]], lat[pontos[1:]], lon[pontos[1:]])
+        acumulado = np.concatenate(([0.0], np.cumsum(segmentos)))
+        comprimento = acumulado[inicios[1:] - 1] - acumulado[inicios[:-1]]
+        ponta_a, ponta_b = pontos[inicios[:-1]], pontos[inicios[1:] - 1]
+
+        # Arcos: mão dupla vira dois, mão única um; laços não levam a lugar nenhum
+        ida = (sentidos[vias] >= 0) & (ponta_a != ponta_b)
+        volta = (sentidos[vias] <= 0) & (ponta_a != ponta_b)
+        arestas = np.concatenate((np.flatnonzero(ida), np.flatnonzero(volta)))
+        invertida = np.concatenate((np.zeros(ida.sum(), dtype=bool), np.ones(volta.sum(), dtype=bool)))
+        de = np.where(invertida, ponta_b[arestas], ponta_a[arestas])
+        para = np.where(invertida, ponta_a[arestas], ponta_b[arestas])
+        distancia = comprimento[arestas]
+        tempo = distancia / velocidades[vias[arestas]] * 60.0
+
+        # Arcos paralelos: fica o mais rápido
+        ordem = np.lexsort((tempo, para, de))
+        primeiro = np.ones(len(ordem), dtype=bool)
+        primeiro[1:] = (de[ordem][1:] != de[ordem][:-1]) | (para[ordem][1:] != para[ordem][:-1])
+        ordem = ordem[primeiro]
+        if not len(ordem):
+            raise ValueError('Nenhuma via roteável no extrato')
+
+        # Maior componente fortemente conexa, com os nós renumerados em ordem
+        usados, de_usado = np.unique(np.concatenate((de[ordem], para[ordem])), return_inverse=True)
+        de_usado, para_usado = de_usado[:len(ordem)], de_usado[len(ordem):]
+        matriz = csr_matrix((np.ones(len(ordem)), (de_usado, para_usado)), shape=(len(usados), len(usados)))
+        _, componentes = connected_components(matriz, directed=True, connection='strong')
+        manter = componentes == np.bincount(componentes).argmax()
+        novo = np.cumsum(manter) - 1
+        arco_mantido = manter[de_usado] & manter[para_usado]
+        ordem, de_novo, para_novo = ordem[arco_mantido], novo[de_usado[arco_mantido]], novo[para_usado[arco_mantido]]
+        nos_grafo = usados[manter]
+
+        # Geometria só das arestas que sobraram
+        arestas_usadas, aresta_arco = np.unique(arestas[ordem], return_inverse=True)
+        tamanho_geometria = inicios[arestas_usadas + 1] - inicios[arestas_usadas]
+        geometria_ptr = np.concatenate(([0], np.cumsum(tamanho_geometria)))
+        indices_pontos = np.repeat(inicios[arestas_usadas] - geometria_ptr[:-1], tamanho_geometria) + \
+            np.arange(geometria_ptr[-1])
+        pontos_usados = pontos[indices_pontos]
+
+        return cls(
+            lat[nos_grafo], lon[nos_grafo],
+            np.searchsorted(de_novo, np.arange(len(nos_grafo) + 1)).astype(np.int64),
+            para_novo.astype(np.int32), tempo[ordem], distancia[ordem],
+            aresta_arco.astype(np.int32), invertida[ordem], geometria_ptr.astype(np.int64),
+            np.column_stack((lat[pontos_usados], lon[pontos_usados])).astype(np.float32),
+            federais[vias[arestas_usadas]]
+        )
+
+    @classmethod
+    def do_osm(cls, caminho, classes=CLASSES_PADRAO):
+        return cls.de_vias(*ler_osm(caminho, classes))
+
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho) as arquivo:
+            return cls(*(arquivo[nome] for nome in (
+                'lat', 'lon', 'indptr', 'destino', 'tempo_min', 'distancia_km', 'aresta', 'invertida',
+                'geometria_ptr', 'geometria'
+            )), federal=arquivo['federal'] if 'federal' in arquivo else None, caminho=caminho)
+
+    def salvar(self, caminho):
+        def escrever(temporario):
+            arrays = {} if self.federal is None else {'federal': self.federal}
+            with open(temporario, 'wb') as arquivo:
+                np.savez(
+                    arquivo, lat=self.lat, lon=self.lon, indptr=self.indptr, destino=self.destino,
+                    tempo_min=self.tempo_min, distancia_km=self.distancia_km, aresta=self.aresta,
+                    invertida=self.invertida, geometria_ptr=self.geometria_ptr, geometria=self.geometria, **arrays
+                )
+
+        gravar_atomico(caminho, escrever)
+        self.caminho = caminho
+
+    def __len__(self):
+        return len(self.lat)
+
+    def no_mais_proximo(self, lat, lon):
+        """(nó mais próximo do ponto, distância em km)"""
+        _, no = self._arvore.query(para_xyz([lat], [lon])[0])
+        return int(no), float(haversine_km(lat, lon, self.lat[no], self.lon[no]))
+
+    def caminho_minimo(self, origem, destino, custo=None):
+        """Arcos do caminho de menor custo entre dois nós (None se não houver).
+
+        custo (um valor por arco, padrão tempo_min) precisa ser >= tempo_min
+        para o potencial continuar válido: tempo mais penalidades, não menos.
+        """
+        custo = self.tempo_min if custo is None else custo
+        potencial = haversine_km(self.lat, self.lon, self.lat[destino], self.lon[destino]) / \
+            self.velocidade_maxima * 60.0
+        reduzido = np.maximum(custo - potencial[self.origem] + potencial[self.destino], 0.0)
+        matriz = csr_matrix((reduzido, self.destino, self.indptr), shape=(len(self), len(self)))
+
+        # O A* visita os nós com custo reduzido até o do destino, que costuma ficar bem abaixo
+        # do potencial da origem: o limite começa pequeno e dobra até alcançá-lo
+        limite = potencial[origem] / 8 + 5.0
+        while True:
+            distancias, anteriores = dijkstra(matriz, indices=origem, limit=limite, return_predecessors=True)
+            if np.isfinite(distancias[destino]) or np.isinf(limite):
+                break
+            limite = limite * 2 if limite < reduzido.sum() else np.inf
+        if not np.isfinite(distancias[destino]):
+            return None
+
+        nos = [destino]
+        while nos[-1] != origem:
+            nos.append(anteriores[nos[-1]])
+        nos = np.asarray(nos[::-1], dtype=np.int64)
+        return np.searchsorted(self._chave, nos[:-1] * len(self) + nos[1:])
+
+    def _geometria(self, arcos):
+        pedacos = []
+        for posicao, (aresta, invertida) in enumerate(zip(self.aresta[arcos].tolist(), self.invertida[arcos].tolist())):
+            pontos = self.geometria[self.geometria_ptr[aresta]:self.geometria_ptr[aresta + 1]]
+            pontos = pontos[::-1] if invertida else pontos
+            pedacos.append(pontos if posicao == 0 else pontos[1:])
+        return pedacos
+
+    def _rota(self, arcos, origem_coords, destino_coords, acesso_km):
+        distancia = float(self.distancia_km[arcos].sum()) + acesso_km
+        tempo = float(self.tempo_min[arcos].sum()) + acesso_km / VELOCIDADE_ACESSO_KMH * 60.0
+        return {
+            'coordenadas': np.vstack(
+                [np.asarray([origem_coords], dtype=np.float32)] + self._geometria(arcos)
+                + [np.asarray([destino_coords], dtype=np.float32)]
+            ),
+            'distancia_real': round(distancia, 1),
+            'tempo_real': round(tempo, 0),
+            'status': 'sucesso',
+            'fonte': FONTE,
+            'arcos': arcos  # Posições dos arcos na malha: pesos por arco (risco) valem para a rota
+        }
+
+    def rotas(self, origem_coords, destino_coords, maximo=1, custo=None):
+        """Até maximo rotas entre os pontos, a de menor custo primeiro (formato de rota_estradas).
+
+        As alternativas saem de novas buscas com os arcos já usados
+        penalizados; sem rota possível, a lista tem só o erro.
+        """
+        origem, acesso_origem = self.no_mais_proximo(*origem_coords)
+        destino, acesso_destino = self.no_mais_proximo(*destino_coords)
+        if max(acesso_origem, acesso_destino) > DISTANCIA_MAXIMA_ACESSO_KM:
+            return [{'status': 'erro', 'message': f'Ponto a mais de {DISTANCIA_MAXIMA_ACESSO_KM} km da malha local'}]
+
+        custo = self.tempo_min if custo is None else custo
+        penalizado = custo.copy()
+        caminhos = []
+        for _ in range(2 * maximo):
+            arcos = self.caminho_minimo(origem, destino, penalizado if caminhos else custo)
+            if arcos is None:
+                break
+            if all(self._sobreposicao(arcos, anterior) < SOBREPOSICAO_MAXIMA for anterior in caminhos):
+                caminhos.append(arcos)
+            if len(caminhos) == maximo or not len(arcos):
+                break
+            penalizado[arcos] *= PENALIDADE_ALTERNATIVA
+
+        if not caminhos:
+            return [{'status': 'erro', 'message': 'Sem caminho na malha local'}]
+        return [self._rota(arcos, origem_coords, destino_coords, acesso_origem + acesso_destino) for arcos in caminhos]
+
+    def rota(self, origem_coords, destino_coords, custo=None):
+        return self.rotas(origem_coords, destino_coords, 1, custo)[0]
+
+    def _sobreposicao(self, arcos, anteriores):
+        """Fração da distância de arcos que passa pelas mesmas vias de anteriores"""
+        distancias = self.distancia_km[arcos]
+        compartilhada = np.isin(self.aresta[arcos], self.aresta[anteriores])
+        return float(distancias[compartilhada].sum() / max(distancias.sum(), 1e-9))
@@ -0,0 +1,186 @@
+"""Hotspots de acidentes: agrupamento por densidade (DBSCAN) sobre as coordenadas"""
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+from sklearn.cluster import DBSCAN
+
+from sir.agregados import agregar_acidentes, base_acidentes
+from sir.espacial import IndiceEspacial, haversine_km, km_para_corda, para_xyz
+from sir.risco import mais_frequente
+
+# Vizinhança (km) e mínimo de acidentes para formar um hotspot; com eps pequeno
+# os grupos não se encadeiam ao longo de rodovias movimentadas (raio <= ~3 km)
+EPS_KM = 0.3
+MIN_ACIDENTES = 8
+
+COLUNAS_DOMINANTES = ('tipo_acidente', 'causa_acidente', 'municipio', 'uf')
+
+
+def _tabela_hotspots(base):
+    """Uma linha por hotspot (índice 'hotspot') a partir da base de acidentes rotulada"""
+    tabela = agregar_acidentes(base, ['hotspot'], COLUNAS_DOMINANTES)
+
+    # BR dominante (e o km mediano nela) para nomear o hotspot
+    com_br = base.dropna(subset=['br'])
+    tabela['br'] = mais_frequente(com_br['hotspot'].to_numpy(), com_br['br'].to_numpy()).reindex(tabela.index)
+    tabela['km'] = com_br.groupby('hotspot')['km'].median().reindex(tabela.index)
+
+    # Raio: distância do centroide até o acidente mais afastado do grupo
+    centro = tabela.loc[base['hotspot'], ['lat', 'lon']].to_numpy()
+    distancia = haversine_km(centro[:, 0], centro[:, 1], base['lat'].to_numpy(), base['lon'].to_numpy())
+    tabela['raio_km'] = base.assign(distancia=distancia).groupby('hotspot')['distancia'].max()
+    return tabela
+
+
+class Hotspots:
+    """Hotspots pré-calculados (centroide, raio, contagens, tipo/causa dominantes).
+
+    Construído uma vez por versão do dataset. A tabela fica ordenada do
+    hotspot mais para o menos arriscado, e um índice espacial próprio sobre
+    os centroides responde consultas por corredor e por caixa. Com acidentes
+    novos (com_acrescimo) o agrupamento é atualizado só em volta deles.
+    """
+
+    def __init__(self, df, eps_km=EPS_KM, min_acidentes=MIN_ACIDENTES):
+        self.eps_km, self.min_acidentes = eps_km, min_acidentes
+        base = base_acidentes(df)
+        validos = np.isfinite(base['lat'].to_numpy()) & np.isfinite(base['lon'].to_numpy())
+
+        # Por acidente com coordenadas: linha no df, posição 3D, grupo (-1: ruído) e se é núcleo
+        self.linhas = np.flatnonzero(validos)
+        self.xyz = para_xyz(base['lat'].to_numpy()[validos], base['lon'].to_numpy()[validos])
+        self.rotulos = np.full(len(self.linhas), -1)
+        self.nucleo = np.zeros(len(self.linhas), dtype=bool)
+        if len(self.linhas) >= min_acidentes:
+            modelo = DBSCAN(
+                eps=km_para_corda(eps_km), min_samples=min_acidentes, algorithm='kd_tree'
+            ).fit(self.xyz)
+            self.rotulos = modelo.labels_
+            self.nucleo[modelo.core_sample_indices_] = True
+
+        base = base[validos].assign(hotspot=self.rotulos)
+        self._publicar(_tabela_hotspots(base[self.rotulos >= 0]))
+
+    def com_acrescimo(self, df, inicio):
+        """Hotspots de df, que é a tabela destes hotspots com linhas novas a partir de inicio.
+
+        Acidentes novos só mudam a vizinhança de quem está a até eps_km
+        deles: a contagem de núcleo é refeita nesses pontos, grupos ligados
+        por núcleos novos são unidos e só os hotspots que mudaram são
+        reagregados. Os núcleos e seus grupos são os de um DBSCAN completo;
+        um ponto de borda entre dois hotspots pode ficar em qualquer um deles.
+        """
+        novas = base_acidentes(df.iloc[inicio:])
+        validos = np.isfinite(novas['lat'].to_numpy()) & np.isfinite(novas['lon'].to_numpy())
+        if not validos.any():
+            return self  # Nenhum ponto novo: mesmos grupos e mesma tabela
+        novo = object.__new__(Hotspots)
+        novo.eps_km, novo.min_acidentes = self.eps_km, self.min_acidentes
+        novo.linhas = np.concatenate((self.linhas, inicio + np.flatnonzero(validos)))
+        novo.xyz = np.concatenate((
+            self.xyz, para_xyz(novas['lat'].to_numpy()[validos], novas['lon'].to_numpy()[validos])
+        ))
+        antigos = len(self.linhas)
+        rotulos = np.concatenate((self.rotulos, np.full(len(novo.linhas) - antigos, -1)))
+        nucleo = np.concatenate((self.nucleo, np.zeros(len(novo.linhas) - antigos, dtype=bool)))
+
+        # Só os vizinhos dos pontos novos (e eles mesmos) podem virar núcleo
+        arvore = cKDTree(novo.xyz)
+        raio = km_para_corda(self.eps_km)
+        afetados = np.unique(np.concatenate(
+            [np.arange(antigos, len(novo.linhas))] +
+            [np.asarray(v, dtype=np.int64) for v in arvore.query_ball_point(novo.xyz[antigos:], raio)]
+        ))
+        vizinhos = arvore.query_ball_point(novo.xyz[afetados], raio)
+        contagem = np.fromiter((len(v) for v in vizinhos), dtype=np.int64, count=len(afetados))
+        virou_nucleo = afetados[(contagem >= self.min_acidentes) & ~nucleo[afetados]]
+        vizinhos = dict(zip(afetados.tolist(), vizinhos))
+        nucleo[virou_nucleo] = True
+
+        # Núcleos novos sem grupo ganham um; depois os grupos ligados por eles se unem
+        sem_grupo = virou_nucleo[rotulos[virou_nucleo] < 0]
+        grupos = int(rotulos.max()) + 1 if len(rotulos) else 0
+        rotulos[sem_grupo] = np.arange(grupos, grupos + len(sem_grupo))
+        grupos += len(sem_grupo)
+        origem, destino = [], []
+        for ponto in virou_nucleo:
+            ligados = [v for v in vizinhos[ponto] if nucleo[v]]
+            origem.extend([rotulos[ponto]] * len(ligados))
+            destino.extend(rotulos[ligados])
+        ligacoes = coo_matrix((np.ones(len(origem)), (origem, destino)), shape=(grupos, grupos))
+        _, componente = connected_components(ligacoes, directed=False)
+        renumerar = np.append(componente, -1)
+        rotulos = renumerar[rotulos]
+
+        # Bordas: pontos sem grupo perto de um núcleo novo, ou pontos novos perto de qualquer núcleo
+        for ponto in virou_nucleo:
+            vizinhos_ponto = np.asarray(vizinhos[ponto], dtype=np.int64)
+            rotulos[vizinhos_ponto[rotulos[vizinhos_ponto] < 0]] = rotulos[ponto]
+        for ponto in range(antigos, len(novo.linhas)):
+            if rotulos[ponto] < 0:
+                ligados = [v for v in vizinhos[ponto] if nucleo[v]]
+                if ligados:
+                    rotulos[ponto] = rotulos[ligados[0]]
+        novo.rotulos, novo.nucleo = rotulos, nucleo
+
+        # Reagrega os hotspots que ganharam pontos ou se uniram; os demais só trocam de número
+        mudou = np.concatenate((renumerar[self.rotulos] != rotulos[:antigos], rotulos[antigos:] >= 0))
+        unidos = np.flatnonzero(np.bincount(componente, minlength=grupos) > 1)
+        tocados = np.union1d(rotulos[mudou], unidos)
+        tocados = tocados[tocados >= 0]
+        mantidos = self.tabela.assign(hotspot=componente[self.tabela['hotspot'].to_numpy()])
+        mantidos = mantidos[~mantidos['hotspot'].isin(tocados)]
+        pontos = np.flatnonzero(np.isin(rotulos, tocados))
+        mantidos = mantidos.set_index('hotspot')
+        if len(pontos):
+            base = base_acidentes(df.iloc[novo.linhas[pontos]]).assign(hotspot=rotulos[pontos])
+            mantidos = pd.concat((mantidos, _tabela_hotspots(base)))
+        novo._publicar(mantidos)
+        return novo
+
+    def _publicar(self, tabela):
+        """Ordena a tabela (índice: número do hotspot) e monta o índice dos centroides"""
+        self.tabela = tabela.sort_values(['risco', 'acidentes'], ascending=False, kind='stable').reset_index()
+        self.indice = IndiceEspacial(self.tabela.rename(columns={'lat': 'latitude', 'lon': 'longitude'}))
+
+    def __len__(self):
+        return len(self.tabela)
+
+    def no_corredor(self, coordenadas, raio_km):
+        """Hotspots com centroide a até raio_km da rota, do mais arriscado ao menos"""
+        return self.tabela.iloc[self.indice.corredor(coordenadas, raio_km)].sort_index()
+
+    def na_caixa(self, lat_min, lon_min, lat_max, lon_max):
+        """Hotspots com centroide dentro da caixa, do mais arriscado ao menos"""
+        lat, lon = self.tabela['lat'], self.tabela['lon']
+        return self.tabela[(lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)]
+
+
+def pontos_hotspots(tabela, limite=None):
+    """Converte hotspots em pontos de risco (formato de calcular_pontos_risco_reais)"""
+    pontos = []
+    for linha in tabela.head(limite).itertuples(index=False):
+        br = int(linha.br) if np.isfinite(linha.br) else None
+        local = f"BR-{br}/{linha.uf} KM {linha.km:.0f}" if br is not None and np.isfinite(linha.km) else linha.municipio
+        pontos.append({
+            "nome": f"Hotspot {local}",
+            "coords": (float(linha.lat), float(linha.lon)),
+            "risco": float(linha.risco),
+            "detalhes": {
+                "br": br,
+                "km": float(linha.km) if np.isfinite(linha.km) else None,
+                "uf": str(linha.uf),
+                "municipio": str(linha.municipio)[:50],
+                "tipo_acidente": str(linha.tipo_acidente)[:50],
+                "causa_acidente": str(linha.causa_acidente)[:50],
+                "acidentes": int(linha.acidentes),
+                "mortos": int(linha.mortos),
+                "feridos": int(linha.feridos),
+                "feridos_graves": int(linha.feridos_graves),
+                "proporcao_chuva": float(linha.proporcao_chuva),
+                "raio_km": float(linha.raio_km)
+            }
+        })
+    return pontos
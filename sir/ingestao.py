@@ -0,0 +1,313 @@
+"""Ingestão em streaming de zips do DataTran (vários anos) para um armazém Parquet particionado.
+
+Cada CSV de cada zip é lido em blocos de LINHAS_POR_BLOCO linhas, o schema
+de cada ano é normalizado para o atual e cada bloco é repartido em
+<destino>/ano=AAAA/uf=UF/<membro>.parquet. A memória fica limitada ao bloco
+em leitura mais MAX_LINHAS_PENDENTES linhas à espera de virar row group,
+qualquer que seja o tamanho da entrada.
+
+Uso (na raiz do projeto):
+    python -m sir ingest datatran2007.zip datatran2008.zip ... --destino dados/datatran
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+import zipfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from sir.cache import gravar_atomico
+from sir.datatran import (COLUNAS_CATEGORICAS, COLUNAS_CONTAGEM, COLUNAS_DECIMAIS, TAMANHO_AMOSTRA,
+                          converter_data_hora, detectar_formato)
+from sir.risco import risco_acidentes
+
+# Linhas lidas do CSV por vez (como texto, a parte cara em memória)
+LINHAS_POR_BLOCO = 10_000
+
+# Linhas acumuladas por partição antes de gravar um row group
+LINHAS_POR_GRUPO = 20_000
+
+# Teto de linhas esperando em todas as partições; acima dele a maior é gravada
+MAX_LINHAS_PENDENTES = 100_000
+
+ARQUIVO_MANIFESTO = '_ingestao.json'
+
+# Nomes de coluna de anos antigos (já sem acento e em minúsculas) -> nome atual
+ALIASES_COLUNAS = {
+    'condicao_meteorologica': 'condicao_metereologica',
+    'data': 'data_inversa',
+    'hora': 'horario',
+    'lat': 'latitude',
+    'long': 'longitude',
+    'lon': 'longitude',
+}
+
+# Colunas de texto que mudaram de caixa entre anos ('Domingo' x 'domingo')
+COLUNAS_MINUSCULAS = ('dia_semana',)
+
+PARTICOES = pa.schema([('ano', pa.int16()), ('uf', pa.string())])
+
+ESQUEMA_ARMAZEM = pa.schema(
+    [('id', pa.int64()), ('br', pa.int16())]
+    + [(coluna, pa.float64()) for coluna in COLUNAS_DECIMAIS]
+    + [(coluna, pa.int16()) for coluna in COLUNAS_CONTAGEM]
+    + [(coluna, pa.string()) for coluna in COLUNAS_CATEGORICAS if coluna != 'uf']
+    + [('data_hora', pa.timestamp('ns')), ('risco', pa.float64())]
+    + list(PARTICOES)
+)
+
+# Nos arquivos as colunas de partição ficam só no caminho (ano=.../uf=...)
+ESQUEMA_ARQUIVO = pa.schema([campo for campo in ESQUEMA_ARMAZEM if campo.name not in PARTICOES.names])
+
+# Valor de partição nula, o mesmo que o pyarrow usa ao ler partições hive
+PARTICAO_NULA = '__HIVE_DEFAULT_PARTITION__'
+
+
+def _nome_coluna(nome):
+    """Cabeçalho de qualquer ano -> nome atual (sem acento, minúsculo, com aliases)"""
+    texto = unicodedata.normalize('NFKD', str(nome).strip().strip('"').lower())
+    texto = re.sub(r'\W+', '_', ''.join(c for c in texto if not unicodedata.combining(c))).strip('_')
+    return ALIASES_COLUNAS.get(texto, texto)
+
+
+def _ano_do_nome(nome):
+    encontrado = re.search(r'(?<!\d)((?:19|20)\d\d)(?!\d)', os.path.basename(nome))
+    return int(encontrado.group(1)) if encontrado else None
+
+
+def normalizar_bloco(bloco, ano_padrao=None):
+    """Bloco lido como texto, de qualquer ano -> tabela Arrow no schema do armazém"""
+    bloco = bloco.rename(columns=_nome_coluna)
+    bloco = bloco.loc[:, ~bloco.columns.duplicated()]
+    colunas = {}
+
+    def texto(nome):
+        if nome not in bloco:
+            return pd.Series(pd.NA, index=bloco.index, dtype='string')
+        return bloco[nome].astype('string').str.strip().replace('', pd.NA)
+
+    colunas['id'] = pd.to_numeric(texto('id'), errors='coerce').astype('Int64')
+    colunas['br'] = pd.to_numeric(texto('br'), errors='coerce').astype('Int16')
+    for coluna in COLUNAS_DECIMAIS:
+        colunas[coluna] = pd.to_numeric(texto(coluna).str.replace(',', '.', regex=False), errors='coerce')
+    for coluna in COLUNAS_CONTAGEM:
+        colunas[coluna] = pd.to_numeric(texto(coluna), errors='coerce').fillna(0).astype('int16')
+    for coluna in COLUNAS_CATEGORICAS:
+        valores = texto(coluna)
+        colunas[coluna] = valores.str.lower() if coluna in COLUNAS_MINUSCULAS else valores
+    colunas['uf'] = colunas['uf'].str.upper()
+
+    df = pd.DataFrame(colunas)
+    df['data_hora'] = converter_data_hora(df['data_inversa'], df['horario'])
+    df['risco'] = risco_acidentes(df)
+
+    # Ano da partição: da data; sem data, da coluna 'ano' dos arquivos antigos ou do nome do arquivo
+    ano = df['data_hora'].dt.year.astype('Int16')
+    if 'ano' in bloco:
+        ano = ano.fillna(pd.to_numeric(texto('ano'), errors='coerce').astype('Int16'))
+    if ano_padrao is not None:
+        ano = ano.fillna(ano_padrao)
+    df['ano'] = ano
+    return pa.Table.from_pandas(df, schema=ESQUEMA_ARMAZEM, preserve_index=False)
+
+
+class GravadorParticionado:
+    """Um Parquet por partição (ano, uf) para um membro, gravado em row groups.
+
+    Cada bloco é repartido e acumulado por partição; uma partição vira row
+    group ao chegar em LINHAS_POR_GRUPO linhas ou quando o total acumulado
+    passa de MAX_LINHAS_PENDENTES (aí a maior partição é gravada).
+    """
+
+    def __init__(self, destino, chave):
+        self.destino = destino
+        self.chave = chave
+        self._escritores = {}
+        self._pendentes = {}
+        self._linhas_pendentes = 0
+
+    def _caminho(self, particao):
+        pastas = [f"{nome}={PARTICAO_NULA if valor is None else valor}"
+                  for nome, valor in zip(PARTICOES.names, particao)]
+        pasta = os.path.join(self.destino, *pastas)
+        os.makedirs(pasta, exist_ok=True)
+        return os.path.join(pasta, f"{self.chave}.parquet")
+
+    def gravar(self, tabela):
+        chaves = pd.DataFrame({nome: tabela[nome].to_pandas() for nome in PARTICOES.names})
+        for particao, posicoes in chaves.groupby(PARTICOES.names, dropna=False, sort=False).indices.items():
+            particao = tuple(None if pd.isna(valor) else valor for valor in particao)
+            parte = tabela.take(posicoes).drop_columns(PARTICOES.names)
+            self._pendentes.setdefault(particao, []).append(parte)
+            self._linhas_pendentes += parte.num_rows
+            if sum(pendente.num_rows for pendente in self._pendentes[particao]) >= LINHAS_POR_GRUPO:
+                self._descarregar(particao)
+        while self._linhas_pendentes > MAX_LINHAS_PENDENTES:
+            self._descarregar(max(self._pendentes, key=lambda p: sum(t.num_rows for t in self._pendentes[p])))
+
+    def _descarregar(self, particao):
+        partes = self._pendentes.pop(particao, [])
+        if not partes:
+            return
+        tabela = pa.concat_tables(partes)
+        self._linhas_pendentes -= tabela.num_rows
+        if particao not in self._escritores:
+            self._escritores[particao] = pq.ParquetWriter(self._caminho(particao), ESQUEMA_ARQUIVO)
+        self._escritores[particao].write_table(tabela)
+
+    def fechar(self):
+        for particao in list(self._pendentes):
+            self._descarregar(particao)
+        for escritor in self._escritores.values():
+            escritor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.fechar()
+
+
+def membros_datatran(origens):
+    """(zip, membro) de cada CSV/Excel dentro dos zips, na ordem dos argumentos e do zip"""
+    for origem in origens:
+        with zipfile.ZipFile(origem) as zip_file:
+            membros = [info for info in zip_file.infolist() if info.filename.lower().endswith(('.csv', '.xlsx'))]
+        for info in membros:
+            yield origem, info
+
+
+def _chave_membro(origem, info):
+    """Identifica o membro nos nomes de arquivo do armazém e no manifesto"""
+    base = re.sub(r'\W+', '_', f"{os.path.basename(origem)}_{os.path.splitext(info.filename)[0]}")
+    return f"{base}-{hashlib.blake2b(info.filename.encode(), digest_size=4).hexdigest()}"
+
+
+def _blocos_membro(origem, info, linhas_por_bloco, contador):
+    """Tabelas Arrow normalizadas de um membro, um bloco do CSV por vez"""
+    ano_padrao = _ano_do_nome(info.filename) or _ano_do_nome(origem)
+    excel = info.filename.lower().endswith('.xlsx')
+    with zipfile.ZipFile(origem) as zip_file:
+        if not excel:
+            with zip_file.open(info) as arquivo:
+                encoding, separador = detectar_formato(arquivo.read(TAMANHO_AMOSTRA))
+        with zip_file.open(info) as arquivo:
+            if excel:
+                # Excel não é lido em streaming; os anos publicados em Excel são pequenos
+                blocos = [pd.read_excel(arquivo, dtype=str)]
+            else:
+                blocos = pd.read_csv(
+                    arquivo, sep=separador, encoding=encoding, encoding_errors='replace',
+                    dtype=str, chunksize=linhas_por_bloco
+                )
+            for bloco in blocos:
+                tabela = normalizar_bloco(bloco, ano_padrao)
+                contador['linhas'] += tabela.num_rows
+                contador['blocos'] += 1
+                yield tabela
+
+
+def ler_manifesto(destino):
+    """Membros já ingeridos no armazém: {chave: {...}}; vazio se o armazém for novo"""
+    try:
+        with open(os.path.join(destino, ARQUIVO_MANIFESTO), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _gravar_manifesto(destino, manifesto):
+    def escrever(caminho):
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump(manifesto, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+    gravar_atomico(os.path.join(destino, ARQUIVO_MANIFESTO), escrever)
+
+
+def _remover_arquivos_membro(destino, chave):
+    """Apaga os Parquet de uma ingestão anterior do mesmo membro (reingestão não duplica linhas)"""
+    for pasta, _, arquivos in os.walk(destino):
+        for arquivo in arquivos:
+            if arquivo == f"{chave}.parquet":
+                os.remove(os.path.join(pasta, arquivo))
+
+
+def ingerir(origens, destino, linhas_por_bloco=LINHAS_POR_BLOCO, forcar=False, progresso=None):
+    """Ingere todos os CSV/Excel dos zips em destino, particionado por ano e UF.
+
+    Membros já ingeridos com o mesmo conteúdo (CRC e tamanho no zip) são
+    pulados, a menos que forcar seja True. progresso(chave, linhas) é chamado
+    ao fim de cada membro. Retorna as estatísticas da ingestão.
+    """
+    inicio = time.perf_counter()
+    os.makedirs(destino, exist_ok=True)
+    manifesto = ler_manifesto(destino)
+    estatisticas = {'membros': 0, 'pulados': 0, 'linhas': 0, 'blocos': 0}
+
+    for origem, info in membros_datatran(origens):
+        chave = _chave_membro(origem, info)
+        conteudo = {'crc': f"{info.CRC:08x}", 'tamanho': info.file_size}
+        anterior = manifesto.get(chave)
+        if not forcar and anterior and all(anterior.get(campo) == valor for campo, valor in conteudo.items()):
+            estatisticas['pulados'] += 1
+            continue
+
+        _remover_arquivos_membro(destino, chave)
+        contador = {'linhas': 0, 'blocos': 0}
+        with GravadorParticionado(destino, chave) as gravador:
+            for tabela in _blocos_membro(origem, info, linhas_por_bloco, contador):
+                gravador.gravar(tabela)
+
+        manifesto[chave] = {
+            'origem': os.path.basename(origem), 'membro': info.filename, **conteudo,
+            'linhas': contador['linhas'], 'ingerido_em': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        _gravar_manifesto(destino, manifesto)
+        estatisticas['membros'] += 1
+        estatisticas['linhas'] += contador['linhas']
+        estatisticas['blocos'] += contador['blocos']
+        if progresso is not None:
+            progresso(chave, contador['linhas'])
+
+    estatisticas['tempo_s'] = time.perf_counter() - inicio
+    return estatisticas
+
+
+def versao_armazem(destino):
+    """Versão do armazém: hash do manifesto (muda a cada membro ingerido ou reingerido)"""
+    manifesto = ler_manifesto(destino)
+    conteudo = json.dumps(
+        {chave: [membro['crc'], membro['tamanho'], membro['linhas']] for chave, membro in manifesto.items()},
+        sort_keys=True
+    )
+    return hashlib.blake2b(conteudo.encode(), digest_size=16).hexdigest()
+
+
+def ler_armazem(destino, anos=None, ufs=None, colunas=None):
+    """Acidentes do armazém (só os anos e UFs pedidos) no mesmo formato de carregar_zip_datatran.
+
+    Os filtros de ano e UF descartam partições inteiras sem abri-las.
+    """
+    dataset = ds.dataset(destino, format='parquet', partitioning=ds.partitioning(PARTICOES, flavor='hive'),
+                         schema=ESQUEMA_ARMAZEM)
+    filtro = None
+    if anos is not None:
+        filtro = ds.field('ano').isin([int(ano) for ano in anos])
+    if ufs is not None:
+        filtro_uf = ds.field('uf').isin([str(uf).upper() for uf in ufs])
+        filtro = filtro_uf if filtro is None else filtro & filtro_uf
+    tabela = dataset.to_table(columns=colunas, filter=filtro)
+
+    df = tabela.to_pandas(strings_to_categorical=True, self_destruct=True)
+    if 'br' in df:
+        df['br'] = df['br'].astype('Int16')
+    if 'id' in df:
+        df = df.sort_values(['data_hora', 'id'] if 'data_hora' in df else 'id', kind='stable', ignore_index=True)
+    df.attrs['versao'] = versao_armazem(destino)
+    return df
@@ -0,0 +1,265 @@
+"""Pontuação em lote: milhares de pares origem/destino de um CSV ou Parquet.
+
+Etapas, em pipeline:
+  1. geocodificação de cada endereço distinto (cache em disco + fila do Nominatim), na ordem
+     de entrada e numa thread própria: um par segue assim que seus dois endereços resolvem;
+  2. roteamento e clima de cada par em threads, no máximo `concorrencia` ao mesmo tempo;
+  3. corredor de acidentes (CPU) num pool de processos com o DataTran já carregado;
+  4. gravação, na ordem de entrada, em CSV ou Parquet conforme cada linha fica pronta.
+"""
+import csv
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sir import roteamento
+from sir.cache_geocodificacao import normalizar_endereco
+from sir.concorrencia import Prazo
+from sir.pontuacao import (ARQUIVO_DATATRAN, Pontuador, ler_coordenadas, montar_rota, pontos_risco_trajeto,
+                           resumir_clima, resumir_riscos)
+
+# Pares sendo roteados ao mesmo tempo (threads de E/S próprias do lote)
+CONCORRENCIA_PADRAO = 8
+
+# Linhas por row group no Parquet de saída
+LINHAS_POR_GRUPO = 500
+
+COLUNAS_SAIDA = [
+    'linha', 'origem', 'destino', 'status', 'erro', 'distancia_km', 'tempo_estimado', 'fonte_roteamento',
+    'risco_medio', 'pontos_risco', 'pontos_criticos', 'ponto_mais_critico', 'risco_maximo',
+    'risco_climatico', 'pior_trecho_clima'
+]
+
+ESQUEMA_SAIDA = pa.schema([
+    ('linha', pa.int64()), ('origem', pa.string()), ('destino', pa.string()), ('status', pa.string()),
+    ('erro', pa.string()), ('distancia_km', pa.float64()), ('tempo_estimado', pa.string()),
+    ('fonte_roteamento', pa.string()), ('risco_medio', pa.float64()), ('pontos_risco', pa.int64()),
+    ('pontos_criticos', pa.int64()), ('ponto_mais_critico', pa.string()), ('risco_maximo', pa.float64()),
+    ('risco_climatico', pa.float64()), ('pior_trecho_clima', pa.string())
+])
+
+# Pontuador de cada processo do pool (herdado do pai no fork, senão carregado no início)
+_PONTUADOR = None
+
+
+def ler_pares(caminho):
+    """Tabela de entrada (CSV ou Parquet) com as colunas origem e destino, como texto (células vazias = '')"""
+    if str(caminho).lower().endswith('.parquet'):
+        df = pd.read_parquet(caminho, columns=['origem', 'destino']).fillna('')
+    else:
+        df = pd.read_csv(caminho, usecols=['origem', 'destino'], dtype=str, keep_default_na=False)
+    return list(zip(df['origem'].astype(str), df['destino'].astype(str)))
+
+
+def _iniciar_processo(datatran):
+    global _PONTUADOR
+    if _PONTUADOR is None:
+        _PONTUADOR = Pontuador.do_arquivo(datatran)
+
+
+def _pontuar_corredor(coordenadas, origem_nome, destino_nome):
+    """Etapa de CPU, roda no pool de processos: resumo de risco e o pior ponto"""
+    pontos = pontos_risco_trajeto(_PONTUADOR.df, coordenadas, origem_nome, destino_nome, _PONTUADOR.indice)
+    resumo = resumir_riscos(pontos)
+    resumo['ponto_mais_critico'] = pontos[0]['nome'] if pontos else None
+    resumo['risco_maximo'] = pontos[0]['risco'] if pontos else None
+    return resumo
+
+
+class GravadorLote:
+    """Grava as linhas de resultado em CSV (linha a linha) ou Parquet (em row groups)"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.parquet = str(caminho).lower().endswith('.parquet')
+        self._pendentes = []
+        if self.parquet:
+            self._escritor = pq.ParquetWriter(caminho, ESQUEMA_SAIDA)
+        else:
+            self._arquivo = open(caminho, 'w', newline='', encoding='utf-8')
+            self._escritor = csv.DictWriter(self._arquivo, fieldnames=COLUNAS_SAIDA)
+            self._escritor.writeheader()
+
+    def gravar(self, linha):
+        if not self.parquet:
+            self._escritor.writerow(linha)
+            self._arquivo.flush()
+            return
+        self._pendentes.append(linha)
+        if len(self._pendentes) >= LINHAS_POR_GRUPO:
+            self._descarregar()
+
+    def _descarregar(self):
+        if self._pendentes:
+            self._escritor.write_table(pa.Table.from_pylist(self._pendentes, schema=ESQUEMA_SAIDA))
+            self._pendentes = []
+
+    def fechar(self):
+        if self.parquet:
+            self._descarregar()
+        else:
+            self._arquivo.close()
+            return
+        self._escritor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.fechar()
+
+
+def _linha_erro(indice, origem, destino, mensagem):
+    linha = dict.fromkeys(COLUNAS_SAIDA)
+    linha.update({'linha': indice, 'origem': origem, 'destino': destino, 'status': 'erro', 'erro': mensagem})
+    return linha
+
+
+def pontuar_lote(pares, saida, datatran=None, processos=None, concorrencia=CONCORRENCIA_PADRAO, clima=True,
+                 progresso=None):
+    """Pontua cada (origem, destino) e grava uma linha por par em saida, na ordem de entrada.
+
+    Origem e destino podem ser endereços ou 'lat,lon'. progresso(feitos, total,
+    decorrido_s, geocodificados, enderecos) é chamado a cada linha gravada e a
+    cada endereço distinto geocodificado. Retorna as estatísticas do lote.
+    """
+    global _PONTUADOR
+    inicio = time.perf_counter()
+    datatran = datatran or ARQUIVO_DATATRAN
+    processos = processos or os.cpu_count() or 1
+
+    # DataTran e índice carregados no pai antes do pool: no fork os processos herdam sem recarregar
+    _PONTUADOR = Pontuador.do_arquivo(datatran)
+
+    # Endereço normalizado -> futuro da geocodificação ('lat,lon' e células vazias não vão à rede)
+    geocodificacoes = {}
+    for texto in (texto for par in pares for texto in par):
+        if texto.strip() and ler_coordenadas(texto) is None:
+            geocodificacoes.setdefault(normalizar_endereco(texto), texto)
+    estatisticas = {'total': len(pares), 'sucesso': 0, 'erro': 0, 'geocodificados': 0}
+    trava_progresso = threading.Lock()
+
+    def avisar(geocodificado=False):
+        with trava_progresso:
+            estatisticas['geocodificados'] += geocodificado
+            if progresso is not None:
+                progresso(estatisticas['sucesso'] + estatisticas['erro'], len(pares), time.perf_counter() - inicio,
+                          estatisticas['geocodificados'], len(geocodificacoes))
+
+    def localizar(texto):
+        if not texto.strip():
+            return None, texto, 'endereço vazio'
+        coordenadas = ler_coordenadas(texto)
+        if coordenadas is not None:
+            return coordenadas, texto, None
+        try:
+            resultado = geocodificacoes[normalizar_endereco(texto)].result()
+        except Exception as e:
+            return None, texto, f"Erro na geocodificação: {str(e)[:50]}..."
+        if resultado['status'] != 'sucesso':
+            return None, texto, resultado['message']
+        return (resultado['lat'], resultado['lon']), resultado['cidade'], None
+
+    # 2. Roteamento + clima (E/S) de um par; as chamadas internas usam o pool de rede
+    def preparar(origem, destino):
+        origem_coords, origem_nome, erro_origem = localizar(origem)
+        destino_coords, destino_nome, erro_destino = localizar(destino)
+        if erro_origem or erro_destino:
+            return None, '; '.join(
+                f"{rotulo}: {erro}" for rotulo, erro in (('Origem', erro_origem), ('Destino', erro_destino)) if erro
+            )
+        rota = montar_rota(origem_coords, destino_coords, origem_nome, destino_nome,
+                           Prazo(roteamento.PRAZO_BUSCA_S))
+        if clima:
+            rota['clima'] = resumir_clima(_PONTUADOR.servico_clima.clima_rota(rota['coordenadas_rota']))
+        return rota, None
+
+    roteando, pontuando = deque(), deque()
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='sir-geo') as geocodificadores, \
+            ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix='sir-lote') as threads, \
+            ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo,
+                                initargs=(datatran,)) as pool, \
+            GravadorLote(saida) as gravador:
+
+        # Sobe os processos já (no fork, todos de uma vez) antes de haver threads de rede rodando
+        pool.submit(_iniciar_processo, datatran).result()
+
+        # 1. Geocodificação: cada endereço distinto uma vez, numa thread só: a fila do Nominatim (1/s)
+        # dita o ritmo de qualquer jeito e assim os endereços resolvem na ordem de entrada;
+        # os pares esperam só pelos próprios endereços
+        for chave, texto in geocodificacoes.items():
+            geocodificacoes[chave] = geocodificadores.submit(roteamento.geocodificar_endereco, texto)
+            geocodificacoes[chave].add_done_callback(lambda _: avisar(geocodificado=True))
+
+        def encaminhar():
+            """Rota pronta (a mais antiga) -> pool de processos"""
+            indice, origem, destino, futuro = roteando.popleft()
+            try:
+                rota, erro = futuro.result()
+            except Exception as e:
+                rota, erro = None, f"Erro no roteamento: {str(e)[:50]}..."
+            corredor = None
+            if rota is not None:
+                corredor = pool.submit(_pontuar_corredor, rota['coordenadas_rota'],
+                                       rota['origem_nome'], rota['destino_nome'])
+            pontuando.append((indice, origem, destino, rota, erro, corredor))
+
+        def gravar():
+            """Pontuação pronta (a mais antiga) -> arquivo de saída"""
+            indice, origem, destino, rota, erro, corredor = pontuando.popleft()
+            if rota is not None:
+                try:
+                    resumo = corredor.result()
+                except Exception as e:
+                    rota, erro = None, f"Erro na pontuação: {str(e)[:50]}..."
+            if rota is None:
+                linha = _linha_erro(indice, origem, destino, erro)
+            else:
+                linha = dict.fromkeys(COLUNAS_SAIDA)
+                linha.update({
+                    'linha': indice, 'origem': origem, 'destino': destino, 'status': 'sucesso',
+                    'distancia_km': rota['distancia'], 'tempo_estimado': rota['tempo_estimado'],
+                    'fonte_roteamento': rota['fonte_roteamento'], **resumo
+                })
+                if 'clima' in rota:
+                    pior = rota['clima']['pior_trecho']
+                    linha['risco_climatico'] = rota['clima']['risco_climatico']
+                    linha['pior_trecho_clima'] = (
+                        f"km {pior['km_inicio']:.0f}–{pior['km_fim']:.0f} ({pior['condicao']})"
+                    )
+            with trava_progresso:
+                estatisticas[linha['status']] += 1
+            gravador.gravar(linha)
+            avisar()
+
+        def escoar():
+            """Leva adiante, sem esperar, o que já está pronto no começo das filas"""
+            while roteando and roteando[0][3].done():
+                encaminhar()
+            while pontuando and (pontuando[0][5] is None or pontuando[0][5].done()):
+                gravar()
+
+        # Janelas limitadas: a memória não cresce com o tamanho do lote
+        for indice, (origem, destino) in enumerate(pares):
+            roteando.append((indice, origem, destino, threads.submit(preparar, origem, destino)))
+            if len(roteando) > 2 * concorrencia:
+                encaminhar()
+            if len(pontuando) > 2 * processos:
+                gravar()
+            escoar()
+        while roteando:
+            encaminhar()
+            escoar()
+        while pontuando:
+            gravar()
+
+    estatisticas['tempo_s'] = time.perf_counter() - inicio
+    estatisticas['rotas_por_s'] = len(pares) / estatisticas['tempo_s'] if estatisticas['tempo_s'] else None
+    return estatisticas
@@ -0,0 +1,358 @@
+"""Pontuação de risco de rotas sem Streamlit: geocodificação, roteamento, acidentes e clima.
+
+Usado pelo app, pela linha de comando (python -m sir score) e por jobs em
+lote. O Pontuador carrega o DataTran e o índice espacial uma vez e pontua
+quantas rotas forem pedidas.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from sir import roteamento
+from sir.agregados import AgregadosRisco, pontos_segmentos
+from sir.cache import carregar_datatran_cache
+from sir.clima import ServicoClima
+from sir.concorrencia import Prazo
+from sir.cubo import CuboRisco
+from sir.espacial import IndiceEspacial, haversine_km
+from sir.hotspots import pontos_hotspots
+from sir.ingestao import ler_armazem
+from sir.risco import RAIO_CORREDOR_KM, pontos_risco_rota
+from sir.rota_segura import LAMBDA_PADRAO, rota_segura
+from sir.simulacao import simulador_do_ambiente
+
+ARQUIVO_DATATRAN = 'datatran2025.zip'
+
+# Rota em linha reta (fallback do roteamento) não segue a estrada: corredor mais largo
+RAIO_CORREDOR_LINHA_RETA_KM = 50
+
+# Risco a partir do qual um trecho conta como crítico
+LIMIAR_CRITICO = 0.7
+
+# Velocidade da estimativa em linha reta, quando nenhum roteador responde
+VELOCIDADE_LINHA_RETA_KMH = 60
+
+# Pool próprio da pontuação de alternativas: ela espera o clima, que roda no pool de rede
+_POOL_PONTUACAO = ThreadPoolExecutor(max_workers=roteamento.MAX_ALTERNATIVAS, thread_name_prefix='sir-pontuacao')
+
+_COORDENADAS = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def ler_coordenadas(texto):
+    """'lat,lon' -> (lat, lon); None se o texto for um endereço"""
+    encontrado = _COORDENADAS.match(str(texto))
+    if encontrado is None:
+        return None
+    return float(encontrado.group(1)), float(encontrado.group(2))
+
+
+def ler_partida(texto):
+    """'2025-06-13T22:00' (ISO) ou 'agora' -> datetime da partida"""
+    if texto is None or str(texto).strip().lower() == 'agora':
+        return datetime.now()
+    try:
+        return datetime.fromisoformat(str(texto).strip())
+    except ValueError:
+        raise ValueError(f"Partida inválida (use AAAA-MM-DDTHH:MM ou 'agora'): {texto}") from None
+
+
+def formatar_tempo(minutos):
+    """Minutos -> '2h15min' ou '45min'"""
+    if minutos >= 60:
+        return f"{int(minutos // 60)}h{int(minutos % 60)}min"
+    return f"{int(minutos)}min"
+
+
+def montar_rota(origem_coords, destino_coords, origem_nome, destino_nome, prazo=None):
+    """Rota por estradas entre duas coordenadas; sem roteador, estimativa em linha reta"""
+    rota_real = roteamento.rota_estradas(origem_coords, destino_coords, prazo)
+    return _rota_montada(rota_real, origem_coords, destino_coords, origem_nome, destino_nome)
+
+
+def montar_rota_segura(origem_coords, destino_coords, origem_nome, destino_nome, df, lambda_risco=LAMBDA_PADRAO,
+                       condicao='geral', prazo=None):
+    """Rota de menor tempo + λ·risco de acidentes na malha local (formato de montar_rota).
+
+    A chave 'rota_segura' compara com a rota mais rápida; sem malha local
+    (SIR_GRAFO), sem acidentes ou com um dos pontos fora da malha, é a rota
+    normal com 'rota_segura' None.
+    """
+    grafo = roteamento.grafo_local()
+    if grafo is not None and df is not None:
+        rota_real = rota_segura(grafo, df, origem_coords, destino_coords, lambda_risco, condicao)
+        if rota_real['status'] == 'sucesso':
+            rota = _rota_montada(rota_real, origem_coords, destino_coords, origem_nome, destino_nome)
+            return {**rota, 'rota_segura': rota_real['rota_segura']}
+    return {**montar_rota(origem_coords, destino_coords, origem_nome, destino_nome, prazo), 'rota_segura': None}
+
+
+def montar_alternativas(origem_coords, destino_coords, origem_nome, destino_nome, prazo=None,
+                        maximo=roteamento.MAX_ALTERNATIVAS):
+    """A rota principal e as alternativas por estradas (formato de montar_rota); sem roteador, só a linha reta"""
+    return [
+        _rota_montada(rota_real, origem_coords, destino_coords, origem_nome, destino_nome)
+        for rota_real in roteamento.rotas_alternativas(origem_coords, destino_coords, prazo, maximo)
+    ]
+
+
+def _rota_montada(rota_real, origem_coords, destino_coords, origem_nome, destino_nome):
+    if rota_real['status'] == 'sucesso':
+        distancia = rota_real['distancia_real']
+        tempo_minutos = rota_real['tempo_real']
+        tempo_formatado = formatar_tempo(tempo_minutos)
+        coordenadas_rota = rota_real['coordenadas']
+        fonte_info = rota_real['fonte']
+    else:
+        distancia = round(float(haversine_km(origem_coords[0], origem_coords[1],
+                                             destino_coords[0], destino_coords[1])), 1)
+        tempo_estimado = distancia / VELOCIDADE_LINHA_RETA_KMH
+        tempo_minutos = tempo_estimado * 60
+        tempo_formatado = f"{int(tempo_estimado)}h{int((tempo_estimado % 1) * 60)}min"
+        coordenadas_rota = [origem_coords, destino_coords]
+        fonte_info = "Estimativa (linha reta)"
+
+    return {
+        'distancia': distancia,
+        'tempo_estimado': tempo_formatado,
+        'tempo_minutos': tempo_minutos,
+        'origem_nome': origem_nome,
+        'destino_nome': destino_nome,
+        'origem_coords': origem_coords,
+        'destino_coords': destino_coords,
+        'coordenadas_rota': coordenadas_rota,
+        'fonte_roteamento': fonte_info,
+        'personalizada': True
+    }
+
+
+def pontos_risco_trajeto(df, coordenadas, origem_nome, destino_nome, indice=None):
+    """Trechos de risco ao longo da geometria da rota (corredor largo se for linha reta)"""
+    if df is None or coordenadas is None or len(coordenadas) == 0:
+        return []
+
+    raio_km = RAIO_CORREDOR_KM if len(coordenadas) > 2 else RAIO_CORREDOR_LINHA_RETA_KM
+    pontos = pontos_risco_rota(df, coordenadas, indice, raio_km=raio_km)
+    for ponto in pontos:
+        ponto["detalhes"]["rota"] = f"{origem_nome} → {destino_nome}"
+    return pontos
+
+
+def pontos_risco_corredor(df, coordenadas, brs=None, indice=None, raio_km=RAIO_CORREDOR_LINHA_RETA_KM,
+                          agregados=None, hotspots=None, limite_hotspots=None, limite_por_br=10):
+    """Hotspots no corredor da rota (nas BRs pedidas; todas, se brs for None).
+
+    Sem hotspots, os trechos agregados mais arriscados de cada BR: os do
+    corredor, com índice espacial e geometria, ou a BR inteira.
+    """
+    pontos = []
+    if hotspots is not None and coordenadas is not None:
+        no_corredor = hotspots.no_corredor(coordenadas, raio_km)
+        if brs is not None:
+            no_corredor = no_corredor[no_corredor['br'].isin(brs)]
+        pontos.extend(pontos_hotspots(no_corredor, limite=limite_hotspots))
+
+    if df is not None and not pontos:
+        if agregados is None:
+            agregados = AgregadosRisco(df)
+
+        # Trechos com acidentes dentro do corredor da rota, consultados no índice espacial
+        trechos_corredor = None
+        if indice is not None and coordenadas is not None:
+            trechos_corredor = agregados.segmentos_das_linhas(indice.corredor(coordenadas, raio_km))
+        if brs is None:
+            brs = [] if trechos_corredor is None else trechos_corredor.index.get_level_values('br').unique()
+
+        # Os trechos mais arriscados de cada BR: busca na tabela agregada, sem sorteio
+        for br in brs:
+            if trechos_corredor is not None:
+                trechos_br = trechos_corredor[trechos_corredor.index.get_level_values('br') == br]
+            else:
+                trechos_br = agregados.segmentos_br(br)
+            pontos.extend(pontos_segmentos(trechos_br, limite=limite_por_br))
+    return pontos
+
+
+def resumir_riscos(pontos):
+    """Risco médio e número de pontos críticos; risco_medio é None sem pontos"""
+    riscos = [ponto["risco"] for ponto in pontos]
+    return {
+        'risco_medio': float(np.mean(riscos)) if riscos else None,
+        'pontos_risco': len(riscos),
+        'pontos_criticos': sum(risco >= LIMIAR_CRITICO for risco in riscos)
+    }
+
+
+def ranking_pareto(resultados):
+    """Ordena rotas pontuadas por tempo x risco (fronteira de Pareto primeiro).
+
+    O risco de cada rota é o condicionado à partida, se houver, ou o risco
+    médio (0 sem pontos de risco). Cada resultado ganha 'risco_ranking' e
+    'camada_pareto': 1 para as rotas que nenhuma outra supera em tempo e
+    risco ao mesmo tempo, 2 para as que só as da camada 1 superam, e assim
+    por diante. Dentro da camada, da mais rápida para a mais lenta.
+    """
+    for resultado in resultados:
+        risco = resultado.get('risco_condicionado')
+        resultado['risco_ranking'] = float(risco if risco is not None else resultado['risco_medio'] or 0.0)
+
+    restantes, camada = list(resultados), 1
+    while restantes:
+        fronteira = [
+            resultado for resultado in restantes
+            if not any(_domina(outro, resultado) for outro in restantes)
+        ]
+        for resultado in fronteira:
+            resultado['camada_pareto'] = camada
+        restantes = [resultado for resultado in restantes if resultado not in fronteira]
+        camada += 1
+    return sorted(resultados, key=lambda resultado: (resultado['camada_pareto'], resultado['tempo_minutos']))
+
+
+def _domina(rota, outra):
+    """rota não é pior que outra em tempo nem em risco, e é melhor em pelo menos um"""
+    tempo, risco = rota['tempo_minutos'], rota['risco_ranking']
+    tempo_outra, risco_outra = outra['tempo_minutos'], outra['risco_ranking']
+    return tempo <= tempo_outra and risco <= risco_outra and (tempo < tempo_outra or risco < risco_outra)
+
+
+def resumir_clima(clima_rota):
+    """Risco climático médio dos trechos e o pior trecho da rota"""
+    trechos = clima_rota['trechos'] or [{
+        'km_inicio': 0.0, 'km_fim': 0.0,
+        'risco_climatico': clima_rota['pontos'][0]['clima']['risco_climatico'],
+        'condicao': clima_rota['pontos'][0]['clima']['condicao']
+    }]
+    return {
+        'risco_climatico': float(np.mean([trecho['risco_climatico'] for trecho in trechos])),
+        'pior_trecho': max(trechos, key=lambda trecho: trecho['risco_climatico'])
+    }
+
+
+class Pontuador:
+    """DataTran, índice espacial, cubo condicionado e serviço de clima carregados uma vez, para várias rotas.
+
+    Sem DataTran (df None) a pontuação traz só rota e clima.
+    """
+
+    def __init__(self, df=None, indice=None, servico_clima=None, cubo=None):
+        self.df = df
+        self.indice = indice if indice is not None or df is None else IndiceEspacial(df)
+        self.cubo = cubo if cubo is not None or df is None else CuboRisco(df)
+        self.servico_clima = servico_clima or ServicoClima(
+            os.environ.get('WEATHER_API_KEY'), simulador_do_ambiente()
+        )
+
+    @classmethod
+    def do_arquivo(cls, origem=ARQUIVO_DATATRAN):
+        """Pontuador com o DataTran do zip (ou do cache), ou da pasta do armazém; sem o arquivo, sem acidentes"""
+        if origem is None or not os.path.exists(origem):
+            return cls()
+        if os.path.isdir(origem):
+            return cls(ler_armazem(origem))
+        df, _ = carregar_datatran_cache(origem)
+        return cls(df)
+
+    def pontuar_rota(self, rota, clima=True, limite_pontos=5, partida=None):
+        """Resumo de risco de uma rota já montada (formato de montar_rota).
+
+        Com partida (datetime), inclui o risco condicionado ao horário de
+        passagem e ao clima atual em cada trecho da rota.
+        """
+        pontos = pontos_risco_trajeto(
+            self.df, rota['coordenadas_rota'], rota['origem_nome'], rota['destino_nome'], self.indice
+        )
+        resultado = {
+            'origem': rota['origem_nome'],
+            'destino': rota['destino_nome'],
+            'origem_coords': tuple(float(c) for c in rota['origem_coords']),
+            'destino_coords': tuple(float(c) for c in rota['destino_coords']),
+            'distancia_km': rota['distancia'],
+            'tempo_estimado': rota['tempo_estimado'],
+            'tempo_minutos': float(rota['tempo_minutos']),
+            'fonte_roteamento': rota['fonte_roteamento'],
+            **resumir_riscos(pontos),
+            'principais_pontos': [
+                {
+                    'nome': ponto['nome'],
+                    'risco': round(ponto['risco'], 3),
+                    'coords': ponto['coords'],
+                    'acidentes': ponto['detalhes']['acidentes'],
+                    'mortos': ponto['detalhes']['mortos']
+                }
+                for ponto in pontos[:limite_pontos]
+            ]
+        }
+        clima_rota = self.servico_clima.clima_rota(rota['coordenadas_rota']) if clima else None
+        if clima_rota is not None:
+            resultado.update(resumir_clima(clima_rota))
+        if partida is not None and self.cubo is not None:
+            raio_km = RAIO_CORREDOR_KM if len(rota['coordenadas_rota']) > 2 else RAIO_CORREDOR_LINHA_RETA_KM
+            resultado['partida'] = partida.isoformat(timespec='minutes')
+            resultado.update(self.cubo.risco_rota(
+                self.indice, rota['coordenadas_rota'], partida, rota['tempo_minutos'], clima_rota,
+                raio_km=raio_km, limite_trechos=limite_pontos
+            ))
+        return resultado
+
+    def rota(self, origem, destino, prazo=None):
+        """Rota entre dois locais (endereço, 'lat,lon' ou tupla); erro de geocodificação vira ValueError"""
+        prazo = prazo or Prazo(roteamento.PRAZO_BUSCA_S)
+        return montar_rota(*self._locais(origem, destino, prazo), prazo)
+
+    def _locais(self, origem, destino, prazo):
+        """(origem_coords, destino_coords, origem_nome, destino_nome), geocodificando os endereços"""
+        locais = [ler_coordenadas(local) if isinstance(local, str) else tuple(local) for local in (origem, destino)]
+        enderecos = [texto for texto, local in zip((origem, destino), locais) if local is None]
+        geocodificados = iter(roteamento.geocodificar_lote(enderecos, prazo) if enderecos else [])
+
+        coordenadas, nomes = [], []
+        for rotulo, local in zip(('Origem', 'Destino'), locais):
+            if local is None:
+                resultado = next(geocodificados)
+                if resultado['status'] != 'sucesso':
+                    raise ValueError(f"{rotulo}: {resultado['message']}")
+                local, nome = (resultado['lat'], resultado['lon']), resultado['cidade']
+            else:
+                nome = f"{local[0]:.4f},{local[1]:.4f}"
+            coordenadas.append(local)
+            nomes.append(nome)
+        return coordenadas[0], coordenadas[1], nomes[0], nomes[1]
+
+    def pontuar_rotas(self, rotas, clima=True, partida=None, limite_pontos=5):
+        """Pontua rotas alternativas (formato de montar_rota) ao mesmo tempo e as ordena por tempo x risco.
+
+        O clima das rotas sai das mesmas células de geohash onde elas se
+        sobrepõem, e o corredor de cada uma é consultado em paralelo.
+        """
+        resultados = list(_POOL_PONTUACAO.map(
+            lambda rota: self.pontuar_rota(rota, clima, limite_pontos, partida), rotas
+        ))
+        for posicao, (rota, resultado) in enumerate(zip(rotas, resultados)):
+            resultado['alternativa'] = posicao
+            resultado['coordenadas_rota'] = rota['coordenadas_rota']
+        return ranking_pareto(resultados)
+
+    def pontuar_alternativas(self, origem, destino, clima=True, prazo=None, partida=None,
+                             maximo=roteamento.MAX_ALTERNATIVAS):
+        """Rota principal e alternativas entre dois locais, pontuadas e ordenadas por tempo x risco"""
+        prazo = prazo or Prazo(roteamento.PRAZO_BUSCA_S)
+        rotas = montar_alternativas(*self._locais(origem, destino, prazo), prazo, maximo)
+        return self.pontuar_rotas(rotas, clima, partida)
+
+    def pontuar(self, origem, destino, clima=True, prazo=None, partida=None):
+        """Pontua a rota entre dois locais (endereço, 'lat,lon' ou tupla)"""
+        return self.pontuar_rota(self.rota(origem, destino, prazo), clima, partida=partida)
+
+    def pontuar_coordenadas(self, origem_coords, destino_coords, origem_nome=None, destino_nome=None,
+                            clima=True, prazo=None, partida=None):
+        """Pontua a rota entre duas coordenadas (lat, lon), com nomes opcionais"""
+        rota = montar_rota(
+            origem_coords, destino_coords,
+            origem_nome or f"{origem_coords[0]:.4f},{origem_coords[1]:.4f}",
+            destino_nome or f"{destino_coords[0]:.4f},{destino_coords[1]:.4f}",
+            prazo or Prazo(roteamento.PRAZO_BUSCA_S)
+        )
+        return self.pontuar_rota(rota, clima, partida=partida)
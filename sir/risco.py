@@ -0,0 +1,271 @@
+"""Motor de risco: distância rota-acidente vetorizada e trechos de risco ao longo da rota"""
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from sir.espacial import RAIO_TERRA_KM, haversine_km, km_para_corda, para_xyz
+
+# Acidentes a até esta distância (km) da geometria real contam para a rota
+RAIO_CORREDOR_KM = 2.0
+
+# Comprimento (km ao longo da rota) de cada trecho agrupado
+TAMANHO_TRECHO_KM = 5.0
+
+# Risco de um acidente sem mortos, feridos graves ou chuva
+RISCO_BASE = 0.3
+
+# Peso (em acidentes) do risco base na suavização de grupos pequenos
+PESO_SUAVIZACAO = 5
+
+# Acidentes processados por lote no cálculo de distância (limita a memória dos pares)
+PONTOS_POR_LOTE = 20_000
+
+
+def mascara_chuva(df):
+    """True para acidentes com 'chuva' na condição meteorológica"""
+    if 'condicao_metereologica' not in df:
+        return np.zeros(len(df), dtype=bool)
+    condicao = df['condicao_metereologica']
+    if condicao.dtype == 'category':
+        # Testa 'chuva' só nas categorias (poucas) e espalha pelos códigos
+        chuva_categoria = condicao.cat.categories.astype(str).str.lower().str.contains('chuva', regex=False)
+        codigos = condicao.cat.codes.to_numpy()
+        return np.append(np.asarray(chuva_categoria, dtype=bool), False)[codigos]  # código -1 (NaN) -> False
+    return condicao.astype(str).str.lower().str.contains('chuva', regex=False).to_numpy(dtype=bool)
+
+
+def risco_acidentes(df):
+    """Risco de cada acidente: base 0.3, +0.4 mortos, +0.2 feridos graves, +0.1 chuva.
+
+    Vetorizado sobre a tabela inteira; calculado uma vez na carga (coluna 'risco').
+    """
+    risco = np.full(len(df), RISCO_BASE)
+    if 'mortos' in df:
+        risco += 0.4 * (df['mortos'].to_numpy(dtype=np.float64, na_value=0) > 0)
+    if 'feridos_graves' in df:
+        risco += 0.2 * (df['feridos_graves'].to_numpy(dtype=np.float64, na_value=0) > 0)
+    risco += 0.1 * mascara_chuva(df)
+    return np.minimum(risco, 1.0)
+
+
+def risco_agrupado(risco_medio, acidentes):
+    """Risco de um grupo de acidentes, limitado a 1.0.
+
+    Gravidade média suavizada em direção ao risco base (um único acidente
+    fatal não vira ponto crítico sozinho) + 0.15 por ordem de grandeza de acidentes.
+    """
+    acidentes = np.maximum(acidentes, 1)
+    suavizado = (risco_medio * acidentes + RISCO_BASE * PESO_SUAVIZACAO) / (acidentes + PESO_SUAVIZACAO)
+    return np.minimum(suavizado + 0.15 * np.log10(acidentes), 1.0)
+
+
+def coluna_risco(df):
+    """Risco pré-calculado na carga; calcula na hora se a tabela não tiver a coluna"""
+    if 'risco' in df:
+        return df['risco'].to_numpy(dtype=np.float64)
+    return risco_acidentes(df)
+
+
+def _angulo_pares(p, a, b, normal, lado_a, lado_b, valido):
+    """Ângulo (rad) entre cada ponto e seu segmento, com os pares alinhados linha a linha"""
+    transversal = np.arcsin(np.clip(np.abs(np.einsum('ij,ij->i', p, normal)), 0.0, 1.0))
+    # Projeção cai dentro do segmento se P·(N×A) >= 0 e P·(B×N) >= 0
+    dentro = (np.einsum('ij,ij->i', p, lado_a) >= 0) & (np.einsum('ij,ij->i', p, lado_b) >= 0) & valido
+
+    # Ângulo até os extremos: 2·asin(corda/2), com corda² = 2 - 2·(P·V)
+    ate_a = 2 * np.arcsin(np.sqrt(np.clip((1 - np.einsum('ij,ij->i', p, a)) / 2, 0.0, 1.0)))
+    ate_b = 2 * np.arcsin(np.sqrt(np.clip((1 - np.einsum('ij,ij->i', p, b)) / 2, 0.0, 1.0)))
+    return np.where(dentro, transversal, np.minimum(ate_a, ate_b))
+
+
+def distancia_polilinha_km(lat, lon, coordenadas, limite_km=None):
+    """Menor distância (km) de cada ponto até a polilinha, por segmento (esfera).
+
+    Retorna (distancia_km, segmento, posicao_km): o índice do segmento mais
+    próximo e a posição da projeção medida desde o início da rota. Com
+    limite_km, pontos que certamente estão mais longe que isso saem com
+    distância inf, segmento -1 e posição NaN, sem entrar no cálculo.
+
+    Os pontos são processados em lotes de PONTOS_POR_LOTE. Em cada lote só
+    entram os pares ponto-segmento que podem ser o mínimo: se o vértice mais
+    próximo está a uma corda d, o segmento vencedor tem um extremo a até
+    d + (maior segmento), e uma KD-tree dos vértices devolve esses extremos.
+    """
+    pontos = para_xyz(lat, lon)
+    vertices = np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2)
+    if len(vertices) == 1:
+        vertices = np.vstack((vertices, vertices))
+    v = para_xyz(vertices[:, 0], vertices[:, 1])
+    a, b = v[:-1], v[1:]
+    n, m = len(pontos), len(a)
+
+    # Normal do grande círculo de cada segmento; segmentos degenerados ficam só com extremos
+    normal = np.cross(a, b)
+    norma = np.linalg.norm(normal, axis=1)
+    valido = norma > 1e-12
+    normal[valido] /= norma[valido, None]
+    lado_a = np.cross(normal, a)
+    lado_b = np.cross(b, normal)
+
+    comprimentos = haversine_km(vertices[:-1, 0], vertices[:-1, 1], vertices[1:, 0], vertices[1:, 1])
+    inicio_segmento = np.concatenate(([0.0], np.cumsum(comprimentos)[:-1]))
+
+    arvore = cKDTree(v)
+    corda_vertice, _ = arvore.query(pontos)
+    folga = km_para_corda(comprimentos.max()) + 1e-9
+
+    distancia = np.full(n, np.inf)
+    segmento = np.full(n, -1, dtype=np.int64)
+    posicao = np.full(n, np.nan)
+
+    avaliar = np.arange(n)
+    if limite_km is not None:
+        # Todo ponto de um segmento fica a até meio segmento de um extremo
+        minimo_possivel = corda_vertice - km_para_corda(comprimentos.max() / 2)
+        avaliar = np.flatnonzero(minimo_possivel <= km_para_corda(limite_km) + 1e-9)
+
+    for inicio in range(0, len(avaliar), PONTOS_POR_LOTE):
+        lote = avaliar[inicio:inicio + PONTOS_POR_LOTE]
+        listas = arvore.query_ball_point(pontos[lote], corda_vertice[lote] + folga)
+
+        # Pares (ponto, segmento): cada vértice k encosta nos segmentos k-1 e k
+        quantidade = np.fromiter((len(lista) for lista in listas), dtype=np.int64, count=len(listas))
+        vertice = np.concatenate(listas).astype(np.int64)
+        ponto = np.repeat(lote, quantidade)
+        ponto = np.concatenate((ponto, ponto))
+        seg = np.concatenate((vertice - 1, vertice))
+        dentro_da_rota = (seg >= 0) & (seg < m)
+        ponto, seg = ponto[dentro_da_rota], seg[dentro_da_rota]
+
+        angulo = _angulo_pares(pontos[ponto], a[seg], b[seg], normal[seg], lado_a[seg], lado_b[seg], valido[seg])
+
+        # Mínimo por ponto: ordena por (ponto, ângulo) e fica com o primeiro de cada ponto
+        ordem = np.lexsort((angulo, ponto))
+        primeiro = np.ones(len(ordem), dtype=bool)
+        primeiro[1:] = ponto[ordem][1:] != ponto[ordem][:-1]
+        escolhidos = ordem[primeiro]
+        segmento[ponto[escolhidos]] = seg[escolhidos]
+        distancia[ponto[escolhidos]] = angulo[escolhidos] * RAIO_TERRA_KM
+
+    # Posição ao longo do segmento escolhido (triângulo esférico retângulo)
+    calculados = segmento >= 0
+    seg = segmento[calculados]
+    cos_a = np.einsum('ij,ij->i', pontos[calculados], a[seg])
+    cos_transversal = np.cos(distancia[calculados] / RAIO_TERRA_KM)
+    ao_longo = np.arccos(np.clip(cos_a / np.maximum(cos_transversal, 1e-12), -1.0, 1.0)) * RAIO_TERRA_KM
+    posicao[calculados] = inicio_segmento[seg] + np.clip(ao_longo, 0.0, comprimentos[seg])
+
+    return distancia, segmento, posicao
+
+
+def mais_frequente(grupos, valores):
+    """Valor mais frequente em cada grupo (sem apply em Python; empates pelo menor valor).
+
+    Grupos e valores viram códigos ordenados (factorize) e a contagem de cada
+    par sai de um np.unique sobre um inteiro só; valores ausentes não contam.
+    """
+    codigo_grupo, nomes_grupo = pd.factorize(np.asarray(grupos), sort=True)
+    codigo_valor, nomes_valor = pd.factorize(np.asarray(valores), sort=True)
+    validos = (codigo_grupo >= 0) & (codigo_valor >= 0)
+    pares, contagem = np.unique(
+        codigo_grupo[validos].astype(np.int64) * max(len(nomes_valor), 1) + codigo_valor[validos],
+        return_counts=True
+    )
+    grupo, valor = np.divmod(pares, max(len(nomes_valor), 1))
+
+    # Por grupo: maior contagem e, no empate, o menor valor (pares já vêm ordenados por valor)
+    ordem = np.lexsort((-contagem, grupo))
+    primeiro = np.ones(len(ordem), dtype=bool)
+    primeiro[1:] = grupo[ordem][1:] != grupo[ordem][:-1]
+    escolhidos = ordem[primeiro]
+    return pd.Series(
+        np.asarray(nomes_valor)[valor[escolhidos]], index=pd.Index(np.asarray(nomes_grupo)[grupo[escolhidos]],
+                                                                    name='grupo'), name='valor'
+    )
+
+
+def pontos_risco_rota(df, coordenadas, indice=None, raio_km=RAIO_CORREDOR_KM,
+                      trecho_km=TAMANHO_TRECHO_KM, limite=20):
+    """Trechos de risco ao longo de uma rota, ordenados do mais para o menos arriscado.
+
+    Os acidentes candidatos vêm do corredor do índice espacial (ou da tabela
+    inteira, sem índice); a distância exata ponto-segmento decide quem está a
+    até raio_km da rota, e os acidentes são agrupados em trechos de trecho_km.
+    Cada trecho vira um ponto no formato de calcular_pontos_risco_reais.
+    """
+    if df is None or len(coordenadas) == 0:
+        return []
+
+    if indice is not None:
+        linhas = indice.corredor(coordenadas, raio_km)
+    else:
+        linhas = np.arange(len(df))
+    if len(linhas) == 0:
+        return []
+
+    # Só coordenadas até a distância exata decidir; as demais colunas vêm só para quem está na rota
+    lat = df['latitude'].to_numpy(dtype=np.float64, na_value=np.nan)[linhas]
+    lon = df['longitude'].to_numpy(dtype=np.float64, na_value=np.nan)[linhas]
+    com_coordenadas = np.isfinite(lat) & np.isfinite(lon)
+    linhas, lat, lon = linhas[com_coordenadas], lat[com_coordenadas], lon[com_coordenadas]
+    if len(linhas) == 0:
+        return []
+
+    distancia, _, posicao = distancia_polilinha_km(lat, lon, coordenadas, limite_km=raio_km)
+    na_rota = distancia <= raio_km
+    if not na_rota.any():
+        return []
+
+    acidentes = df.iloc[linhas[na_rota]]
+    risco = coluna_risco(acidentes)
+    trecho = (posicao[na_rota] // trecho_km).astype(np.int64)
+
+    def coluna(nome, padrao=0):
+        if nome in acidentes:
+            return acidentes[nome].to_numpy()
+        return np.full(len(acidentes), padrao)
+
+    tabela = pd.DataFrame({
+        'trecho': trecho,
+        'lat': lat[na_rota],
+        'lon': lon[na_rota],
+        'risco': risco,
+        'mortos': coluna('mortos'),
+        'feridos': coluna('feridos'),
+        'feridos_graves': coluna('feridos_graves'),
+        'km': coluna('km', np.nan),
+    })
+    resumo = tabela.groupby('trecho').agg(
+        lat=('lat', 'mean'), lon=('lon', 'mean'), risco_medio=('risco', 'mean'),
+        acidentes=('risco', 'size'), mortos=('mortos', 'sum'), feridos=('feridos', 'sum'),
+        feridos_graves=('feridos_graves', 'sum'), km=('km', 'median'),
+    )
+    resumo['risco'] = risco_agrupado(resumo['risco_medio'], resumo['acidentes'])
+
+    for nome in ('br', 'municipio', 'tipo_acidente', 'causa_acidente'):
+        if nome in acidentes:
+            resumo[nome] = mais_frequente(trecho, acidentes[nome].astype(str).to_numpy())
+
+    resumo = resumo.sort_values(['risco', 'acidentes'], ascending=False).head(limite)
+
+    pontos = []
+    for trecho_id, linha in zip(resumo.index, resumo.to_dict('records')):
+        br = linha.get('br', 'nan')
+        nome = f"BR-{br} KM {linha['km']:.0f}" if br not in ('nan', '<NA>') and pd.notna(linha['km']) \
+            else f"Trecho {trecho_id * trecho_km:.0f}-{(trecho_id + 1) * trecho_km:.0f} km"
+        pontos.append({
+            "nome": nome,
+            "coords": (float(linha['lat']), float(linha['lon'])),
+            "risco": float(linha['risco']),
+            "detalhes": {
+                "municipio": str(linha.get('municipio', 'N/A'))[:50],
+                "tipo_acidente": str(linha.get('tipo_acidente', 'N/A'))[:50],
+                "causa_acidente": str(linha.get('causa_acidente', 'N/A'))[:50],
+                "acidentes": int(linha['acidentes']),
+                "mortos": int(linha['mortos']),
+                "feridos": int(linha['feridos']),
+                "feridos_graves": int(linha['feridos_graves']),
+                "km_rota": float(trecho_id * trecho_km)
+            }
+        })
+    return pontos
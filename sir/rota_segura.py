@@ -0,0 +1,181 @@
+"""Rota mais segura: menor caminho na malha local com custo tempo + λ·risco de acidentes em cada arco.
+
+Os acidentes do DataTran são associados à aresta federal mais próxima da
+malha (até RAIO_ARCO_KM). O risco de uma aresta é a soma da gravidade dos
+seus acidentes (por km, suavizada em direção à média das federais),
+corrigida por um fator da condição (chuva, noite): quanto a
+condição pesa nos acidentes da aresta em relação a quanto pesa na malha,
+suavizado e limitado como no CuboRisco. Vias fora do DataTran (estaduais,
+municipais) não têm dados e recebem a densidade média de risco das federais,
+para não parecerem seguras só por falta de registro.
+
+O risco é escalado para minutos: na malha inteira, risco total = tempo
+total. λ = 0 é a rota mais rápida; λ = 1 faz o risco médio pesar tanto
+quanto o tempo; λ maior troca cada vez mais tempo por menos exposição.
+Os pesos são calculados uma vez por versão do dataset (todas as condições
+de uma vez); a consulta só soma dois arrays e roda o A* da malha.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+from sir.cubo import (
+    CLASSES_CLIMA, FATOR_MAXIMO, FATOR_MINIMO, PESO_PROPORCAO, classe_clima, classes_clima, hora_e_dia
+)
+from sir.espacial import haversine_km, km_para_corda, para_xyz
+from sir.risco import coluna_risco
+
+# Classes de condição com pesos próprios; 'geral' usa todos os acidentes
+CONDICOES_ROTA = ('geral', 'chuva', 'noite', 'chuva_noite')
+ROTULOS_CONDICAO = {'geral': 'Qualquer condição', 'chuva': 'Chuva', 'noite': 'Noite', 'chuva_noite': 'Chuva à noite'}
+
+LAMBDA_PADRAO = 1.0
+
+# Distância máxima de um acidente até a aresta e espaçamento das amostras ao longo das arestas
+RAIO_ARCO_KM = 0.5
+PASSO_AMOSTRAS_KM = 0.2
+
+# Km de malha média somados a cada aresta federal: um acidente isolado num trecho curto não vira um muro
+PESO_KM = 2.0
+
+# Noite para os pesos: das 18h às 6h (faixas 'noite' e 'madrugada' do cubo)
+HORA_INICIO_NOITE, HORA_FIM_NOITE = 18, 6
+
+
+def condicao_rota(hora=None, clima=None):
+    """Classe de condição de uma partida: hora (0–23) e condição do tempo ('Chuva forte'), ambas opcionais"""
+    noite = hora is not None and (int(hora) >= HORA_INICIO_NOITE or int(hora) < HORA_FIM_NOITE)
+    chuva = clima is not None and classe_clima(clima) == 'chuva'
+    return 'chuva_noite' if chuva and noite else 'chuva' if chuva else 'noite' if noite else 'geral'
+
+
+def _amostras_arestas(grafo, arestas, passo_km):
+    """Pontos a cada ~passo_km ao longo das arestas e a aresta de cada ponto"""
+    ptr = grafo.geometria_ptr
+    tamanhos = ptr[arestas + 1] - ptr[arestas]
+    pontos = np.repeat(ptr[arestas] - np.concatenate(([0], np.cumsum(tamanhos)[:-1])), tamanhos) + \
+        np.arange(tamanhos.sum())
+    aresta_ponto = np.repeat(arestas, tamanhos)
+
+    # Segmentos: pares de pontos consecutivos da mesma aresta
+    mesma = aresta_ponto[:-1] == aresta_ponto[1:]
+    inicio, fim = pontos[:-1][mesma], pontos[1:][mesma]
+    lat, lon = grafo.geometria[:, 0].astype(np.float64), grafo.geometria[:, 1].astype(np.float64)
+    comprimentos = haversine_km(lat[inicio], lon[inicio], lat[fim], lon[fim])
+    divisoes = np.maximum(np.ceil(comprimentos / passo_km).astype(np.int64), 1)
+    fracao = (np.arange(divisoes.sum()) - np.repeat(np.cumsum(divisoes) - divisoes, divisoes)) / \
+        np.repeat(divisoes, divisoes)
+    amostras_lat = np.repeat(lat[inicio], divisoes) + np.repeat(lat[fim] - lat[inicio], divisoes) * fracao
+    amostras_lon = np.repeat(lon[inicio], divisoes) + np.repeat(lon[fim] - lon[inicio], divisoes) * fracao
+    return amostras_lat, amostras_lon, np.repeat(aresta_ponto[:-1][mesma], divisoes)
+
+
+class RiscoMalha:
+    """Risco de acidentes por arco da malha local, por classe de condição, numa versão do DataTran"""
+
+    def __init__(self, grafo, df):
+        self.caminho_grafo = grafo.caminho
+        self.versao = df.attrs.get('versao')
+        self.tempo_min = grafo.tempo_min
+
+        # Aresta de cada acidente: a federal mais próxima (todas, se a malha não marca as federais)
+        total_arestas = len(grafo.geometria_ptr) - 1
+        federal = np.ones(total_arestas, dtype=bool) if grafo.federal is None or not grafo.federal.any() \
+            else grafo.federal
+        amostras_lat, amostras_lon, aresta_amostra = _amostras_arestas(
+            grafo, np.flatnonzero(federal), PASSO_AMOSTRAS_KM
+        )
+        lat = df['latitude'].to_numpy(dtype=np.float64, na_value=np.nan)
+        lon = df['longitude'].to_numpy(dtype=np.float64, na_value=np.nan)
+        validos = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        aresta_acidente = np.full(len(df), -1, dtype=np.int64)
+        if len(aresta_amostra) and len(validos):
+            _, amostra = cKDTree(para_xyz(amostras_lat, amostras_lon)).query(
+                para_xyz(lat[validos], lon[validos]), distance_upper_bound=km_para_corda(RAIO_ARCO_KM)
+            )
+            perto = amostra < len(aresta_amostra)
+            aresta_acidente[validos[perto]] = aresta_amostra[amostra[perto]]
+        self.acidentes_na_malha = int((aresta_acidente >= 0).sum())
+
+        hora, _ = hora_e_dia(df)
+        noite = (hora >= HORA_INICIO_NOITE) | ((hora >= 0) & (hora < HORA_FIM_NOITE))
+        chuva = classes_clima(df) == CLASSES_CLIMA.index('chuva')
+        mascaras = {'geral': None, 'chuva': chuva, 'noite': noite, 'chuva_noite': chuva & noite}
+
+        na_malha = aresta_acidente >= 0
+        aresta, risco = aresta_acidente[na_malha], coluna_risco(df)[na_malha]
+        soma = np.bincount(aresta, risco, minlength=total_arestas)
+        contagem = np.bincount(aresta, minlength=total_arestas).astype(np.float64)
+        comprimento = np.zeros(total_arestas)
+        comprimento[grafo.aresta] = grafo.distancia_km
+
+        riscos = {}
+        for condicao, mascara in mascaras.items():
+            risco_aresta = soma.copy()
+            if mascara is not None:
+                # Fator da condição na aresta, suavizado em direção à proporção da malha
+                na_condicao = np.bincount(aresta[mascara[na_malha]], minlength=total_arestas)
+                proporcao_malha = na_condicao.sum() / max(contagem.sum(), 1.0)
+                if proporcao_malha > 0:
+                    proporcao = (na_condicao + PESO_PROPORCAO * proporcao_malha) / (contagem + PESO_PROPORCAO)
+                    risco_aresta *= np.clip(proporcao / proporcao_malha, FATOR_MINIMO, FATOR_MAXIMO)
+
+            # Risco por km suavizado em direção à média das federais; sem DataTran, a própria média
+            densidade = risco_aresta[federal].sum() / max(comprimento[federal].sum(), 1e-9)
+            risco_aresta = (risco_aresta + PESO_KM * densidade) / (comprimento + PESO_KM) * comprimento
+            risco_aresta[~federal] = densidade * comprimento[~federal]
+            riscos[condicao] = risco_aresta[grafo.aresta]
+
+        # Escala em minutos: risco total da malha (sem condição) = tempo total
+        escala = grafo.tempo_min.sum() / max(riscos['geral'].sum(), 1e-9)
+        self.risco = {condicao: risco * escala for condicao, risco in riscos.items()}
+
+    def custo(self, condicao='geral', lambda_risco=LAMBDA_PADRAO):
+        """Custo de cada arco (minutos): tempo + λ·risco na condição"""
+        if condicao not in self.risco:
+            raise ValueError(f"Condição desconhecida: {condicao} (use {', '.join(CONDICOES_ROTA)})")
+        if not lambda_risco >= 0:
+            raise ValueError(f"λ precisa ser >= 0: {lambda_risco}")
+        return self.tempo_min + lambda_risco * self.risco[condicao]
+
+    def exposicao(self, arcos, condicao='geral'):
+        """Risco acumulado (em minutos equivalentes) ao longo dos arcos de uma rota"""
+        return float(self.risco[condicao][arcos].sum())
+
+
+_RISCO_MALHA = None
+
+
+def risco_malha(grafo, df):
+    """RiscoMalha da malha e da versão do dataset, recalculado só quando uma delas muda"""
+    global _RISCO_MALHA
+    atual = _RISCO_MALHA
+    if atual is None or atual.caminho_grafo != grafo.caminho or atual.versao != df.attrs.get('versao') \
+            or atual.versao is None:
+        atual = _RISCO_MALHA = RiscoMalha(grafo, df)
+    return atual
+
+
+def rota_segura(grafo, df, origem_coords, destino_coords, lambda_risco=LAMBDA_PADRAO, condicao='geral'):
+    """Rota de menor tempo + λ·risco (formato de rota_estradas), comparada com a mais rápida.
+
+    A chave 'rota_segura' traz condição, λ, tempo a mais (min) e redução
+    de risco (fração) em relação à rota mais rápida da mesma malha.
+    """
+    pesos = risco_malha(grafo, df)
+    custo = pesos.custo(condicao, lambda_risco)
+    rapida = grafo.rota(origem_coords, destino_coords)
+    if rapida['status'] != 'sucesso':
+        return rapida
+
+    segura = grafo.rota(origem_coords, destino_coords, custo)
+    risco_rapida = pesos.exposicao(rapida['arcos'], condicao)
+    risco_segura = pesos.exposicao(segura['arcos'], condicao)
+    segura['fonte'] = f"{segura['fonte']} • mais segura"
+    segura['rota_segura'] = {
+        'condicao': condicao,
+        'lambda': lambda_risco,
+        'tempo_extra_min': segura['tempo_real'] - rapida['tempo_real'],
+        'distancia_extra_km': round(segura['distancia_real'] - rapida['distancia_real'], 1),
+        'reducao_risco': 1.0 - risco_segura / risco_rapida if risco_rapida > 0 else 0.0,
+    }
+    return segura
@@ -0,0 +1,269 @@
+"""Geocodificação (Nominatim) e roteamento por estradas (malha local, OSRM x GraphHopper) sem Streamlit"""
+import os
+
+import numpy as np
+
+from sir.cache_geocodificacao import CacheGeocodificacao, normalizar_endereco
+from sir.cache_rotas import CacheRotas
+from sir.cliente_http import CLIENTE
+from sir.concorrencia import LimitadorTaxa, Prazo, em_paralelo, primeiro_valido
+from sir.grafo import GrafoViario
+from sir.simulacao import simulador_do_ambiente
+
+# Nominatim exige User-Agent e no máximo 1 requisição por segundo
+CABECALHOS = {'User-Agent': 'Sistema-Rotas-App/1.0'}
+NOMINATIM_REQ_POR_S = 1.0
+LIMITADOR_NOMINATIM = LimitadorTaxa(NOMINATIM_REQ_POR_S)
+
+_CACHE_GEOCODIFICACAO = None
+_CACHE_ROTAS = None
+_GRAFO_LOCAL = None
+
+# Prazo total (s) de uma busca de rota personalizada: geocodificação + roteamento
+PRAZO_BUSCA_S = 15.0
+TIMEOUT_GEOCODIFICACAO_S = 10.0
+
+# Rotas pedidas ao provedor para comparar tempo e risco (a principal e até 2 alternativas)
+MAX_ALTERNATIVAS = 3
+
+
+def cache_geocodificacao():
+    """Cache persistente do processo, aberto na primeira geocodificação"""
+    global _CACHE_GEOCODIFICACAO
+    if _CACHE_GEOCODIFICACAO is None:
+        _CACHE_GEOCODIFICACAO = CacheGeocodificacao()
+    return _CACHE_GEOCODIFICACAO
+
+
+def cache_rotas():
+    """Cache persistente de geometrias de rota, aberto no primeiro roteamento"""
+    global _CACHE_ROTAS
+    if _CACHE_ROTAS is None:
+        _CACHE_ROTAS = CacheRotas()
+    return _CACHE_ROTAS
+
+
+def grafo_local():
+    """Malha viária local configurada por SIR_GRAFO=<malha.npz>, carregada na primeira rota; None sem ela"""
+    global _GRAFO_LOCAL
+    caminho = os.environ.get('SIR_GRAFO', '').strip()
+    if not caminho:
+        return None
+    if _GRAFO_LOCAL is None or _GRAFO_LOCAL.caminho != caminho:
+        _GRAFO_LOCAL = GrafoViario.carregar(caminho)
+    return _GRAFO_LOCAL
+
+
+def geometria_lon_lat(coordenadas):
+    """[[lon, lat], ...] dos provedores -> array float32 (n, 2) em (lat, lon), como o folium usa"""
+    return np.ascontiguousarray(np.asarray(coordenadas, dtype=np.float32).reshape(-1, 2)[:, ::-1])
+
+
+def geocodificar_endereco(endereco, prazo=None):
+    """Converte endereço em coordenadas: cache em disco, senão Nominatim (OpenStreetMap)"""
+    simulador = simulador_do_ambiente()
+    if simulador is not None:
+        return simulador.geocodificar(endereco)
+
+    guardado = cache_geocodificacao().obter(endereco)
+    if guardado is not None:
+        return guardado
+
+    resultado = _consultar_nominatim(endereco, prazo)
+    cache_geocodificacao().guardar(endereco, resultado)
+    return resultado
+
+
+def _consultar_nominatim(endereco, prazo=None):
+    """Uma consulta ao Nominatim, respeitando o limite de taxa (a fila também conta no prazo)"""
+    if not LIMITADOR_NOMINATIM.aguardar(None if prazo is None else prazo.restante()):
+        return {'status': 'erro', 'message': 'Tempo esgotado na fila do Nominatim'}
+    timeout = TIMEOUT_GEOCODIFICACAO_S if prazo is None else prazo.restante(TIMEOUT_GEOCODIFICACAO_S)
+    try:
+        params = {
+            'q': f"{endereco}, Brasil",
+            'format': 'json',
+            'limit': 1,
+            'addressdetails': 1
+        }
+        response = CLIENTE.get('nominatim', '/search', params=params, headers=CABECALHOS, timeout=timeout)
+
+        if response.status_code == 200:
+            data = response.json()
+            if data:
+                resultado = data[0]
+                return {
+                    'lat': float(resultado['lat']),
+                    'lon': float(resultado['lon']),
+                    'display_name': resultado['display_name'],
+                    'cidade': resultado.get('address', {}).get('city', endereco),
+                    'status': 'sucesso'
+                }
+
+        return {'status': 'erro', 'message': 'Endereço não encontrado', 'nao_encontrado': response.status_code == 200}
+
+    except Exception as e:
+        return {'status': 'erro', 'message': f'Erro na geocodificação: {str(e)[:50]}...'}
+
+
+def geocodificar_lote(enderecos, prazo=None):
+    """Geocodifica vários endereços (na ordem recebida) de uma vez.
+
+    Endereços equivalentes após a normalização são consultados uma única vez;
+    os que já estão no cache não esperam a fila do Nominatim. Sem prazo, o lote
+    anda no ritmo do limitador de taxa até o fim.
+    """
+    unicos = {}
+    for endereco in enderecos:
+        unicos.setdefault(normalizar_endereco(endereco), endereco)
+
+    esgotado = {'status': 'erro', 'message': 'Tempo esgotado na geocodificação'}
+    resultados = em_paralelo(
+        [lambda endereco=endereco: geocodificar_endereco(endereco, prazo) for endereco in unicos.values()],
+        prazo_s=None if prazo is None else prazo.restante(), padrao=esgotado
+    )
+    por_chave = dict(zip(unicos, resultados))
+    return [por_chave[normalizar_endereco(endereco)] for endereco in enderecos]
+
+
+def _rota_provedor(coordenadas, distancia_m, tempo_min, fonte):
+    return {
+        'coordenadas': geometria_lon_lat(coordenadas),
+        'distancia_real': round(distancia_m / 1000, 1),  # metros para km
+        'tempo_real': round(tempo_min, 0),
+        'status': 'sucesso',
+        'fonte': fonte
+    }
+
+
+def rota_osrm(origem_coords, destino_coords, timeout, alternativas=1):
+    """Rota por estradas via OSRM (Open Source Routing Machine), completamente gratuito.
+
+    Com alternativas > 1, as demais rotas que o OSRM encontrar vêm na chave 'alternativas'.
+    """
+    coords = f"{origem_coords[1]},{origem_coords[0]};{destino_coords[1]},{destino_coords[0]}"
+    params = {
+        'overview': 'full',
+        'geometries': 'geojson'
+    }
+    if alternativas > 1:
+        params['alternatives'] = str(alternativas - 1)
+    response = CLIENTE.get('osrm', f'/route/v1/driving/{coords}', params=params, timeout=timeout)
+
+    if response.status_code == 200:
+        data = response.json()
+        if data['code'] == 'Ok' and len(data['routes']) > 0:
+            rotas = [
+                _rota_provedor(route['geometry']['coordinates'], route['distance'], route['duration'] / 60,
+                               'OSRM (estradas reais)')
+                for route in data['routes'][:alternativas]
+            ]
+            return {**rotas[0], 'alternativas': rotas[1:]} if alternativas > 1 else rotas[0]
+    return {'status': 'erro', 'message': f'OSRM respondeu {response.status_code}'}
+
+
+def rota_graphhopper(origem_coords, destino_coords, timeout, alternativas=1):
+    """Rota por estradas via GraphHopper (também gratuito, mas com limite menor)"""
+    params = {
+        'point': [f"{origem_coords[0]},{origem_coords[1]}", f"{destino_coords[0]},{destino_coords[1]}"],
+        'vehicle': 'car',
+        'locale': 'pt-BR',
+        'calc_points': 'true',
+        'points_encoded': 'false',
+        'type': 'json'
+    }
+    if alternativas > 1:
+        params.update({'algorithm': 'alternative_route', 'alternative_route.max_paths': str(alternativas)})
+    response = CLIENTE.get('graphhopper', '/api/1/route', params=params, timeout=timeout)
+
+    if response.status_code == 200:
+        data = response.json()
+        rotas = [
+            _rota_provedor(path['points']['coordinates'], path['distance'], path['time'] / 60000,  # ms para minutos
+                           'GraphHopper (estradas reais)')
+            for path in data.get('paths', [])[:alternativas]
+            if path.get('points', {}).get('coordinates')
+        ]
+        if rotas:
+            return {**rotas[0], 'alternativas': rotas[1:]} if alternativas > 1 else rotas[0]
+    return {'status': 'erro', 'message': f'GraphHopper respondeu {response.status_code}'}
+
+
+def rota_linha_reta(origem_coords, destino_coords):
+    """Último fallback: linha reta entre origem e destino"""
+    return {
+        'status': 'fallback',
+        'coordenadas': [origem_coords, destino_coords],
+        'distancia_real': None,
+        'tempo_real': None,
+        'fonte': 'Linha reta (fallback)'
+    }
+
+
+def rota_estradas(origem_coords, destino_coords, prazo=None):
+    """Rota pela malha local (SIR_GRAFO), do cache em disco ou da corrida OSRM x GraphHopper dentro do prazo"""
+    simulador = simulador_do_ambiente()
+    if simulador is not None:
+        return simulador.rota(origem_coords, destino_coords)
+
+    grafo = grafo_local()
+    if grafo is not None:
+        rota = grafo.rota(origem_coords, destino_coords)
+        if rota['status'] == 'sucesso':
+            return rota
+
+    guardada = cache_rotas().obter(origem_coords, destino_coords)
+    if guardada is not None:
+        return guardada
+
+    prazo = prazo or Prazo(PRAZO_BUSCA_S)
+    timeout = prazo.restante()
+    rota = primeiro_valido(
+        [
+            lambda: rota_osrm(origem_coords, destino_coords, timeout),
+            lambda: rota_graphhopper(origem_coords, destino_coords, timeout),
+        ],
+        aceitar=lambda resultado: resultado['status'] == 'sucesso',
+        prazo_s=timeout
+    )
+    if rota is None or rota['status'] != 'sucesso':
+        return rota_linha_reta(origem_coords, destino_coords)
+    cache_rotas().guardar(origem_coords, destino_coords, rota)
+    return rota
+
+
+def rotas_alternativas(origem_coords, destino_coords, prazo=None, maximo=MAX_ALTERNATIVAS):
+    """Até maximo rotas por estradas entre os pontos, a principal primeiro (mesmo formato de rota_estradas).
+
+    Uma só chamada ao provedor que responder primeiro traz todas as
+    alternativas; sem roteador, a lista tem só a linha reta.
+    """
+    simulador = simulador_do_ambiente()
+    if simulador is not None:
+        return [simulador.rota(origem_coords, destino_coords, alternativa) for alternativa in range(maximo)]
+
+    grafo = grafo_local()
+    if grafo is not None:
+        rotas = grafo.rotas(origem_coords, destino_coords, maximo)
+        if rotas[0]['status'] == 'sucesso':
+            return rotas
+
+    guardadas = cache_rotas().obter_alternativas(origem_coords, destino_coords)
+    if guardadas is not None:
+        return guardadas[:maximo]
+
+    prazo = prazo or Prazo(PRAZO_BUSCA_S)
+    timeout = prazo.restante()
+    rota = primeiro_valido(
+        [
+            lambda: rota_osrm(origem_coords, destino_coords, timeout, maximo),
+            lambda: rota_graphhopper(origem_coords, destino_coords, timeout, maximo),
+        ],
+        aceitar=lambda resultado: resultado['status'] == 'sucesso',
+        prazo_s=timeout
+    )
+    if rota is None or rota['status'] != 'sucesso':
+        return [rota_linha_reta(origem_coords, destino_coords)]
+    rotas = [rota] + rota.pop('alternativas', [])
+    cache_rotas().guardar_alternativas(origem_coords, destino_coords, rotas)
+    return rotas
@@ -0,0 +1,109 @@
+"""Simplificação de polilinhas (Douglas–Peucker) para desenhar rotas no mapa.
+
+Só afeta o desenho: o cálculo de risco continua usando a geometria completa.
+"""
+import json
+
+import numpy as np
+
+from sir.espacial import RAIO_TERRA_KM
+
+# Metros por pixel no zoom 0 (tiles Web Mercator de 256 px) no equador
+METROS_POR_PIXEL_ZOOM_0 = 2 * np.pi * RAIO_TERRA_KM * 1000 / 256
+
+# Desvio máximo tolerado no desenho, em pixels de tela
+TOLERANCIA_PIXELS = 1.0
+
+# A geometria precisa continuar boa alguns níveis de zoom além do que enquadra a rota
+MARGEM_ZOOM = 3
+ZOOM_MAXIMO = 18
+
+# Tamanho do mapa na tela (px), o mesmo do componente do app: define o zoom que enquadra a rota
+LARGURA_MAPA_PX, ALTURA_MAPA_PX = 1400, 700
+
+# Casas decimais das coordenadas enviadas ao navegador (~1 m)
+CASAS_DESENHO = 5
+
+
+def tolerancia_zoom(zoom, latitude=-15.0):
+    """Tolerância (m) equivalente a TOLERANCIA_PIXELS num nível de zoom e latitude"""
+    return TOLERANCIA_PIXELS * METROS_POR_PIXEL_ZOOM_0 * np.cos(np.radians(latitude)) / 2 ** zoom
+
+
+def zoom_ajustado(coordenadas, largura_px=LARGURA_MAPA_PX, altura_px=ALTURA_MAPA_PX):
+    """Maior zoom (Web Mercator) em que a caixa da rota cabe no mapa, como no fit_bounds"""
+    coordenadas = np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2)
+    lat = np.radians(np.clip(coordenadas[:, 0], -85.0, 85.0))
+    y = np.log(np.tan(np.pi / 4 + lat / 2))
+    fracao_x = np.ptp(coordenadas[:, 1]) / 360.0
+    fracao_y = np.ptp(y) / (2 * np.pi)
+    zooms = [np.log2(pixels / (256 * fracao)) for pixels, fracao in ((largura_px, fracao_x), (altura_px, fracao_y))
+             if fracao > 0]
+    if not zooms:
+        return ZOOM_MAXIMO
+    return int(np.clip(np.floor(min(zooms)), 0, ZOOM_MAXIMO))
+
+
+def _projetar_metros(coordenadas):
+    """Projeção equiretangular local (m) centrada na latitude média da rota"""
+    lat = np.radians(coordenadas[:, 0])
+    lon = np.radians(coordenadas[:, 1])
+    raio_m = RAIO_TERRA_KM * 1000
+    return np.column_stack((lon * np.cos(lat.mean()) * raio_m, lat * raio_m))
+
+
+def simplificar_polilinha(coordenadas, tolerancia_m):
+    """Douglas–Peucker iterativo: mantém os vértices que desviam mais que tolerancia_m.
+
+    Cada passo mede, de uma vez (numpy), a distância de todos os pontos
+    internos de um trecho até a corda entre suas pontas.
+    """
+    coordenadas = np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2)
+    if len(coordenadas) <= 2:
+        return coordenadas
+
+    xy = _projetar_metros(coordenadas)
+    manter = np.zeros(len(xy), dtype=bool)
+    manter[[0, -1]] = True
+    pilha = [(0, len(xy) - 1)]
+    while pilha:
+        inicio, fim = pilha.pop()
+        if fim - inicio < 2:
+            continue
+        a, b = xy[inicio], xy[fim]
+        pontos = xy[inicio + 1:fim]
+        ab = b - a
+        comprimento2 = ab @ ab
+        if comprimento2 == 0:
+            distancias = np.hypot(*(pontos - a).T)
+        else:
+            t = np.clip((pontos - a) @ ab / comprimento2, 0.0, 1.0)
+            distancias = np.hypot(*(pontos - (a + t[:, None] * ab)).T)
+        maior = int(np.argmax(distancias))
+        if distancias[maior] > tolerancia_m:
+            meio = inicio + 1 + maior
+            manter[meio] = True
+            pilha.append((inicio, meio))
+            pilha.append((meio, fim))
+    return coordenadas[manter]
+
+
+def geometria_desenho(coordenadas, zoom=None):
+    """Geometria para o folium: simplificada para o zoom (+ margem) e arredondada.
+
+    Sem zoom, usa o que enquadra a própria rota (zoom_ajustado): uma rota
+    urbana fica com tolerância de poucos metros e continua sobre a rua no
+    zoom de quarteirão; uma interestadual, com a do zoom em que aparece inteira.
+    """
+    coordenadas = np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2)
+    if len(coordenadas) <= 2:
+        return np.round(coordenadas, CASAS_DESENHO).tolist()
+    if zoom is None:
+        zoom = zoom_ajustado(coordenadas)
+    tolerancia = tolerancia_zoom(min(zoom + MARGEM_ZOOM, ZOOM_MAXIMO), coordenadas[:, 0].mean())
+    return np.round(simplificar_polilinha(coordenadas, tolerancia), CASAS_DESENHO).tolist()
+
+
+def tamanho_payload(coordenadas):
+    """Bytes que a lista de coordenadas ocupa no HTML/JSON enviado ao navegador"""
+    return len(json.dumps(np.asarray(coordenadas, dtype=np.float64).tolist()))
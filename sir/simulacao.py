@@ -0,0 +1,100 @@
+"""Provedor simulado e determinístico para clima, geocodificação e roteamento.
+
+O mesmo (semente, local, janela de tempo) sempre gera o mesmo resultado, então
+caches, testes de carga e benchmarks funcionam offline com saída estável.
+Ativado pela variável de ambiente SIR_SIMULACAO=<semente>; sem ela, o
+simulador só é usado como fallback do clima (sem API key ou com a API fora).
+"""
+import hashlib
+import os
+
+import numpy as np
+
+from sir.cache_geocodificacao import normalizar_endereco
+from sir.espacial import densificar, haversine_km
+
+SEMENTE_PADRAO = 0
+
+CONDICOES_SIMULADAS = ['Ensolarado', 'Parcialmente nublado', 'Nublado', 'Chuva leve', 'Chuva forte']
+
+# Região onde caem os endereços simulados (faixa habitada do Brasil)
+REGIAO_GEOCODIFICACAO = {'lat': (-30.0, -5.0), 'lon': (-55.0, -35.0)}
+
+# Rota simulada: um desvio lateral a cada ~50 km, velocidade média de rodovia
+ESPACAMENTO_DESVIOS_KM = 50
+VELOCIDADE_MEDIA_KMH = 75
+
+
+class Simulador:
+    """Gera dados plausíveis a partir de um hash de (semente, chave); sem estado e sem rede"""
+
+    def __init__(self, semente=SEMENTE_PADRAO):
+        self.semente = int(semente)
+
+    def _rng(self, *partes):
+        """Gerador numpy semeado por (semente, partes): mesma entrada, mesma sequência"""
+        digest = hashlib.blake2b(repr((self.semente,) + partes).encode('utf-8'), digest_size=8)
+        return np.random.default_rng(int.from_bytes(digest.digest(), 'little'))
+
+    def clima(self, celula, balde, api_status="🧪 Dados simulados"):
+        """Condições para uma célula (geohash) numa janela de tempo"""
+        rng = self._rng('clima', celula, balde)
+        condicao = CONDICOES_SIMULADAS[rng.integers(len(CONDICOES_SIMULADAS))]
+        return {
+            "temperatura": int(rng.integers(18, 33)),
+            "condicao": condicao,
+            "umidade": int(rng.integers(40, 81)),
+            "vento_kph": int(rng.integers(5, 26)),
+            "risco_climatico": 0.7 if 'forte' in condicao else 0.3 if 'Chuva' in condicao else 0.1,
+            "api_status": api_status
+        }
+
+    def geocodificar(self, endereco):
+        """Coordenadas estáveis para um endereço (pela chave normalizada)"""
+        rng = self._rng('geocodificacao', normalizar_endereco(endereco))
+        lat = rng.uniform(*REGIAO_GEOCODIFICACAO['lat'])
+        lon = rng.uniform(*REGIAO_GEOCODIFICACAO['lon'])
+        cidade = str(endereco).split(',')[0].strip() or str(endereco)
+        return {
+            'lat': float(lat),
+            'lon': float(lon),
+            'display_name': f"{endereco} (simulado)",
+            'cidade': cidade,
+            'status': 'sucesso'
+        }
+
+    def rota(self, origem_coords, destino_coords, alternativa=0):
+        """Polilinha com desvios laterais suaves entre origem e destino, ~1 km entre vértices.
+
+        Cada alternativa (1, 2, ...) é outra polilinha, com desvios maiores.
+        """
+        origem = np.asarray(origem_coords, dtype=np.float64)
+        destino = np.asarray(destino_coords, dtype=np.float64)
+        reta_km = float(haversine_km(origem[0], origem[1], destino[0], destino[1]))
+        chave = (tuple(np.round(origem, 4)), tuple(np.round(destino, 4))) + ((alternativa,) if alternativa else ())
+        rng = self._rng('rota', *chave)
+
+        # Desvios perpendiculares à reta (em graus), zerados nas pontas
+        desvios = int(np.clip(reta_km // ESPACAMENTO_DESVIOS_KM, 1, 40))
+        fracao = np.linspace(0.0, 1.0, desvios + 2)
+        reta = origem + fracao[:, None] * (destino - origem)
+        normal = np.array([-(destino - origem)[1], (destino - origem)[0]])
+        normal = normal / (np.linalg.norm(normal) or 1.0)
+        amplitude = rng.normal(0.0, 0.03 * (1 + alternativa), len(fracao)) * np.linalg.norm(destino - origem)
+        amplitude[[0, -1]] = 0.0
+        pontos = densificar(reta + amplitude[:, None] * normal, 1.0)
+
+        distancia = float(haversine_km(pontos[:-1, 0], pontos[:-1, 1], pontos[1:, 0], pontos[1:, 1]).sum())
+        return {
+            'coordenadas': np.ascontiguousarray(pontos, dtype=np.float32),
+            'distancia_real': round(distancia, 1),
+            'tempo_real': round(distancia / VELOCIDADE_MEDIA_KMH * 60, 0),
+            'status': 'sucesso',
+            'fonte': f"Simulação (semente {self.semente})"
+        }
+
+
+def simulador_do_ambiente():
+    """Simulador configurado por SIR_SIMULACAO=<semente>; None quando desligado"""
+    semente = os.environ.get('SIR_SIMULACAO', '').strip()
+    return Simulador(int(semente)) if semente else None
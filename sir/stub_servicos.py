@@ -0,0 +1,171 @@
+"""Servidor stub local que imita Nominatim, OSRM, GraphHopper e WeatherAPI.
+
+Uso (na raiz do projeto):
+    python -m sir.stub_servicos --porta 8765
+
+Com o servidor no ar, basta apontar SIR_URL_<SERVIÇO> para ele (o comando
+imprime os exports). Em código, ServidorStub funciona como context manager:
+sobe o servidor numa thread, ajusta as variáveis de ambiente e restaura ao sair.
+Atraso e falhas (status 503) podem ser configurados por serviço.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from sir.cliente_http import SERVICOS
+
+# Respostas fixas no formato de cada provedor (rota São Paulo -> Rio pela Dutra)
+ROTA_STUB = [
+    (-23.5505, -46.6333), (-23.3055, -45.9663), (-22.8089, -45.1931),
+    (-22.5231, -44.1042), (-22.9068, -43.1729)
+]
+
+# Alternativa pelo litoral (Rio-Santos), mais longa: devolvida quando o cliente pede alternativas
+ROTA_STUB_ALTERNATIVA = [
+    (-23.5505, -46.6333), (-23.9608, -46.3336), (-23.8036, -45.4022),
+    (-23.3628, -44.7217), (-23.0067, -44.3181), (-22.9068, -43.1729)
+]
+
+
+def resposta_nominatim(params):
+    endereco = params.get('q', ['São Paulo'])[0]
+    return [{
+        'lat': '-23.5505', 'lon': '-46.6333', 'display_name': endereco,
+        'address': {'city': endereco.split(',')[0]}
+    }]
+
+
+def resposta_osrm(params):
+    rotas = [{
+        'geometry': {'coordinates': [[lon, lat] for lat, lon in ROTA_STUB]},
+        'distance': 430_000, 'duration': 5.5 * 3600
+    }]
+    if params.get('alternatives', ['false'])[0] != 'false':
+        rotas.append({
+            'geometry': {'coordinates': [[lon, lat] for lat, lon in ROTA_STUB_ALTERNATIVA]},
+            'distance': 610_000, 'duration': 8.5 * 3600
+        })
+    return {'code': 'Ok', 'routes': rotas}
+
+
+def resposta_graphhopper(params):
+    caminhos = [{
+        'points': {'coordinates': [[lon, lat] for lat, lon in ROTA_STUB]},
+        'distance': 432_000, 'time': 5.6 * 3600 * 1000
+    }]
+    if params.get('algorithm', [''])[0] == 'alternative_route':
+        caminhos.append({
+            'points': {'coordinates': [[lon, lat] for lat, lon in ROTA_STUB_ALTERNATIVA]},
+            'distance': 612_000, 'time': 8.6 * 3600 * 1000
+        })
+    return {'paths': caminhos}
+
+
+def resposta_weatherapi(params):
+    return {'current': {'condition': {'text': 'Chuva leve'}, 'temp_c': 21, 'humidity': 88, 'wind_kph': 12}}
+
+
+RESPOSTAS = {
+    'nominatim': resposta_nominatim,
+    'osrm': resposta_osrm,
+    'graphhopper': resposta_graphhopper,
+    'weatherapi': resposta_weatherapi,
+}
+
+
+class ServidorStub:
+    """Servidor HTTP em thread; cada serviço responde sob /<serviço>/...
+
+    atrasos: {serviço: segundos} antes de responder
+    falhas: {serviço: n} primeiras n chamadas respondem 503
+    """
+
+    def __init__(self, porta=0, atrasos=None, falhas=None):
+        self.atrasos = dict(atrasos or {})
+        self.falhas = dict(falhas or {})
+        self.chamadas = {nome: 0 for nome in RESPOSTAS}
+        self._trava = threading.Lock()
+        self._ambiente_anterior = {}
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', porta), self._manipulador())
+        self.servidor.daemon_threads = True
+
+    @property
+    def porta(self):
+        return self.servidor.server_address[1]
+
+    def urls(self):
+        return {nome: f'http://127.0.0.1:{self.porta}/{nome}' for nome in SERVICOS}
+
+    def _manipulador(self):
+        stub = self
+
+        class Manipulador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, como os provedores reais
+
+            def log_message(self, formato, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                servico = url.path.strip('/').split('/')[0]
+                if servico not in RESPOSTAS:
+                    return self._responder(404, {'erro': 'serviço desconhecido'})
+
+                with stub._trava:
+                    stub.chamadas[servico] += 1
+                    falhar = stub.falhas.get(servico, 0) > 0
+                    if falhar:
+                        stub.falhas[servico] -= 1
+                time.sleep(stub.atrasos.get(servico, 0))
+                if falhar:
+                    return self._responder(503, {'erro': 'falha simulada'})
+                self._responder(200, RESPOSTAS[servico](parse_qs(url.query)))
+
+            def _responder(self, status, corpo):
+                dados = json.dumps(corpo).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(dados)))
+                self.end_headers()
+                try:
+                    self.wfile.write(dados)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Cliente desistiu (prazo esgotado) antes da resposta
+
+        return Manipulador
+
+    def __enter__(self):
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        for nome, url in self.urls().items():
+            variavel = f'SIR_URL_{nome.upper()}'
+            self._ambiente_anterior[variavel] = os.environ.get(variavel)
+            os.environ[variavel] = url
+        return self
+
+    def __exit__(self, *excecao):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+        for variavel, valor in self._ambiente_anterior.items():
+            if valor is None:
+                os.environ.pop(variavel, None)
+            else:
+                os.environ[variavel] = valor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--porta', type=int, default=8765)
+    args = parser.parse_args()
+
+    stub = ServidorStub(args.porta)
+    for nome, url in stub.urls().items():
+        print(f'export SIR_URL_{nome.upper()}={url}')
+    stub.servidor.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
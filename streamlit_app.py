@@ -1,15 +1,32 @@
 import streamlit as st
 import folium
+from folium import plugins
 import pandas as pd
 import numpy as np
-from streamlit_folium import st_folium
-import requests
+import streamlit_folium
 from datetime import datetime
-import zipfile
-import io
-import random
+import hashlib
+import importlib.metadata
+import inspect
 import os  # Adicionado para verificar arquivos
 
+from sir import roteamento
+from sir.atualizacao import Publicador
+from sir.cache import versao_datatran
+from sir.cliente_http import CLIENTE
+from sir.clima import ServicoClima
+from sir.concorrencia import Prazo
+from sir.datatran import resumo_carga
+from sir.hotspots import pontos_hotspots
+from sir.pontuacao import (RAIO_CORREDOR_LINHA_RETA_KM, Pontuador, montar_alternativas, montar_rota,
+                           montar_rota_segura, pontos_risco_corredor, pontos_risco_trajeto, resumir_clima,
+                           resumir_riscos)
+from sir.risco import RAIO_CORREDOR_KM
+from sir.rota_segura import CONDICOES_ROTA, LAMBDA_PADRAO, ROTULOS_CONDICAO, condicao_rota
+from sir.simplificacao import geometria_desenho, tamanho_payload
+from sir.simulacao import Simulador, simulador_do_ambiente
+from sir.roteamento import PRAZO_BUSCA_S
+
 # ⚙️ Configurações
 st.set_page_config(
     page_title="Sistema Inteligente de Rotas", 
@@ -142,70 +159,87 @@ ROTAS_POSSIVEIS = {
     }
 }
 
+# 🎯 Máximo de hotspots desenhados por rota no modo de bolhas individuais
+MAX_HOTSPOTS_MAPA = 300
+
+# 🔥 Modos de desenho dos pontos de risco
+MODO_RISCO_AUTOMATICO = "Automático"
+MODO_RISCO_BOLHAS = "Bolhas individuais"
+MODO_RISCO_CLUSTER = "Agrupado (cluster)"
+MODO_RISCO_CALOR = "Mapa de calor"
+MODOS_RISCO = [MODO_RISCO_AUTOMATICO, MODO_RISCO_BOLHAS, MODO_RISCO_CLUSTER, MODO_RISCO_CALOR]
+
+# Acima disso o modo automático troca as bolhas (um CircleMarker + popup HTML cada) pelo cluster
+MAX_BOLHAS_INDIVIDUAIS = 100
+
+# Bolha de risco criada no navegador a partir da linha compacta (ver linha_ponto_risco);
+# mesmas cores/tamanhos das bolhas individuais, popup montado só quando clicado
+CALLBACK_PONTO_RISCO = """
+var callback = function (row) {
+    var risco = row[2];
+    var cor = risco >= 0.7 ? '#FF0000' : (risco >= 0.5 ? '#FF6600' : '#FFD700');
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 5 + risco * 15, color: 'darkred', fillColor: cor, fillOpacity: 0.7, weight: 2
+    });
+    marker.bindPopup(function () {
+        var texto = function (valor) {
+            return String(valor).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+        };
+        var html = '<b>⚠️ ' + texto(row[3]) + '</b><br>'
+            + '🔥 Nível de Risco: ' + risco.toFixed(2) + '<br>'
+            + '📍 ' + texto(row[4]) + '<br>'
+            + '💥 ' + texto(row[5]) + '<br>';
+        if (row[6] > 0) { html += '💀 Mortos: ' + row[6] + '<br>'; }
+        if (row[7] > 0) { html += '🏥 Feridos: ' + row[7] + '<br>'; }
+        return html;
+    });
+    return marker;
+};
+"""
+
+# 🛡️ Critério da rota personalizada; a mais segura só existe com a malha local (SIR_GRAFO)
+CRITERIO_RAPIDA = "⚡ Mais rápida"
+CRITERIO_SEGURA = "🛡️ Mais segura"
+
+# 🔍 Zoom inicial do mapa; com rota personalizada, o mapa enquadra a rota (zoom da simplificação do desenho)
+ZOOM_INICIAL_MAPA = 6
+
 # 📊 Função para carregar e processar dados do DataTran
-@st.cache_data
+def localizar_datatran():
+    """Retorna (origem, rótulo) do datatran2025.zip: arquivo local ou upload"""
+    # Primeiro, tentar carregar do arquivo local no projeto
+    if os.path.exists('datatran2025.zip'):
+        return 'datatran2025.zip', 'automaticamente'
+    # Se não encontrou arquivo local, tentar do upload
+    if 'datatran2025.zip' in st.session_state:
+        return st.session_state['datatran2025.zip'], 'do upload'
+    return None, None
+
+# 🔄 Versão publicada do DataTran (tabela, índice espacial, agregados, hotspots e cubo),
+# compartilhada entre as sessões: um zip novo que só acrescenta acidentes é
+# incorporado sem recarga a frio, e cada rerun usa a versão que pegou no início
+@st.cache_resource(max_entries=4)
+def obter_publicador(chave):
+    """Publicador das versões do DataTran de uma origem (caminho local ou conteúdo do upload)"""
+    return Publicador()
+
+def sincronizar_datatran():
+    """(versão atual do DataTran, rótulo da origem), sem mensagens na tela; (None, None) sem arquivo"""
+    origem, rotulo = localizar_datatran()
+    if origem is None:
+        return None, None
+    # Upload: um publicador por conteúdo, senão sessões com arquivos diferentes se revezariam no mesmo
+    versao = versao_datatran(origem)
+    chave = os.path.abspath(origem) if isinstance(origem, str) else f"upload-{versao}"
+    return obter_publicador(chave).sincronizar(origem, versao), rotulo
+
 def carregar_datatran():
-    """Carrega dados do arquivo datatran2025.zip automaticamente"""
+    """Versão atual do DataTran (VersaoDataset), atualizada se o arquivo mudou; None sem arquivo"""
     try:
-        # Primeiro, tentar carregar do arquivo local no projeto
-        if os.path.exists('datatran2025.zip'):
-            with zipfile.ZipFile('datatran2025.zip') as zip_file:
-                for filename in zip_file.namelist():
-                    if filename.endswith(('.csv', '.xlsx')):
-                        with zip_file.open(filename) as file:
-                            if filename.endswith('.csv'):
-                                # Tentar diferentes encodings para CSV
-                                encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252', 'utf-8-sig']
-                                
-                                for encoding in encodings:
-                                    try:
-                                        file.seek(0)
-                                        df = pd.read_csv(file, encoding=encoding, sep=';')
-                                        st.success(f"✅ DataTran carregado automaticamente (encoding: {encoding})")
-                                        return df
-                                    except UnicodeDecodeError:
-                                        continue
-                                    except Exception:
-                                        try:
-                                            file.seek(0)
-                                            df = pd.read_csv(file, encoding=encoding, sep=',')
-                                            st.success(f"✅ DataTran carregado automaticamente (encoding: {encoding})")
-                                            return df
-                                        except:
-                                            continue
-                            else:
-                                df = pd.read_excel(file)
-                                st.success("✅ DataTran carregado automaticamente (Excel)")
-                                return df
-        
-        # Se não encontrou arquivo local, tentar do upload
-        if 'datatran2025.zip' in st.session_state:
-            with zipfile.ZipFile(st.session_state['datatran2025.zip']) as zip_file:
-                for filename in zip_file.namelist():
-                    if filename.endswith(('.csv', '.xlsx')):
-                        with zip_file.open(filename) as file:
-                            if filename.endswith('.csv'):
-                                encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252', 'utf-8-sig']
-                                for encoding in encodings:
-                                    try:
-                                        file.seek(0)
-                                        df = pd.read_csv(file, encoding=encoding, sep=';')
-                                        st.success(f"✅ DataTran carregado do upload (encoding: {encoding})")
-                                        return df
-                                    except UnicodeDecodeError:
-                                        continue
-                                    except Exception:
-                                        try:
-                                            file.seek(0)
-                                            df = pd.read_csv(file, encoding=encoding, sep=',')
-                                            st.success(f"✅ DataTran carregado do upload (encoding: {encoding})")
-                                            return df
-                                        except:
-                                            continue
-                            else:
-                                df = pd.read_excel(file)
-                                st.success("✅ DataTran carregado do upload (Excel)")
-                                return df
+        dados, rotulo = sincronizar_datatran()
+        if dados is not None:
+            st.success(f"✅ DataTran carregado {rotulo} ({resumo_carga(dados.info)})")
+            return dados
         
         st.warning("⚠️ Arquivo datatran2025.zip não encontrado - usando dados simulados")
         return None
@@ -214,392 +248,69 @@ def carregar_datatran():
         st.error(f"Erro ao carregar DataTran: {e}")
         return None
 
-# 🔍 Função para geocodificar endereços usando Nominatim (gratuito)
-@st.cache_data(ttl=3600)  # Cache por 1 hora
-def geocodificar_endereco(endereco):
-    """Converte endereço em coordenadas usando Nominatim (OpenStreetMap)"""
-    try:
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': f"{endereco}, Brasil",
-            'format': 'json',
-            'limit': 1,
-            'addressdetails': 1
-        }
-        headers = {
-            'User-Agent': 'Sistema-Rotas-App/1.0'  # Nominatim exige User-Agent
-        }
-        
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data:
-                resultado = data[0]
-                return {
-                    'lat': float(resultado['lat']),
-                    'lon': float(resultado['lon']),
-                    'display_name': resultado['display_name'],
-                    'cidade': resultado.get('address', {}).get('city', endereco),
-                    'status': 'sucesso'
-                }
-        
-        return {'status': 'erro', 'message': 'Endereço não encontrado'}
-        
-    except Exception as e:
-        return {'status': 'erro', 'message': f'Erro na geocodificação: {str(e)[:50]}...'}
+# 🗺️ Rota real seguindo estradas (roteamento e fallback ficam em sir.pontuacao)
+def criar_rota_personalizada(origem_coords, destino_coords, origem_nome, destino_nome, prazo=None):
+    """Calcula rota real seguindo estradas entre coordenadas personalizadas"""
+    rota = montar_rota(origem_coords, destino_coords, origem_nome, destino_nome, prazo)
+    rota['coordenadas_desenho'] = geometria_desenho(rota['coordenadas_rota'])  # Só para o mapa
+    return rota
 
-# 🗺️ Função para obter rota real seguindo estradas
-@st.cache_data(ttl=3600)  # Cache por 1 hora
-def obter_rota_real_estradas(origem_coords, destino_coords):
-    """Obtém rota real seguindo estradas usando OpenRouteService (gratuito)"""
-    try:
-        # Usar OpenRouteService (5000 requests/dia gratuitos)
-        # Alternativa: usar OSRM (completamente gratuito)
-        
-        # OSRM (Open Source Routing Machine) - Completamente gratuito
-        url = "http://router.project-osrm.org/route/v1/driving/"
-        coords = f"{origem_coords[1]},{origem_coords[0]};{destino_coords[1]},{destino_coords[0]}"
-        params = {
-            'overview': 'full',
-            'geometries': 'geojson',
-            'steps': 'true'
-        }
-        
-        response = requests.get(f"{url}{coords}", params=params, timeout=15)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            if data['code'] == 'Ok' and len(data['routes']) > 0:
-                route = data['routes'][0]
-                
-                # Extrair coordenadas da rota
-                coordinates = route['geometry']['coordinates']
-                # OSRM retorna [lon, lat], precisamos [lat, lon] para folium
-                rota_coords = [(coord[1], coord[0]) for coord in coordinates]
-                
-                return {
-                    'coordenadas': rota_coords,
-                    'distancia_real': round(route['distance'] / 1000, 1),  # metros para km
-                    'tempo_real': round(route['duration'] / 60, 0),  # segundos para minutos
-                    'status': 'sucesso',
-                    'fonte': 'OSRM (estradas reais)'
-                }
-        
-        # Fallback: se OSRM falhar, tentar GraphHopper (também gratuito)
-        return obter_rota_graphhopper(origem_coords, destino_coords)
-        
-    except Exception as e:
-        return {
-            'status': 'erro',
-            'message': f'Erro no roteamento: {str(e)[:50]}...',
-            'coordenadas': [origem_coords, destino_coords],  # Linha reta como fallback
-            'distancia_real': None,
-            'tempo_real': None
-        }
+# 🛡️ Rota mais segura: menor tempo + λ·risco de acidentes na malha local (sem ela, a rota normal)
+def criar_rota_segura(origem_coords, destino_coords, origem_nome, destino_nome, df_datatran, lambda_risco,
+                      condicao, prazo=None):
+    """Calcula a rota que equilibra tempo e exposição a acidentes na condição escolhida"""
+    rota = montar_rota_segura(origem_coords, destino_coords, origem_nome, destino_nome, df_datatran,
+                              lambda_risco, condicao, prazo)
+    rota['coordenadas_desenho'] = geometria_desenho(rota['coordenadas_rota'])  # Só para o mapa
+    return rota
 
-@st.cache_data(ttl=3600)
-def obter_rota_graphhopper(origem_coords, destino_coords):
-    """Fallback usando GraphHopper (também gratuito, mas com limite menor)"""
-    try:
-        url = "https://graphhopper.com/api/1/route"
-        params = {
-            'point': [f"{origem_coords[0]},{origem_coords[1]}", f"{destino_coords[0]},{destino_coords[1]}"],
-            'vehicle': 'car',
-            'locale': 'pt-BR',
-            'calc_points': 'true',
-            'type': 'json'
+# 🔀 Rota exibida (principal) e alternativas do roteador, roteadas uma vez por busca
+def buscar_alternativas(rota_dados):
+    """Rota exibida como alternativa 0 e as do roteador que não repetem a geometria dela"""
+    rotas = montar_alternativas(
+        rota_dados['origem_coords'], rota_dados['destino_coords'],
+        rota_dados['origem_nome'], rota_dados['destino_nome'], Prazo(PRAZO_BUSCA_S)
+    )
+    exibida = np.asarray(rota_dados['coordenadas_rota'], dtype=np.float64)
+    return [rota_dados] + [
+        rota for rota in rotas
+        if not np.array_equal(np.asarray(rota['coordenadas_rota'], dtype=np.float64), exibida)
+    ]
+
+def guardar_alternativas(rota_dados):
+    """Roteia as alternativas da rota e as guarda na sessão, junto com a assinatura dela"""
+    st.session_state['rotas_alternativas'] = {'rota': assinatura_rota(rota_dados),
+                                              'rotas': buscar_alternativas(rota_dados)}
+
+# 🔀 Alternativas pontuadas em paralelo (clima e corredor de acidentes) e ranqueadas; guardadas na sessão
+# por rota, versão do dataset e hora de partida, para os reruns não rotearem nem pontuarem de novo
+def analisar_alternativas(rota_dados, df_datatran, indice_espacial=None, cubo_risco=None):
+    """Alternativas da rota personalizada com risco condicionado a sair agora, da fronteira de Pareto às dominadas"""
+    assinatura = assinatura_rota(rota_dados)
+    roteadas = st.session_state.get('rotas_alternativas')
+    if roteadas is None or roteadas['rota'] != assinatura:
+        guardar_alternativas(rota_dados)
+        roteadas = st.session_state['rotas_alternativas']
+
+    partida = datetime.now()
+    chave = (assinatura, df_datatran.attrs.get('versao') if df_datatran is not None else None,
+             partida.strftime('%Y-%m-%d %H'))
+    pontuadas = st.session_state.get('alternativas_pontuadas')
+    if pontuadas is None or pontuadas['chave'] != chave:
+        pontuador = Pontuador(df_datatran, indice_espacial,
+                              obter_servico_clima(WEATHER_API_KEY, SEMENTE_SIMULACAO), cubo_risco)
+        pontuadas = st.session_state['alternativas_pontuadas'] = {
+            'chave': chave, 'alternativas': pontuador.pontuar_rotas(roteadas['rotas'], partida=partida)
         }
-        
-        response = requests.get(url, params=params, timeout=15)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            if len(data['paths']) > 0:
-                path = data['paths'][0]
-                
-                # Decodificar coordenadas (GraphHopper usa encoding especial)
-                points = path.get('points', {})
-                if 'coordinates' in points:
-                    # Coordenadas já decodificadas
-                    coordinates = points['coordinates']
-                    rota_coords = [(coord[1], coord[0]) for coord in coordinates]  # [lon,lat] -> [lat,lon]
-                else:
-                    # Usar apenas origem e destino
-                    rota_coords = [origem_coords, destino_coords]
-                
-                return {
-                    'coordenadas': rota_coords,
-                    'distancia_real': round(path['distance'] / 1000, 1),
-                    'tempo_real': round(path['time'] / 60000, 0),  # ms para minutos
-                    'status': 'sucesso',
-                    'fonte': 'GraphHopper (estradas reais)'
-                }
-    
-    except Exception:
-        pass
-    
-    # Último fallback: linha reta
-    return {
-        'status': 'fallback',
-        'coordenadas': [origem_coords, destino_coords],
-        'distancia_real': None,
-        'tempo_real': None,
-        'fonte': 'Linha reta (fallback)'
-    }
-def criar_rota_personalizada(origem_coords, destino_coords, origem_nome, destino_nome):
-    """Calcula rota real seguindo estradas entre coordenadas personalizadas"""
-    
-    # Obter rota real seguindo estradas
-    rota_real = obter_rota_real_estradas(origem_coords, destino_coords)
-    
-    if rota_real['status'] == 'sucesso':
-        # Usar dados reais da API de roteamento
-        distancia = rota_real['distancia_real']
-        tempo_minutos = rota_real['tempo_real']
-        tempo_formatado = f"{int(tempo_minutos // 60)}h{int(tempo_minutos % 60)}min" if tempo_minutos >= 60 else f"{int(tempo_minutos)}min"
-        coordenadas_rota = rota_real['coordenadas']
-        fonte_info = rota_real['fonte']
-    else:
-        # Fallback: cálculo manual (Haversine)
-        from math import radians, cos, sin, asin, sqrt
-        
-        def haversine(lon1, lat1, lon2, lat2):
-            lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-            dlon = lon2 - lon1
-            dlat = lat2 - lat1
-            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-            c = 2 * asin(sqrt(a))
-            r = 6371  # Raio da Terra em km
-            return c * r
-        
-        distancia = round(haversine(origem_coords[1], origem_coords[0], destino_coords[1], destino_coords[0]), 1)
-        tempo_estimado = distancia / 60  # Velocidade média urbana 60 km/h
-        tempo_formatado = f"{int(tempo_estimado)}h{int((tempo_estimado % 1) * 60)}min"
-        coordenadas_rota = [origem_coords, destino_coords]  # Linha reta
-        fonte_info = "Estimativa (linha reta)"
-    
-    return {
-        'distancia': distancia,
-        'tempo_estimado': tempo_formatado,
-        'origem_nome': origem_nome,
-        'destino_nome': destino_nome,
-        'origem_coords': origem_coords,
-        'destino_coords': destino_coords,
-        'coordenadas_rota': coordenadas_rota,  # Coordenadas da rota real
-        'fonte_roteamento': fonte_info,
-        'personalizada': True
-    }
-# 🔍 Função para gerar explicação inteligente do risco
-def gerar_explicacao_risco(ponto_risco, df_datatran=None):
-    """Gera explicação detalhada baseada nos dados REAIS do DataTran"""
-    
-    risco = ponto_risco.get("risco", 0.3)
-    detalhes = ponto_risco.get("detalhes", {})
-    nome = ponto_risco.get("nome", "Ponto de Risco")
-    
-    # Análise REAL dos dados do DataTran
-    fatores_identificados = []
-    tipo_problema = "trânsito/acidentes"  # Padrão: problemas de trânsito
-    recomendacoes = []
-    
-    # 1. ANÁLISE DE MORTALIDADE/GRAVIDADE
-    mortos = detalhes.get('mortos', 0)
-    feridos_graves = detalhes.get('feridos_graves', 0)
-    feridos_leves = detalhes.get('feridos_leves', 0)
-    total_feridos = detalhes.get('feridos', feridos_graves + feridos_leves)
-    
-    if mortos > 0:
-        fatores_identificados.append(f"💀 {mortos} morte(s) em acidentes de trânsito")
-        tipo_problema = "acidentes fatais"
-        recomendacoes.append("🚨 ATENÇÃO MÁXIMA: Local com acidentes mortais")
-    
-    if feridos_graves > 0:
-        fatores_identificados.append(f"🏥 {feridos_graves} ferido(s) grave(s)")
-        recomendacoes.append("⚠️ Risco alto de acidentes severos")
-    
-    if feridos_leves > 0:
-        fatores_identificados.append(f"🩹 {feridos_leves} ferido(s) leve(s)")
-    
-    # 2. ANÁLISE DO TIPO DE ACIDENTE
-    tipo_acidente = str(detalhes.get('tipo_acidente', '')).lower()
-    if tipo_acidente and tipo_acidente != 'n/a':
-        fatores_identificados.append(f"💥 Tipo: {detalhes.get('tipo_acidente', 'N/A')}")
-        
-        if any(palavra in tipo_acidente for palavra in ['tombamento', 'capotamento']):
-            recomendacoes.append("🔄 CUIDADO: Curvas perigosas ou velocidade excessiva")
-            recomendacoes.append("🐌 Reduzir velocidade significativamente")
-        elif any(palavra in tipo_acidente for palavra in ['colisão', 'choque']):
-            recomendacoes.append("👀 ATENÇÃO: Manter distância segura")
-            recomendacoes.append("🚦 Cuidado em cruzamentos e ultrapassagens")
-        elif 'atropelamento' in tipo_acidente:
-            recomendacoes.append("🚶 PERIGO: Área com pedestres")
-            recomendacoes.append("👀 Atenção redobrada para pessoas na via")
-    
-    # 3. ANÁLISE DA CAUSA DO ACIDENTE
-    causa_acidente = str(detalhes.get('causa_acidente', '')).lower()
-    if causa_acidente and causa_acidente != 'n/a':
-        if any(palavra in causa_acidente for palavra in ['velocidade', 'excesso']):
-            fatores_identificados.append("🏎️ Causa: Velocidade excessiva")
-            recomendacoes.append("🐌 REDUZIR VELOCIDADE obrigatoriamente")
-        elif any(palavra in causa_acidente for palavra in ['sono', 'fadiga', 'cansaço']):
-            fatores_identificados.append("😴 Causa: Sono/fadiga do condutor")
-            recomendacoes.append("☕ Fazer pausas frequentes para descanso")
-        elif any(palavra in causa_acidente for palavra in ['chuva', 'pista molhada']):
-            fatores_identificados.append("🌧️ Causa: Condições climáticas adversas")
-            recomendacoes.append("🌧️ Cuidado extra em dias chuvosos")
-        elif any(palavra in causa_acidente for palavra in ['ultrapassagem', 'conversão']):
-            fatores_identificados.append("🔄 Causa: Manobras perigosas")
-            recomendacoes.append("🚫 Evitar ultrapassagens arriscadas")
-    
-    # 4. ANÁLISE DE CONDIÇÕES DA VIA
-    condicao_meteorologica = str(detalhes.get('condicao_metereologica', '')).lower()
-    if 'chuva' in condicao_meteorologica:
-        fatores_identificados.append("🌧️ Acidentes em condições de chuva")
-        recomendacoes.append("☔ Extremo cuidado em dias chuvosos")
-    
-    tipo_pista = str(detalhes.get('tipo_pista', '')).lower()
-    if 'simples' in tipo_pista:
-        fatores_identificados.append("🛣️ Pista simples (mão dupla)")
-        recomendacoes.append("↔️ Atenção: ultrapassagens em pista dupla")
-    elif 'dupla' in tipo_pista:
-        fatores_identificados.append("🛣️ Pista dupla")
-    
-    # 5. CLASSIFICAÇÃO DE RISCO BASEADA EM DADOS REAIS
-    if risco >= 0.8:
-        classificacao = "🔴 CRÍTICO"
-        explicacao_geral = f"Este local tem ALTÍSSIMA incidência de acidentes de trânsito"
-        if mortos > 0:
-            explicacao_geral += f" com {mortos} morte(s) registrada(s)"
-    elif risco >= 0.6:
-        classificacao = "🟠 ALTO RISCO"
-        explicacao_geral = f"Este local apresenta ALTO índice de acidentes"
-        explicacao_geral += f" ({total_feridos} vítimas registradas)" if total_feridos > 0 else ""
-    elif risco >= 0.4:
-        classificacao = "🟡 RISCO MODERADO"
-        explicacao_geral = f"Este local tem ocorrências moderadas de acidentes"
-    else:
-        classificacao = "🟢 RISCO BAIXO"
-        explicacao_geral = f"Este local tem baixo histórico de acidentes"
-    
-    # 6. RECOMENDAÇÕES ESPECÍFICAS PARA TRÂNSITO (não criminalidade)
-    recomendacoes_gerais = []
-    
-    if risco >= 0.7:
-        recomendacoes_gerais.extend([
-            "🚨 LOCAL PERIGOSO - máxima atenção",
-            "🐌 Velocidade reduzida obrigatória",
-            "👥 Evitar viajar com sono ou cansaço",
-            "📱 GPS ativo para rotas alternativas"
-        ])
-    elif risco >= 0.5:
-        recomendacoes_gerais.extend([
-            "⚠️ Atenção redobrada necessária",
-            "🚗 Manter veículo em perfeito estado",
-            "👀 Não usar celular ao dirigir",
-            "⛽ Combustível suficiente"
-        ])
-    else:
-        recomendacoes_gerais.extend([
-            "✅ Trânsito relativamente seguro",
-            "🚗 Precauções normais de direção",
-            "📍 Respeitar sinalização local"
-        ])
-    
-    # 7. MONTAR EXPLICAÇÃO FOCADA EM DADOS REAIS
-    explicacao_completa = f"""
-<div style='max-width: 400px; font-size: 12px; line-height: 1.4;'>
-    <h4 style='margin: 5px 0; color: #333;'>📍 {nome}</h4>
-    <h5 style='margin: 5px 0;'>{classificacao} - Índice: {risco:.2f}</h5>
-    
-    <p style='margin: 5px 0; font-weight: bold; color: #d63384;'>{explicacao_geral}</p>
-    
-    <h6 style='margin: 8px 0 3px 0; color: #dc3545;'>📊 DADOS IDENTIFICADOS:</h6>
-    <ul style='margin: 0; padding-left: 15px; font-size: 11px;'>
-"""
-    
-    # Adicionar fatores reais identificados
-    if fatores_identificados:
-        for fator in fatores_identificados[:5]:  # Limitar para não ficar muito grande
-            explicacao_completa += f"<li>{fator}</li>"
-    else:
-        explicacao_completa += "<li>📈 Baseado em análise estatística regional</li>"
-    
-    # Adicionar informações da localização
-    municipio = detalhes.get('municipio', 'N/A')
-    if municipio != 'N/A':
-        explicacao_completa += f"<li>📍 Município: {municipio}</li>"
-    
-    explicacao_completa += f"""
-    </ul>
-    
-    <h6 style='margin: 8px 0 3px 0; color: #fd7e14;'>⚠️ PRECAUÇÕES RECOMENDADAS:</h6>
-    <ul style='margin: 0; padding-left: 15px; font-size: 11px;'>
-"""
-    
-    # Combinar recomendações específicas e gerais
-    todas_recomendacoes = recomendacoes + recomendacoes_gerais
-    for rec in todas_recomendacoes[:6]:  # Máximo 6 recomendações
-        explicacao_completa += f"<li>{rec}</li>"
-    
-    explicacao_completa += f"""
-    </ul>
-    
-    <div style='margin: 8px 0; padding: 5px; background: #f8f9fa; border-left: 3px solid #0d6efd;'>
-        <strong>💡 SOBRE OS DADOS:</strong><br>
-        <span style='font-size: 10px;'>
-        Análise baseada em registros reais de acidentes do DataTran/PRF. 
-        Este local apresenta padrão de <strong>{tipo_problema}</strong> que requer atenção especial.
-        </span>
-    </div>
-</div>
-"""
-    
-    return explicacao_completa
-def calcular_pontos_risco_reais(df_datatran, rota_info):
+    return pontuadas['alternativas']
+
+def calcular_pontos_risco_reais(df_datatran, rota_info, indice_espacial=None, coordenadas_rota=None,
+                                raio_km=RAIO_CORREDOR_LINHA_RETA_KM, agregados=None, hotspots=None):
     """Calcula pontos de risco baseado nos dados reais do DataTran"""
-    pontos_risco = []
-    
-    if df_datatran is not None:
-        # Filtrar acidentes nas BRs da rota
-        for br in rota_info["principais_brs"]:
-            acidentes_br = df_datatran[df_datatran['br'] == br]
-            
-            if not acidentes_br.empty:
-                # Agrupar por coordenadas aproximadas para criar clusters de risco
-                for _, acidente in acidentes_br.sample(min(10, len(acidentes_br))).iterrows():
-                    # Verificar se as coordenadas são válidas
-                    lat = acidente.get('latitude')
-                    lon = acidente.get('longitude')
-                    
-                    # Validar coordenadas
-                    if (pd.notna(lat) and pd.notna(lon) and 
-                        isinstance(lat, (int, float)) and isinstance(lon, (int, float)) and
-                        -90 <= lat <= 90 and -180 <= lon <= 180):
-                        
-                        # Calcular nível de risco baseado na gravidade
-                        risco = 0.3  # Base
-                        if 'mortos' in acidente and pd.notna(acidente['mortos']) and acidente['mortos'] > 0:
-                            risco += 0.4
-                        if 'feridos_graves' in acidente and pd.notna(acidente['feridos_graves']) and acidente['feridos_graves'] > 0:
-                            risco += 0.2
-                        if 'condicao_metereologica' in acidente and pd.notna(acidente['condicao_metereologica']):
-                            if 'chuva' in str(acidente['condicao_metereologica']).lower():
-                                risco += 0.1
-                        
-                        pontos_risco.append({
-                            "nome": f"BR-{br} KM {acidente.get('km', '?')}",
-                            "coords": (float(lat), float(lon)),  # Garantir que são float
-                            "risco": min(risco, 1.0),
-                            "detalhes": {
-                                "municipio": str(acidente.get('municipio', 'N/A'))[:50],  # Limitar tamanho
-                                "tipo_acidente": str(acidente.get('tipo_acidente', 'N/A'))[:50],
-                                "mortos": int(acidente.get('mortos', 0)) if pd.notna(acidente.get('mortos')) else 0,
-                                "feridos": int(acidente.get('feridos', 0)) if pd.notna(acidente.get('feridos')) else 0
-                            }
-                        })
+    pontos_risco = pontos_risco_corredor(
+        df_datatran, coordenadas_rota, rota_info["principais_brs"], indice_espacial, raio_km,
+        agregados, hotspots, limite_hotspots=MAX_HOTSPOTS_MAPA
+    )
     
     # Se não tem dados reais suficientes, usar pontos simulados da rota
     if len(pontos_risco) < 2:
@@ -607,6 +318,74 @@ def calcular_pontos_risco_reais(df_datatran, rota_info):
     
     return pontos_risco
 
+# 🔥 Bolhas de risco no mapa
+def adicionar_pontos_risco(mapa, pontos_risco, modo=MODO_RISCO_AUTOMATICO):
+    """Desenha os pontos de risco no modo escolhido (bolhas, cluster ou mapa de calor)"""
+    if modo == MODO_RISCO_AUTOMATICO:
+        modo = MODO_RISCO_BOLHAS if len(pontos_risco) <= MAX_BOLHAS_INDIVIDUAIS else MODO_RISCO_CLUSTER
+    
+    if modo == MODO_RISCO_CALOR:
+        # Uma camada só: intensidade pelo índice de risco
+        plugins.HeatMap(
+            [[round(p["coords"][0], 5), round(p["coords"][1], 5), round(p["risco"], 2)] for p in pontos_risco],
+            min_opacity=0.3, radius=12, blur=10
+        ).add_to(mapa)
+    elif modo == MODO_RISCO_CLUSTER:
+        # Uma camada só: linhas compactas e popup montado no navegador, ao clicar
+        plugins.FastMarkerCluster(
+            [linha_ponto_risco(ponto) for ponto in pontos_risco],
+            callback=CALLBACK_PONTO_RISCO,
+            disableClusteringAtZoom=11
+        ).add_to(mapa)
+    else:
+        adicionar_bolhas_risco(mapa, pontos_risco)
+
+def linha_ponto_risco(ponto):
+    """Ponto de risco como linha compacta: [lat, lon, risco, nome, município, tipo, mortos, feridos]"""
+    detalhes = ponto.get('detalhes', {})
+    return [
+        round(ponto["coords"][0], 5), round(ponto["coords"][1], 5), round(ponto["risco"], 2), ponto['nome'],
+        detalhes.get('municipio', 'N/A'), detalhes.get('tipo_acidente', 'N/A'),
+        int(detalhes.get('mortos', 0)), int(detalhes.get('feridos', 0))
+    ]
+
+def adicionar_bolhas_risco(mapa, pontos_risco):
+    """Desenha cada ponto de risco como bolha (tamanho e cor pelo nível de risco)"""
+    for ponto in pontos_risco:
+        # Tamanho da bolha baseado no nível de risco
+        raio = 5 + (ponto["risco"] * 15)  # 5-20px
+        
+        # Cor da bolha baseada no risco
+        if ponto["risco"] >= 0.7:
+            cor_bolha = '#FF0000'  # Vermelho forte
+        elif ponto["risco"] >= 0.5:
+            cor_bolha = '#FF6600'  # Laranja
+        else:
+            cor_bolha = '#FFD700'  # Amarelo
+        
+        # Criar popup com detalhes
+        popup_content = f"<b>⚠️ {ponto['nome']}</b><br>"
+        popup_content += f"🔥 Nível de Risco: {ponto['risco']:.2f}<br>"
+        
+        if 'detalhes' in ponto:
+            detalhes = ponto['detalhes']
+            popup_content += f"📍 {detalhes.get('municipio', 'N/A')}<br>"
+            popup_content += f"💥 {detalhes.get('tipo_acidente', 'N/A')}<br>"
+            if detalhes.get('mortos', 0) > 0:
+                popup_content += f"💀 Mortos: {detalhes['mortos']}<br>"
+            if detalhes.get('feridos', 0) > 0:
+                popup_content += f"🏥 Feridos: {detalhes['feridos']}<br>"
+        
+        folium.CircleMarker(
+            location=ponto["coords"],
+            radius=raio,
+            popup=popup_content,
+            color='darkred',
+            fillColor=cor_bolha,
+            fillOpacity=0.7,
+            weight=2
+        ).add_to(mapa)
+
 # 🗺️ Função para criar mapa interativo
 def criar_mapa_rotas(rotas_selecionadas, mostrar_riscos, df_datatran):
     """Cria mapa com múltiplas rotas e pontos de risco"""
@@ -620,13 +399,14 @@ def criar_mapa_rotas(rotas_selecionadas, mostrar_riscos, df_datatran):
         height='100%'  # Altura total disponível
     )
     
-def criar_mapa_rotas(rotas_selecionadas, mostrar_riscos, df_datatran):
+def criar_mapa_rotas(rotas_selecionadas, mostrar_riscos, df_datatran, indice_espacial=None, agregados=None,
+                     hotspots=None, modo_riscos=MODO_RISCO_AUTOMATICO):
     """Cria mapa com múltiplas rotas e pontos de risco"""
     
     # Centro do Brasil (aproximadamente)
     mapa = folium.Map(
         location=[-23.5505, -46.6333],
-        zoom_start=6,
+        zoom_start=ZOOM_INICIAL_MAPA,
         tiles="OpenStreetMap",
         width='100%',  # Largura total disponível
         height='100%'  # Altura total disponível
@@ -661,15 +441,22 @@ def criar_mapa_rotas(rotas_selecionadas, mostrar_riscos, df_datatran):
                              f"⏱️ {rota_pers['tempo_estimado']}<br>" \
                              f"📐 Linha reta (estimativa)"
             
-            # Adicionar linha da rota personalizada
+            # Adicionar linha da rota personalizada (geometria simplificada só para o desenho)
+            coordenadas_desenho = rota_pers.get('coordenadas_desenho')
+            if coordenadas_desenho is None:
+                coordenadas_desenho = geometria_desenho(coordenadas_rota)
             folium.PolyLine(
-                locations=coordenadas_rota,
+                locations=coordenadas_desenho,
                 color=cor_rota,
                 weight=4,
                 opacity=0.8,
                 popup=popup_texto
             ).add_to(mapa)
-            
+
+            # Enquadrar a rota: é o zoom para o qual o desenho foi simplificado
+            pontos_rota = np.asarray(coordenadas_rota, dtype=np.float64).reshape(-1, 2)
+            mapa.fit_bounds([pontos_rota.min(axis=0).tolist(), pontos_rota.max(axis=0).tolist()])
+
             # Marcadores para rota personalizada
             folium.Marker(
                 location=rota_pers['origem_coords'],
@@ -683,6 +470,17 @@ def criar_mapa_rotas(rotas_selecionadas, mostrar_riscos, df_datatran):
                 icon=folium.Icon(color='green', icon='stop')
             ).add_to(mapa)
             
+            # Hotspots ao longo da rota personalizada
+            if mostrar_riscos and hotspots is not None:
+                raio_km = RAIO_CORREDOR_KM if len(coordenadas_rota) > 2 else RAIO_CORREDOR_LINHA_RETA_KM
+                adicionar_pontos_risco(
+                    mapa, pontos_hotspots(
+                        hotspots.no_corredor(coordenadas_rota, raio_km),
+                        limite=MAX_HOTSPOTS_MAPA if modo_riscos == MODO_RISCO_BOLHAS else None
+                    ),
+                    modo_riscos
+                )
+            
         else:
             # Rota pré-definida
             origem, destino = rota
@@ -718,45 +516,106 @@ def criar_mapa_rotas(rotas_selecionadas, mostrar_riscos, df_datatran):
             
             # Adicionar pontos de risco se ativado
             if mostrar_riscos:
-                pontos_risco = calcular_pontos_risco_reais(df_datatran, rota_info)
+                pontos_risco = calcular_pontos_risco_reais(
+                    df_datatran, rota_info, indice_espacial,
+                    [CIDADES_BASE[origem]["coords"], CIDADES_BASE[destino]["coords"]],
+                    agregados=agregados, hotspots=hotspots
+                )
                 
-                for ponto in pontos_risco:
-                    # Tamanho da bolha baseado no nível de risco
-                    raio = 5 + (ponto["risco"] * 15)  # 5-20px
-                    
-                    # Cor da bolha baseada no risco
-                    if ponto["risco"] >= 0.7:
-                        cor_bolha = '#FF0000'  # Vermelho forte
-                    elif ponto["risco"] >= 0.5:
-                        cor_bolha = '#FF6600'  # Laranja
-                    else:
-                        cor_bolha = '#FFD700'  # Amarelo
-                    
-                    # Criar popup com detalhes
-                    popup_content = f"<b>⚠️ {ponto['nome']}</b><br>"
-                    popup_content += f"🔥 Nível de Risco: {ponto['risco']:.2f}<br>"
-                    
-                    if 'detalhes' in ponto:
-                        detalhes = ponto['detalhes']
-                        popup_content += f"📍 {detalhes.get('municipio', 'N/A')}<br>"
-                        popup_content += f"💥 {detalhes.get('tipo_acidente', 'N/A')}<br>"
-                        if detalhes.get('mortos', 0) > 0:
-                            popup_content += f"💀 Mortos: {detalhes['mortos']}<br>"
-                        if detalhes.get('feridos', 0) > 0:
-                            popup_content += f"🏥 Feridos: {detalhes['feridos']}<br>"
-                    
-                    folium.CircleMarker(
-                        location=ponto["coords"],
-                        radius=raio,
-                        popup=popup_content,
-                        color='darkred',
-                        fillColor=cor_bolha,
-                        fillOpacity=0.7,
-                        weight=2
-                    ).add_to(mapa)
+                adicionar_pontos_risco(mapa, pontos_risco, modo_riscos)
     
     return mapa
 
+# 🧊 Cache do mapa já serializado: cliques e widgets que não mudam as entradas não o reconstroem
+def assinatura_rota(rota_dados):
+    """Hash da geometria e dos dados exibidos de uma rota personalizada"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(rota_dados['coordenadas_rota'], dtype=np.float64).tobytes())
+    digest.update(repr((
+        rota_dados['origem_nome'], rota_dados['destino_nome'], rota_dados['origem_coords'],
+        rota_dados['destino_coords'], rota_dados['distancia'], rota_dados['tempo_estimado'],
+        rota_dados.get('fonte_roteamento')
+    )).encode('utf-8'))
+    return digest.hexdigest()
+
+def chave_mapa(rotas_selecionadas, mostrar_riscos, modo_riscos, versao):
+    """Tudo que muda o mapa: rotas, riscos, modo de desenho, versão do dataset e geometria"""
+    geometria = None
+    if 'PERSONALIZADA' in rotas_selecionadas and 'rota_personalizada' in st.session_state:
+        geometria = assinatura_rota(st.session_state['rota_personalizada'])
+    return (tuple(rotas_selecionadas), mostrar_riscos, modo_riscos, versao, geometria)
+
+# O atalho abaixo repete o corpo do st_folium do streamlit-folium 0.19 (funções internas e argumentos do
+# componente); com outra versão, ou se algum interno sumir, o mapa vai pelo st_folium público
+INTERNOS_STREAMLIT_FOLIUM = ('_get_map_string', '_get_siblings', '_component_func', 'get_full_id', 'generate_js_hash')
+PARAMETROS_ST_FOLIUM = {'key', 'height', 'width', 'returned_objects', 'zoom', 'center', 'feature_group_to_add',
+                        'return_on_hover', 'layer_control', 'pixelated'}
+
+def atalho_mapa_disponivel():
+    """True se o streamlit-folium instalado é o 0.19 e tem os internos e argumentos que o atalho usa"""
+    try:
+        versao = importlib.metadata.version('streamlit-folium')
+    except importlib.metadata.PackageNotFoundError:
+        return False
+    return (
+        versao.split('.')[:2] == ['0', '19']
+        and all(hasattr(streamlit_folium, nome) for nome in INTERNOS_STREAMLIT_FOLIUM)
+        and PARAMETROS_ST_FOLIUM <= set(inspect.signature(streamlit_folium.st_folium).parameters)
+    )
+
+ATALHO_MAPA_SERIALIZADO = atalho_mapa_disponivel()
+
+@st.cache_resource(max_entries=16)
+def obter_mapa_serializado(chave, _construir_mapa):
+    """Constrói o mapa e guarda o script/HTML que o st_folium mandaria ao navegador"""
+    mapa = _construir_mapa()
+    # Mesma sequência do st_folium (streamlit-folium 0.19): render, script, irmãos, id
+    mapa.render()
+    script = streamlit_folium._get_map_string(mapa)
+    return {
+        'script': script,
+        'html': streamlit_folium._get_siblings(mapa),
+        'id': streamlit_folium.get_full_id(mapa),
+        'chave': streamlit_folium.generate_js_hash(script, None, False),
+        'limites': mapa.get_bounds(),
+        'zoom': mapa.options.get('zoom')
+    }
+
+def exibir_mapa_serializado(mapa_serializado, width, height, returned_objects):
+    """Equivalente ao st_folium para um mapa já serializado (mesmo componente e mesma chave)"""
+    (lat_sul, lon_oeste), (lat_norte, lon_leste) = mapa_serializado['limites']
+    padroes = {
+        "last_clicked": None,
+        "last_object_clicked": None,
+        "last_object_clicked_tooltip": None,
+        "last_object_clicked_popup": None,
+        "all_drawings": None,
+        "last_active_drawing": None,
+        "bounds": {
+            "_southWest": {"lat": lat_sul, "lng": lon_oeste},
+            "_northEast": {"lat": lat_norte, "lng": lon_leste}
+        },
+        "zoom": mapa_serializado['zoom'],
+        "last_circle_radius": None,
+        "last_circle_polygon": None
+    }
+    return streamlit_folium._component_func(
+        script=mapa_serializado['script'],
+        html=mapa_serializado['html'],
+        id=mapa_serializado['id'],
+        key=mapa_serializado['chave'],
+        height=height,
+        width=width,
+        returned_objects=returned_objects,
+        default={k: v for k, v in padroes.items() if k in returned_objects},
+        zoom=None,
+        center=None,
+        feature_group=None,
+        return_on_hover=False,
+        layer_control=None,
+        pixelated=False
+    )
+
 # 🌤️ Configuração da API climática
 # Busca a chave nos secrets do Streamlit Cloud
 try:
@@ -765,113 +624,27 @@ except KeyError:
     WEATHER_API_KEY = None
     st.error("⚠️ WEATHER_API_KEY não encontrada nos secrets do Streamlit Cloud")
 
-@st.cache_data(ttl=1800)  # Cache por 30 minutos
-def obter_clima_atual(cidade):
-    """Obtém condições climáticas atuais usando WeatherAPI"""
-    
-    if not WEATHER_API_KEY:
-        # Se não tem API key configurada, usar dados simulados
-        condicoes = ['Ensolarado', 'Parcialmente nublado', 'Nublado', 'Chuva leve', 'Chuva forte']
-        temperatura = random.randint(18, 32)
-        condicao = random.choice(condicoes)
-        
-        return {
-            "temperatura": temperatura,
-            "condicao": condicao,
-            "umidade": random.randint(40, 80),
-            "vento_kph": random.randint(5, 25),
-            "risco_climatico": 0.7 if 'forte' in condicao else 0.3 if 'Chuva' in condicao else 0.1,
-            "api_status": "⚠️ API key não configurada - dados simulados"
-        }
-    
-    try:
-        # URL da WeatherAPI (weatherapi.com)
-        url = f"http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHER_API_KEY,
-            'q': f"{cidade}, Brasil",
-            'lang': 'pt',
-            'aqi': 'no'
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Extrair dados relevantes
-            current = data['current']
-            condicao = current['condition']['text']
-            temperatura = current['temp_c']
-            umidade = current['humidity']
-            vento_kph = current['wind_kph']
-            
-            # Calcular risco climático baseado nas condições
-            risco_climatico = 0.1  # Base
-            
-            # Aumentar risco por condições adversas
-            condicao_lower = condicao.lower()
-            if any(palavra in condicao_lower for palavra in ['chuva forte', 'tempestade', 'temporal']):
-                risco_climatico += 0.7
-            elif any(palavra in condicao_lower for palavra in ['chuva', 'chuvisco', 'garoa']):
-                risco_climatico += 0.4
-            elif any(palavra in condicao_lower for palavra in ['nevoeiro', 'neblina', 'cerração']):
-                risco_climatico += 0.5
-            elif 'nublado' in condicao_lower:
-                risco_climatico += 0.1
-                
-            # Ajustar por vento forte
-            if vento_kph > 50:
-                risco_climatico += 0.3
-            elif vento_kph > 30:
-                risco_climatico += 0.1
-                
-            # Ajustar por umidade muito alta
-            if umidade > 85:
-                risco_climatico += 0.1
-            
-            return {
-                "temperatura": temperatura,
-                "condicao": condicao,
-                "umidade": umidade,
-                "vento_kph": vento_kph,
-                "risco_climatico": min(risco_climatico, 1.0),
-                "api_status": "✅ Dados reais da WeatherAPI"
-            }
-        
-        elif response.status_code == 401:
-            st.error("🔑 API key inválida ou expirada")
-        elif response.status_code == 403:
-            st.error("🚫 Cota da API esgotada")
-        else:
-            st.warning(f"⚠️ API retornou erro {response.status_code}")
-            
-    except requests.exceptions.Timeout:
-        st.warning("⏱️ Timeout na API climática - usando dados simulados")
-    except requests.exceptions.RequestException as e:
-        st.warning(f"🌐 Erro na conexão com API: {str(e)[:50]}...")
-    except Exception as e:
-        st.warning(f"❌ Erro inesperado: {str(e)[:50]}...")
-    
-    # Fallback: dados simulados se API falhar
-    condicoes = ['Ensolarado', 'Parcialmente nublado', 'Nublado', 'Chuva leve', 'Chuva forte']
-    temperatura = random.randint(18, 32)
-    condicao = random.choice(condicoes)
-    
-    return {
-        "temperatura": temperatura,
-        "condicao": condicao,
-        "umidade": random.randint(40, 80),
-        "vento_kph": random.randint(5, 25),
-        "risco_climatico": 0.7 if 'forte' in condicao else 0.3 if 'Chuva' in condicao else 0.1,
-        "api_status": "⚠️ Dados simulados (API indisponível)"
-    }
+# 🌦️ Serviço de clima do processo: cache por geohash + janela de 30 min, consultas coalescidas
+@st.cache_resource
+def obter_servico_clima(chave_api, semente_simulacao):
+    """Clima em lote ao longo das rotas (WeatherAPI, ou simulado e determinístico)"""
+    simulador = Simulador(semente_simulacao) if semente_simulacao is not None else None
+    return ServicoClima(chave_api, simulador)
+
+# 🧪 Modo simulação (SIR_SIMULACAO=<semente>): clima, geocodificação e rotas sem rede e reprodutíveis
+SIMULADOR = simulador_do_ambiente()
+SEMENTE_SIMULACAO = SIMULADOR.semente if SIMULADOR is not None else None
 
 # 🎛️ Interface Principal
 st.markdown('<div class="main-header"><h1>🛣️ Sistema Inteligente de Rotas</h1><p>Análise avançada de riscos com dados reais do DataTran</p></div>', unsafe_allow_html=True)
 
 # Sidebar para controles
 with st.sidebar:
+    if SIMULADOR is not None:
+        st.info(f"🧪 Modo simulação ativo (semente {SIMULADOR.semente}): sem chamadas externas")
+    elif os.environ.get('SIR_GRAFO'):
+        st.info(f"🗺️ Rotas pela malha local {os.path.basename(os.environ['SIR_GRAFO'])}: sem OSRM/GraphHopper")
+    
     # Upload opcional (só se não encontrar arquivo local)
     if not os.path.exists('datatran2025.zip'):
         st.markdown("### 📁 Upload de Dados (Opcional)")
@@ -907,30 +680,63 @@ with st.sidebar:
         help="Digite o endereço completo (rua, número, cidade, estado)"
     )
     
+    # 🛡️ Rota mais segura: só com a malha local, onde o peso de cada trecho pode incluir o risco
+    criterio_rota = CRITERIO_RAPIDA
+    if roteamento.grafo_local() is not None:
+        criterio_rota = st.radio("🧭 Critério da rota", [CRITERIO_RAPIDA, CRITERIO_SEGURA], horizontal=True)
+        if criterio_rota == CRITERIO_SEGURA:
+            lambda_risco = st.slider(
+                "⚖️ Peso do risco (λ)", 0.0, 5.0, LAMBDA_PADRAO, 0.25,
+                help="0 = rota mais rápida; 1 = o risco médio da malha pesa tanto quanto o tempo"
+            )
+            condicao_segura = st.selectbox(
+                "🌧️ Condição da viagem", CONDICOES_ROTA,
+                index=CONDICOES_ROTA.index(condicao_rota(datetime.now().hour)),
+                format_func=ROTULOS_CONDICAO.get,
+                help="Acidentes com chuva e/ou à noite pesam mais nos trechos onde essas condições são críticas"
+            )
+    
     if endereco_origem and endereco_destino:
         if st.button("🔍 Buscar Rota Personalizada", type="primary"):
             with st.spinner("Geocodificando endereços..."):
-                # Geocodificar origem
-                result_origem = geocodificar_endereco(endereco_origem)
-                result_destino = geocodificar_endereco(endereco_destino)
+                # Prazo único para a busca inteira; a geocodificação usa o cache persistente em disco
+                prazo = Prazo(PRAZO_BUSCA_S)
+                result_origem, result_destino = roteamento.geocodificar_lote([endereco_origem, endereco_destino], prazo)
                 
                 if result_origem['status'] == 'sucesso' and result_destino['status'] == 'sucesso':
                     # Criar rota personalizada
-                    rota_personalizada = criar_rota_personalizada(
-                        (result_origem['lat'], result_origem['lon']),
-                        (result_destino['lat'], result_destino['lon']),
-                        result_origem['cidade'],
-                        result_destino['cidade']
-                    )
+                    if criterio_rota == CRITERIO_SEGURA:
+                        dados_atuais, _ = sincronizar_datatran()
+                        rota_personalizada = criar_rota_segura(
+                            (result_origem['lat'], result_origem['lon']),
+                            (result_destino['lat'], result_destino['lon']),
+                            result_origem['cidade'],
+                            result_destino['cidade'],
+                            dados_atuais.df if dados_atuais is not None else None,
+                            lambda_risco,
+                            condicao_segura,
+                            prazo
+                        )
+                    else:
+                        rota_personalizada = criar_rota_personalizada(
+                            (result_origem['lat'], result_origem['lon']),
+                            (result_destino['lat'], result_destino['lon']),
+                            result_origem['cidade'],
+                            result_destino['cidade'],
+                            prazo
+                        )
                     
-                    # Salvar na sessão
+                    # Salvar na sessão, com as alternativas (pontuadas na aba da rota)
                     st.session_state['rota_personalizada'] = rota_personalizada
+                    guardar_alternativas(rota_personalizada)
                     st.session_state['enderecos_geocodificados'] = {
                         'origem': result_origem,
                         'destino': result_destino
                     }
                     
                     st.success(f"✅ Rota encontrada: {rota_personalizada['distancia']} km, {rota_personalizada['tempo_estimado']}")
+                    if criterio_rota == CRITERIO_SEGURA and not rota_personalizada.get('rota_segura'):
+                        st.warning("⚠️ Rota mais segura indisponível (sem DataTran ou fora da malha local): rota normal")
                     
                 else:
                     if result_origem['status'] == 'erro':
@@ -970,6 +776,20 @@ with st.sidebar:
         st.markdown("**💡 Passe o mouse para ver resumo rápido**")
         st.markdown("**🖱️ Clique nas bolhas para análise detalhada**")
         st.markdown("**ℹ️ Base: Acidentes de trânsito reais (DataTran/PRF)**")
+        
+        modo_riscos = st.selectbox(
+            "🎨 Desenho dos pontos de risco",
+            MODOS_RISCO,
+            help=f"Automático: bolhas individuais até {MAX_BOLHAS_INDIVIDUAIS} pontos, cluster acima disso"
+        )
+    else:
+        modo_riscos = MODO_RISCO_AUTOMATICO
+    
+    # 📡 Saúde dos serviços externos: latência, erros e estado do disjuntor
+    with st.expander("📡 Serviços externos"):
+        st.dataframe(pd.DataFrame(CLIENTE.metricas()).T, use_container_width=True)
+        cache_rotas = roteamento.cache_rotas().resumo()
+        st.caption(f"🗺️ Cache de rotas: {cache_rotas['acertos']} acerto(s), {cache_rotas['falhas']} falha(s)")
 
 # Conteúdo principal
 if not rotas_selecionadas:
@@ -1004,9 +824,19 @@ if not rotas_selecionadas:
     st.stop()
 
 # Carregar dados do DataTran
-df_datatran = carregar_datatran()
+dados_datatran = carregar_datatran()
 
-if df_datatran is not None:
+df_datatran = None
+indice_espacial = None
+agregados_risco = None
+hotspots_risco = None
+cubo_risco = None
+if dados_datatran is not None:
+    df_datatran = dados_datatran.df
+    indice_espacial = dados_datatran.indice
+    agregados_risco = dados_datatran.agregados
+    hotspots_risco = dados_datatran.hotspots
+    cubo_risco = dados_datatran.cubo
     st.info(f"📊 Dados carregados: {len(df_datatran):,} registros de acidentes")
 else:
     st.warning("⚠️ Usando dados simulados. Faça upload do datatran2025.zip para análise real.")
@@ -1052,8 +882,22 @@ if rotas_selecionadas:
 # Mapa principal
 st.markdown("### 🗺️ Mapa Interativo de Rotas")
 
-mapa = criar_mapa_rotas(rotas_selecionadas, mostrar_riscos, df_datatran)
-mapa_data = st_folium(mapa, width=1400, height=700, returned_objects=["last_object_clicked"])
+def construir_mapa():
+    return criar_mapa_rotas(rotas_selecionadas, mostrar_riscos, df_datatran, indice_espacial, agregados_risco,
+                            hotspots_risco, modo_riscos)
+
+if ATALHO_MAPA_SERIALIZADO:
+    mapa_serializado = obter_mapa_serializado(
+        chave_mapa(rotas_selecionadas, mostrar_riscos, modo_riscos,
+                   df_datatran.attrs.get('versao') if df_datatran is not None else None),
+        construir_mapa
+    )
+    mapa_data = exibir_mapa_serializado(mapa_serializado, width=1400, height=700,
+                                        returned_objects=["last_object_clicked"])
+else:
+    # Sem o atalho: mapa reconstruído a cada rerun (um folium.Map não pode ser renderizado duas vezes)
+    mapa_data = streamlit_folium.st_folium(construir_mapa(), key="mapa_rotas", width=1400, height=700,
+                                           returned_objects=["last_object_clicked"])
 
 # Análise detalhada das rotas
 if rotas_selecionadas:
@@ -1089,18 +933,37 @@ if rotas_selecionadas:
                     st.write(f"📏 **Distância:** {rota_dados['distancia']} km")
                     st.write(f"⏱️ **Tempo Estimado:** {rota_dados['tempo_estimado']}")
                     st.write(f"🛣️ **Roteamento:** {rota_dados.get('fonte_roteamento', 'Geocodificação')}")
+                    segura = rota_dados.get('rota_segura')
+                    if segura:
+                        st.write(
+                            f"🛡️ **Mais segura** ({ROTULOS_CONDICAO[segura['condicao']]}, λ={segura['lambda']:g}): "
+                            f"{segura['reducao_risco']:.0%} menos risco que a mais rápida, "
+                            f"+{segura['tempo_extra_min']:.0f} min e {segura['distancia_extra_km']:+.1f} km"
+                        )
                     
                     # Indicar se é rota real ou estimada
                     if 'coordenadas_rota' in rota_dados and len(rota_dados['coordenadas_rota']) > 2:
                         st.success("✅ Rota real seguindo estradas")
                         st.write(f"📍 **Pontos da rota:** {len(rota_dados['coordenadas_rota'])} coordenadas")
+                        desenho = rota_dados.get('coordenadas_desenho')
+                        if desenho is None:
+                            desenho = geometria_desenho(rota_dados['coordenadas_rota'])
+                        st.write(
+                            f"🗜️ **Desenho no mapa:** {len(desenho)} pontos • "
+                            f"{tamanho_payload(rota_dados['coordenadas_rota']) / 1024:.0f} KB → "
+                            f"{tamanho_payload(desenho) / 1024:.1f} KB"
+                        )
                     else:
                         st.info("📐 Estimativa em linha reta")
                 
                 with col2:
                     st.markdown("**🌤️ Condições Climáticas Reais**")
-                    clima_origem = obter_clima_atual(rota_dados['origem_nome'])
-                    clima_destino = obter_clima_atual(rota_dados['destino_nome'])
+                    # Clima amostrado ao longo da rota, todos os pontos consultados ao mesmo tempo
+                    clima_rota = obter_servico_clima(WEATHER_API_KEY, SEMENTE_SIMULACAO).clima_rota(
+                        rota_dados.get('coordenadas_rota', [rota_dados['origem_coords'], rota_dados['destino_coords']])
+                    )
+                    clima_origem = clima_rota['pontos'][0]['clima']
+                    clima_destino = clima_rota['pontos'][-1]['clima']
                     
                     # Mostrar informações detalhadas
                     st.write(f"🌡️ **{rota_dados['origem_nome']}:**")
@@ -1115,8 +978,15 @@ if rotas_selecionadas:
                     st.write(f"   • 💨 Vento: {clima_destino['vento_kph']} km/h")
                     st.write(f"   • {clima_destino['api_status']}")
                     
-                    # Análise de risco climático combinado
-                    risco_climatico = (clima_origem['risco_climatico'] + clima_destino['risco_climatico']) / 2
+                    # Análise de risco climático combinado (média dos trechos da rota)
+                    resumo_clima = resumir_clima(clima_rota)
+                    risco_climatico = resumo_clima['risco_climatico']
+                    pior_trecho = resumo_clima['pior_trecho']
+                    st.write(
+                        f"🛣️ **Pior trecho:** km {pior_trecho['km_inicio']:.0f}–{pior_trecho['km_fim']:.0f} "
+                        f"({pior_trecho['condicao']}, risco {pior_trecho['risco_climatico']:.2f}) • "
+                        f"{len(clima_rota['pontos'])} pontos consultados"
+                    )
                     
                     if risco_climatico > 0.6:
                         st.error(f"🔴 **Alto risco climático:** {risco_climatico:.2f}")
@@ -1132,60 +1002,102 @@ if rotas_selecionadas:
                     st.markdown("**⚠️ Análise de Riscos da Rota**")
                     
                     # Calcular pontos de risco para a rota personalizada
-                        if 'coordenadas_rota' in rota_dados and df_datatran is not None:
-                            pontos_risco = calcular_pontos_risco_rota_personalizada(
-                                df_datatran, 
-                                rota_dados.get('coordenadas_rota', [rota_dados['origem_coords'], rota_dados['destino_coords']]),
-                                rota_dados['origem_nome'],
-                                rota_dados['destino_nome']
+                    if 'coordenadas_rota' in rota_dados and df_datatran is not None:
+                        pontos_risco = pontos_risco_trajeto(
+                            df_datatran, 
+                            rota_dados.get('coordenadas_rota', [rota_dados['origem_coords'], rota_dados['destino_coords']]),
+                            rota_dados['origem_nome'],
+                            rota_dados['destino_nome'],
+                            indice_espacial
+                        )
+                        if pontos_risco:
+                            resumo_riscos = resumir_riscos(pontos_risco)
+                            risco_medio = resumo_riscos['risco_medio']
+                            pontos_criticos = resumo_riscos['pontos_criticos']
+                            
+                            st.metric("Risco Médio da Rota", f"{risco_medio:.2f}", f"{len(pontos_risco)} pontos identificados")
+                            st.metric("Pontos Críticos", pontos_criticos)
+                            
+                            # Risco saindo agora: horário de passagem e clima atual em cada trecho
+                            coordenadas_rota = rota_dados['coordenadas_rota']
+                            condicionado = cubo_risco.risco_rota(
+                                indice_espacial, coordenadas_rota, datetime.now(),
+                                rota_dados.get('tempo_minutos', rota_dados['distancia']), clima_rota,
+                                raio_km=RAIO_CORREDOR_KM if len(coordenadas_rota) > 2 else RAIO_CORREDOR_LINHA_RETA_KM
                             )
+                            if condicionado['risco_condicionado'] is not None:
+                                st.metric(
+                                    "Risco Saindo Agora", f"{condicionado['risco_condicionado']:.2f}",
+                                    f"{condicionado['risco_condicionado'] - condicionado['risco_sem_condicao']:+.2f} "
+                                    "pelo horário e clima", delta_color="inverse"
+                                )
+                            
+                            if risco_medio >= 0.7:
+                                st.error("🔴 **Rota de Alto Risco**")
+                                st.write("• Múltiplos acidentes registrados")
+                                st.write("• Extrema cautela recomendada")
+                            elif risco_medio >= 0.4:
+                                st.warning("🟡 **Rota de Risco Moderado**")
+                                st.write("• Alguns pontos de atenção")
+                                st.write("• Precauções básicas necessárias")
+                            else:
+                                st.success("🟢 **Rota Relativamente Segura**")
+                                st.write("• Poucos registros de acidentes")
+                                st.write("• Direção defensiva recomendada")
+                            
+                            # Mostrar principais tipos de problemas encontrados
                             if pontos_risco:
-                                risco_medio = np.mean([p["risco"] for p in pontos_risco])
-                                pontos_criticos = len([p for p in pontos_risco if p["risco"] >= 0.7])
+                                tipos_acidentes = []
+                                for ponto in pontos_risco:
+                                    tipo = ponto.get('detalhes', {}).get('tipo_acidente', '')
+                                    if tipo and tipo != 'N/A':
+                                        tipos_acidentes.append(tipo)
                                 
-                                st.metric("Risco Médio da Rota", f"{risco_medio:.2f}", f"{len(pontos_risco)} pontos identificados")
-                                st.metric("Pontos Críticos", pontos_criticos)
-                                
-                                if risco_medio >= 0.7:
-                                    st.error("🔴 **Rota de Alto Risco**")
-                                    st.write("• Múltiplos acidentes registrados")
-                                    st.write("• Extrema cautela recomendada")
-                                elif risco_medio >= 0.4:
-                                    st.warning("🟡 **Rota de Risco Moderado**")
-                                    st.write("• Alguns pontos de atenção")
-                                    st.write("• Precauções básicas necessárias")
-                                else:
-                                    st.success("🟢 **Rota Relativamente Segura**")
-                                    st.write("• Poucos registros de acidentes")
-                                    st.write("• Direção defensiva recomendada")
-                                
-                                # Mostrar principais tipos de problemas encontrados
-                                if pontos_risco:
-                                    tipos_acidentes = []
-                                    for ponto in pontos_risco:
-                                        tipo = ponto.get('detalhes', {}).get('tipo_acidente', '')
-                                        if tipo and tipo != 'N/A':
-                                            tipos_acidentes.append(tipo)
-                                    
-                                    if tipos_acidentes:
-                                        st.write("**⚠️ Principais riscos identificados:**")
-                                        tipos_unicos = list(set(tipos_acidentes))[:3]  # Top 3
-                                        for tipo in tipos_unicos:
-                                            st.write(f"• {tipo}")
-                            else:
-                                st.info("📊 Nenhum ponto de risco específico identificado")
-                                st.write("• Rota com baixo histórico de acidentes")
-                                st.write("• Mantenha precauções normais de trânsito")
+                                if tipos_acidentes:
+                                    st.write("**⚠️ Principais riscos identificados:**")
+                                    tipos_unicos = list(set(tipos_acidentes))[:3]  # Top 3
+                                    for tipo in tipos_unicos:
+                                        st.write(f"• {tipo}")
                         else:
-                            st.info("📊 Análise baseada em estimativas")
-                            # Risco estimado baseado na distância
-                            risco_estimado = min(rota_dados['distancia'] / 1000, 0.8)
-                            st.metric("Risco Estimado", f"{risco_estimado:.2f}", "baseado na distância")
-                            
-                            if risco_estimado >= 0.6:
-                                st.warning("🟡 **Rota Longa** - Mais paradas recomendadas")
-                            else:
-                                st.success("🟢 **Rota Adequada**")
+                            st.info("📊 Nenhum ponto de risco específico identificado")
+                            st.write("• Rota com baixo histórico de acidentes")
+                            st.write("• Mantenha precauções normais de trânsito")
+                    else:
+                        st.info("📊 Análise baseada em estimativas")
+                        # Risco estimado baseado na distância
+                        risco_estimado = min(rota_dados['distancia'] / 1000, 0.8)
+                        st.metric("Risco Estimado", f"{risco_estimado:.2f}", "baseado na distância")
+                        
+                        if risco_estimado >= 0.6:
+                            st.warning("🟡 **Rota Longa** - Mais paradas recomendadas")
+                        else:
+                            st.success("🟢 **Rota Adequada**")
+
+                # 🔀 Rotas alternativas pontuadas ao mesmo tempo: tempo x risco, fronteira de Pareto primeiro
+                st.markdown("**🔀 Rotas Alternativas: Tempo × Risco**")
+                alternativas = analisar_alternativas(rota_dados, df_datatran, indice_espacial, cubo_risco)
+                if len(alternativas) > 1:
+                    st.dataframe(pd.DataFrame([
+                        {
+                            'Rota': 'Principal' if alternativa['alternativa'] == 0 else f"Alternativa {alternativa['alternativa']}",
+                            'Distância (km)': alternativa['distancia_km'],
+                            'Tempo': alternativa['tempo_estimado'],
+                            'Risco': round(alternativa['risco_ranking'], 2),
+                            'Pontos Críticos': alternativa['pontos_criticos'],
+                            'Risco Climático': round(alternativa.get('risco_climatico', 0.0), 2),
+                            'Pareto': '✅ Ótima' if alternativa['camada_pareto'] == 1 else f"Dominada (nível {alternativa['camada_pareto']})"
+                        }
+                        for alternativa in alternativas
+                    ]), hide_index=True, use_container_width=True)
+                    mais_rapida = min(alternativas, key=lambda alternativa: alternativa['tempo_minutos'])
+                    mais_segura = min(alternativas, key=lambda alternativa: alternativa['risco_ranking'])
+                    st.caption(
+                        f"⚡ Mais rápida: {mais_rapida['tempo_estimado']} (risco {mais_rapida['risco_ranking']:.2f}) • "
+                        f"🛡️ Mais segura: {mais_segura['tempo_estimado']} (risco {mais_segura['risco_ranking']:.2f}) • "
+                        "risco condicionado a sair agora; ótimas: nenhuma outra é mais rápida e mais segura ao mesmo tempo"
+                    )
+                else:
+                    st.info("📐 O roteador não ofereceu alternativas para este trajeto")
 
 # Footer com informações
 st.markdown("---")
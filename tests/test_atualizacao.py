@@ -0,0 +1,150 @@
+"""Atualização incremental do DataTran contra a carga completa do mesmo arquivo"""
+import csv
+import io
+import os
+import warnings
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sir import cache
+from sir.atualizacao import VersaoDataset
+
+ARQUIVO_DATATRAN = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'datatran2025.zip')
+
+ENCODING = 'cp1252'
+
+# Fração do arquivo na versão antiga (os acidentes do "mês novo" são o resto)
+FRACAO_ANTIGA = 0.7
+
+pytestmark = pytest.mark.skipif(not os.path.exists(ARQUIVO_DATATRAN), reason='datatran2025.zip ausente')
+
+
+def _gravar_zip(caminho, linhas):
+    with zipfile.ZipFile(caminho, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as arquivo:
+        arquivo.writestr('datatran2025.csv', b''.join(linhas))
+    return str(caminho)
+
+
+@pytest.fixture(scope='module')
+def arquivos(tmp_path_factory):
+    """Zips derivados do DataTran: os primeiros 70%, o arquivo inteiro e variações dele"""
+    pasta = tmp_path_factory.mktemp('datatran')
+    with zipfile.ZipFile(ARQUIVO_DATATRAN) as arquivo:
+        linhas = arquivo.read(arquivo.namelist()[0]).splitlines(keepends=True)
+    cabecalho, acidentes = linhas[0], linhas[1:]
+    antigos = int(len(acidentes) * FRACAO_ANTIGA)
+
+    # Correção da PRF: o primeiro acidente republicado com uma pessoa a mais
+    nomes = next(csv.reader([cabecalho.decode(ENCODING)], delimiter=';'))
+    campos = next(csv.reader([acidentes[0].decode(ENCODING)], delimiter=';'))
+    campos[nomes.index('pessoas')] = str(int(campos[nomes.index('pessoas')]) + 1)
+    saida = io.StringIO()
+    csv.writer(saida, delimiter=';', lineterminator='\r\n').writerow(campos)
+    corrigido = saida.getvalue().encode(ENCODING)
+
+    return {
+        'antigos': antigos,
+        'novos': len(acidentes) - antigos,
+        'id_corrigido': int(campos[nomes.index('id')]),
+        'parcial': _gravar_zip(pasta / 'parcial.zip', [cabecalho] + acidentes[:antigos]),
+        'completo': _gravar_zip(pasta / 'completo.zip', [cabecalho] + acidentes),
+        # Mesmos acidentes, bytes diferentes: republicação sem mês novo
+        'republicado': _gravar_zip(pasta / 'republicado.zip', [cabecalho] + acidentes + [b'\r\n']),
+        'corrigido': _gravar_zip(pasta / 'corrigido.zip', [cabecalho, corrigido] + acidentes[1:]),
+    }
+
+
+@pytest.fixture(scope='module')
+def versoes(arquivos, tmp_path_factory):
+    """Versão antiga (parcial), a incremental até o arquivo completo e a completa do zero.
+
+    Cada uma com seu cache: a completa não pode ler a tabela que a incremental gravou.
+    """
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(cache, 'DIRETORIO_CACHE', str(tmp_path_factory.mktemp('cache')))
+        antiga = VersaoDataset.carregar(arquivos['parcial'])
+        incremental = antiga.atualizada(arquivos['completo'])
+        monkeypatch.setattr(cache, 'DIRETORIO_CACHE', str(tmp_path_factory.mktemp('cache_completa')))
+        completa = VersaoDataset.carregar(arquivos['completo'])
+        assert completa.info['cache'] == 'miss'
+        yield antiga, incremental, completa
+
+
+@pytest.fixture
+def cache_temporario(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, 'DIRETORIO_CACHE', str(tmp_path))
+
+
+def test_incremental_acrescenta_so_os_acidentes_novos(arquivos, versoes):
+    antiga, incremental, completa = versoes
+
+    assert len(antiga.df) == arquivos['antigos']
+    assert incremental.info['acrescimo'] == arquivos['novos']
+    assert incremental.versao == completa.versao
+    pd.testing.assert_frame_equal(incremental.df, completa.df, check_categorical=False)
+
+
+def test_incremental_tem_os_agregados_da_carga_completa(versoes):
+    _, incremental, completa = versoes
+
+    for nome in ('por_segmento', 'por_municipio'):
+        pd.testing.assert_frame_equal(
+            getattr(incremental.agregados, nome).reset_index(), getattr(completa.agregados, nome).reset_index(),
+            check_dtype=False, check_categorical=False
+        )
+
+
+def test_incremental_tem_os_nucleos_e_grupos_do_dbscan_completo(versoes):
+    _, incremental, completa = versoes
+    hotspots, referencia = incremental.hotspots, completa.hotspots
+
+    np.testing.assert_array_equal(hotspots.linhas, referencia.linhas)
+    np.testing.assert_array_equal(hotspots.nucleo, referencia.nucleo)
+    assert len(hotspots) == len(referencia)
+
+    # Mesma partição dos núcleos: cada grupo incremental corresponde a exatamente um grupo completo
+    pares = pd.DataFrame({'incremental': hotspots.rotulos[hotspots.nucleo],
+                          'completo': referencia.rotulos[referencia.nucleo]}).drop_duplicates()
+    assert pares['incremental'].is_unique and pares['completo'].is_unique
+
+
+def test_incremental_responde_o_cubo_como_a_carga_completa(versoes):
+    _, incremental, completa = versoes
+    brs = completa.df['br'].value_counts().index[:5]
+
+    for br in brs:
+        for condicao in ({}, {'hora': 22, 'dia': 'sexta'}, {'hora': 'madrugada', 'clima': 'chuva'}):
+            esperado = completa.cubo.consultar(br, **condicao)
+            assert incremental.cubo.consultar(br, **condicao) == pytest.approx(esperado)
+
+
+def test_acidente_corrigido_refaz_tudo(arquivos, versoes, cache_temporario):
+    _, incremental, _ = versoes
+
+    corrigida = incremental.atualizada(arquivos['corrigido'])
+
+    assert corrigida.info['acrescimo'] is None
+    linha = corrigida.df['id'] == arquivos['id_corrigido']
+    antes = incremental.df.loc[incremental.df['id'] == arquivos['id_corrigido'], 'pessoas'].item()
+    assert corrigida.df.loc[linha, 'pessoas'].item() == antes + 1
+
+    # A carga a frio da mesma versão (do cache) também vê a correção
+    fria = VersaoDataset.carregar(arquivos['corrigido'])
+    assert fria.info['cache'] == 'hit'
+    assert fria.df.loc[fria.df['id'] == arquivos['id_corrigido'], 'pessoas'].item() == antes + 1
+
+
+def test_republicacao_sem_acidentes_novos(arquivos, versoes, cache_temporario):
+    _, incremental, _ = versoes
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        republicada = incremental.atualizada(arquivos['republicado'])
+
+    assert republicada.versao != incremental.versao
+    assert republicada.info['acrescimo'] == 0
+    assert len(republicada.df) == len(incremental.df)
+    assert republicada.hotspots is incremental.hotspots
@@ -0,0 +1,95 @@
+"""ClienteHTTP contra o ServidorStub: retentativas, disjuntor e prazo"""
+import time
+
+import pytest
+import requests
+
+from sir import cliente_http
+from sir.cliente_http import ClienteHTTP, Disjuntor, ServicoIndisponivel
+from sir.stub_servicos import ServidorStub
+
+RESFRIAMENTO_S = 0.2
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    """Cliente novo (disjuntores zerados), com espera curta entre tentativas e resfriamento curto"""
+    monkeypatch.setattr(cliente_http, 'ESPERA_BASE_S', 0.01)
+    cliente = ClienteHTTP()
+    cliente.disjuntores = {nome: Disjuntor(resfriamento_s=RESFRIAMENTO_S) for nome in cliente.servicos}
+    return cliente
+
+
+def test_retentativa_depois_de_503(cliente):
+    with ServidorStub(falhas={'osrm': 1}) as stub:
+        resposta = cliente.get('osrm', '/route/v1/driving/x', timeout=5)
+
+    assert resposta.status_code == 200
+    assert stub.chamadas['osrm'] == 2
+    assert cliente.metricas()['osrm']['retentativas'] == 1
+    assert cliente.disjuntores['osrm'].estado == 'fechado'
+
+
+def test_disjuntor_abre_e_rejeita_sem_chamar(cliente):
+    with ServidorStub(falhas={'osrm': 100}) as stub:
+        for _ in range(cliente_http.FALHAS_PARA_ABRIR):
+            assert cliente.get('osrm', '/route', timeout=5).status_code == 503
+        chamadas = stub.chamadas['osrm']
+
+        assert cliente.disjuntores['osrm'].estado == 'aberto'
+        with pytest.raises(ServicoIndisponivel):
+            cliente.get('osrm', '/route', timeout=5)
+        assert stub.chamadas['osrm'] == chamadas
+        assert cliente.metricas()['osrm']['rejeitadas'] == 1
+
+
+def test_meio_aberto_fecha_com_sucesso_e_reabre_com_falha(cliente):
+    with ServidorStub(falhas={'osrm': 100, 'graphhopper': 100}) as stub:
+        for servico in ('osrm', 'graphhopper'):
+            for _ in range(cliente_http.FALHAS_PARA_ABRIR):
+                cliente.get(servico, '/x', timeout=5)
+        time.sleep(RESFRIAMENTO_S * 1.5)
+        assert cliente.disjuntores['osrm'].estado == 'meio-aberto'
+
+        stub.falhas['osrm'] = 0
+        assert cliente.get('osrm', '/route', timeout=5).status_code == 200
+        assert cliente.disjuntores['osrm'].estado == 'fechado'
+
+        assert cliente.get('graphhopper', '/api/1/route', timeout=5).status_code == 503
+        assert cliente.disjuntores['graphhopper'].estado == 'aberto'
+
+
+def test_prazo_esgotado_nao_mexe_no_disjuntor(cliente):
+    with ServidorStub() as stub:
+        for _ in range(cliente_http.FALHAS_PARA_ABRIR + 1):
+            with pytest.raises(requests.exceptions.Timeout):
+                cliente.get('osrm', '/route', timeout=0)
+
+        assert stub.chamadas['osrm'] == 0
+        assert cliente.disjuntores['osrm'].falhas == 0
+        assert cliente.disjuntores['osrm'].estado == 'fechado'
+        assert cliente.get('osrm', '/route', timeout=5).status_code == 200
+
+
+def test_prazo_esgotado_devolve_a_sonda_do_meio_aberto(cliente):
+    with ServidorStub(falhas={'osrm': cliente_http.FALHAS_PARA_ABRIR * 2}) as stub:
+        for _ in range(cliente_http.FALHAS_PARA_ABRIR):
+            cliente.get('osrm', '/route', timeout=5)
+        time.sleep(RESFRIAMENTO_S * 1.5)
+
+        with pytest.raises(requests.exceptions.Timeout):
+            cliente.get('osrm', '/route', timeout=0)
+        assert cliente.disjuntores['osrm'].estado == 'meio-aberto'
+
+        # A sonda devolvida fica para a próxima chamada, que acha o serviço de pé
+        assert cliente.get('osrm', '/route', timeout=5).status_code == 200
+        assert cliente.disjuntores['osrm'].estado == 'fechado'
+        assert stub.chamadas['osrm'] == cliente_http.FALHAS_PARA_ABRIR * 2 + 1
+
+
+def test_servico_lento_estoura_o_prazo_e_conta_falha(cliente):
+    with ServidorStub(atrasos={'osrm': 0.5}):
+        with pytest.raises(requests.exceptions.Timeout):
+            cliente.get('osrm', '/route', timeout=0.2)
+
+    assert cliente.disjuntores['osrm'].falhas == 1